@@ -0,0 +1,266 @@
+"""
+Long-lived capture engine.
+
+Spawning ``libcamera-still`` for every shot re-opens the sensor, renegotiates
+the 4656x3496 mode and reloads tuning each time.  The engine below opens the
+camera stack once and keeps it streaming; switching cameras only means
+pushing a new set of lens / shutter / gain controls.
+
+Backends are pluggable so the engine can run without a sensor:
+    picamera2  - in-process Picamera2 (default on the Pi)
+    libcamera  - the old one-process-per-shot libcamera-still command
+    fake       - writes a placeholder JPEG, records every control update
+"""
+import base64
+import os
+import subprocess
+import threading
+import time
+
+def load_picamera2():
+    """The Picamera2 class, or None off the Pi; imported on first use since it pulls in numpy and libcamera"""
+    try:
+        from picamera2 import Picamera2
+    except ImportError:  # not on a Pi / picamera2 not installed
+        return None
+    return Picamera2
+
+
+SENSOR_SIZE = (4656, 3496)
+JPEG_QUALITY = 85
+
+# libcamera's AfModeEnum.Manual - lens stays where LensPosition puts it
+AF_MODE_MANUAL = 0
+
+# 8x8 grey JPEG written by the fake backend
+PLACEHOLDER_JPEG = base64.b64decode(
+    "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9PDkzODdASFxOQERXRTc4UG1RV19i"
+    "Z2hnPk1xeXBkeFxlZ2P/2wBDARESEhgVGC8aGi9jQjhCY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2Nj"
+    "Y2NjY2NjY2P/wAARCAAIAAgDASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUF"
+    "BAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVW"
+    "V1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi"
+    "4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAEC"
+    "AxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVm"
+    "Z2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq"
+    "8vP09fb3+Pn6/9oADAMBAAIRAxEAPwAooooA/9k="
+)
+
+
+def tuning_to_controls(preset):
+    """Translate a tuning preset into libcamera control values"""
+    return {
+        "AfMode": AF_MODE_MANUAL,
+        "LensPosition": float(preset['lens_position']),
+        "AeEnable": False,
+        "ExposureTime": int(preset['shutter']),
+        "AnalogueGain": float(preset['gain']),
+    }
+
+
+# ──────────────────────────── Backends ──────────────────────────────────────
+
+class Picamera2Backend:
+    """Keeps one Picamera2 instance configured and streaming between shots."""
+
+    name = 'picamera2'
+
+    def __init__(self, size=SENSOR_SIZE, quality=JPEG_QUALITY, settle_frames=2):
+        self.Picamera2 = load_picamera2()
+        if self.Picamera2 is None:
+            raise RuntimeError("picamera2 is not installed")
+        self.size = size
+        self.quality = quality
+        # Controls land a couple of frames after set_controls(); frames
+        # captured before that still carry the previous camera's settings.
+        self.settle_frames = settle_frames
+        self.picam2 = None
+
+    def open(self):
+        self.picam2 = self.Picamera2()
+        config = self.picam2.create_still_configuration(main={"size": self.size}, buffer_count=2)
+        self.picam2.configure(config)
+        self.picam2.options["quality"] = self.quality
+        self.picam2.start()
+
+    def apply_controls(self, controls):
+        self.picam2.set_controls(controls)
+        for _ in range(self.settle_frames):
+            self.picam2.capture_metadata()
+
+    def capture_file(self, path):
+        self.picam2.capture_file(path)
+
+    def close(self):
+        if self.picam2 is not None:
+            self.picam2.stop()
+            self.picam2.close()
+            self.picam2 = None
+
+
+class LibcameraStillBackend:
+    """Previous behaviour: one libcamera-still process per shot."""
+
+    name = 'libcamera'
+
+    def __init__(self, size=SENSOR_SIZE, quality=JPEG_QUALITY):
+        self.size = size
+        self.quality = quality
+        self.controls = {}
+
+    def open(self):
+        pass
+
+    def apply_controls(self, controls):
+        self.controls = controls
+
+    def capture_file(self, path):
+        # --immediate : skip the default 2 s preview+analysis
+        # -t 1        : one-millisecond run time (needed because -t 0 disables stills)
+        width, height = self.size
+        cmd = [
+            "libcamera-still", "-t", "1", "--immediate", "-n", "-q", str(self.quality),
+            "--mode", f"{width}:{height}:10",
+            "--autofocus-mode", "manual",
+            "--lens-position", str(self.controls.get("LensPosition", 0.0)),
+            "--shutter", str(self.controls.get("ExposureTime", 0)),
+            "--gain", str(self.controls.get("AnalogueGain", 1.0)),
+            "-o", path,
+        ]
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def close(self):
+        pass
+
+
+class FakeCameraBackend:
+    """Sensor-free backend for tests: writes a placeholder JPEG per shot."""
+
+    name = 'fake'
+
+    def __init__(self, latency=0.0, payload=PLACEHOLDER_JPEG):
+        self.latency = latency
+        self.payload = payload
+        self.is_open = False
+        self.open_count = 0
+        self.control_updates = []
+        self.captured = []
+
+    def open(self):
+        self.is_open = True
+        self.open_count += 1
+
+    def apply_controls(self, controls):
+        self.control_updates.append(dict(controls))
+
+    def capture_file(self, path):
+        if not self.is_open:
+            raise RuntimeError("fake camera is not open")
+        if self.latency:
+            time.sleep(self.latency)
+        with open(path, 'wb') as f:
+            f.write(self.payload)
+        self.captured.append(path)
+
+    def close(self):
+        self.is_open = False
+
+
+BACKENDS = {
+    'picamera2': Picamera2Backend,
+    'libcamera': LibcameraStillBackend,
+    'fake': FakeCameraBackend,
+}
+
+
+def make_backend(name=None):
+    """Build the backend named by `name` or $CAMERA_BACKEND (default picamera2)"""
+    name = name or os.environ.get('CAMERA_BACKEND', 'picamera2')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown camera backend: {name}")
+    if name == 'picamera2' and load_picamera2() is None:
+        print("picamera2 not available, falling back to libcamera-still")
+        name = 'libcamera'
+    return BACKENDS[name]()
+
+
+# ──────────────────────────── Camera mux ────────────────────────────────────
+
+class I2CMux:
+    """Arducam multi-camera adapter: selects a channel with i2cset."""
+
+    def __init__(self, bus=10, address=0x24, register=0x24):
+        self.bus = bus
+        self.address = address
+        self.register = register
+
+    def select(self, value):
+        subprocess.run(
+            ["i2cset", "-y", str(self.bus), f"{self.address:#04x}", f"{self.register:#04x}", f"{value:#04x}"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+
+# Cameras in shooting order on each Pi's adapter:
+# (camera, label, mux channel, GPIO 7/11/12 levels)
+MAIN_PI_CHANNELS = [
+    (1, 'A', 0x02, (False, False, True)),
+    (6, 'F', 0x12, (True, False, True)),
+    (7, 'G', 0x22, (False, True, False)),
+    (8, 'H', 0x32, (True, True, False)),
+]
+
+SECONDARY_PI_CHANNELS = [
+    (5, 'E', 0x02, (False, False, True)),
+    (4, 'D', 0x12, (True, False, True)),
+    (3, 'C', 0x22, (False, True, False)),
+    (2, 'B', 0x32, (True, True, False)),
+]
+
+
+# ──────────────────────────── Engine ────────────────────────────────────────
+
+class CameraEngine:
+    """Owns the camera stack for the lifetime of the process."""
+
+    def __init__(self, backend, tuning):
+        self.backend = backend
+        self.tuning = tuning
+        self._lock = threading.Lock()
+        self._started = False
+        self._active_cam = None
+
+    def start(self):
+        with self._lock:
+            self._start_locked()
+
+    def _start_locked(self):
+        if not self._started:
+            self.backend.open()
+            self._started = True
+            self._active_cam = None
+            print(f"Camera engine started ({self.backend.name} backend)")
+
+    def set_tuning(self, cam, preset):
+        """Replace `cam`'s preset; controls are re-applied on its next capture if it changed"""
+        with self._lock:
+            if self.tuning.get(cam) != preset:
+                self.tuning[cam] = preset
+                if cam == self._active_cam:
+                    self._active_cam = None
+
+    def capture(self, cam, path):
+        """Apply `cam`'s preset and write one JPEG to `path`"""
+        with self._lock:
+            self._start_locked()
+            if cam != self._active_cam:
+                self.backend.apply_controls(tuning_to_controls(self.tuning[cam]))
+                self._active_cam = cam
+            self.backend.capture_file(path)
+        return path
+
+    def close(self):
+        with self._lock:
+            if self._started:
+                self.backend.close()
+                self._started = False
+                print("Camera engine stopped")
@@ -0,0 +1,167 @@
+"""
+Camera node registry and per-step fan-out.
+
+Beyond the main Pi's own cameras, every capture node (a secondary Pi running
+capture.py) is listed in nodes.json:
+
+    {
+      "barrier_timeout": 30,
+      "nodes": [
+        {"name": "secondary",
+         "command_addr": "192.168.10.221:5003",
+         "http_url": "http://192.168.10.221:5002/capture",
+         "cameras": {"2": {"lens_position": 5.0, "shutter": 50000, "gain": 3.0}, ...}}
+      ]
+    }
+
+Each step triggers all nodes at once and waits at a barrier: the step ends
+when the last node has answered or `barrier_timeout` expires, so step time
+tracks the slowest node rather than the number of nodes.  Presets ride along
+with every trigger; the node's capture engine only re-applies controls when
+they change.
+"""
+import asyncio
+import json
+import time
+
+from command_channel import ChannelUnavailable, CommandClient, parse_address
+from scan_pipeline import StageTimer
+
+BARRIER_TIMEOUT = 30.0
+
+
+class CameraNode:
+    """One capture node, reached over the command channel with HTTP as fallback."""
+
+    def __init__(self, name, cameras=None, command_addr=None, http_url=None, timeout=BARRIER_TIMEOUT):
+        self.name = name
+        self.cameras = cameras or {}  # camera id -> preset ({} keeps the node's own)
+        self.http_url = http_url
+        self.timeout = timeout
+        self.channel = CommandClient(*parse_address(command_addr), timeout=timeout) if command_addr else None
+        # HTTP fallback session, kept open on the loop that first needed it
+        self._session = None
+        self._session_loop = None
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'cameras': sorted(self.cameras),
+            'command_addr': f"{self.channel.host}:{self.channel.port}" if self.channel else None,
+            'http_url': self.http_url,
+            'connected': bool(self.channel and self.channel.connected),
+        }
+
+    async def capture(self, step=None):
+        """Trigger the node; returns its reply ({'status', 'images', 'uploaded', 'failed', ...})"""
+        args = {'step': step, 'presets': {str(cam): preset for cam, preset in self.cameras.items() if preset}}
+        if self.channel is not None:
+            try:
+                return await asyncio.wrap_future(self.channel.request('capture', args))
+            except ChannelUnavailable as e:
+                if not self.http_url:
+                    raise
+                print(f"[{self.name}] command channel unavailable ({e}); using HTTP trigger")
+
+        async with self._http_session().post(self.http_url, json=args) as response:
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}: {await response.text()}")
+            return await response.json(content_type=None)
+
+    def _http_session(self):
+        """Keep-alive session for the HTTP trigger; a session is tied to its loop, so one per loop"""
+        import aiohttp  # only nodes without a command channel need it
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._session_loop = loop
+        return self._session
+
+    def close(self):
+        if self.channel is not None:
+            self.channel.close()
+        session, loop = self._session, self._session_loop
+        self._session = None
+        if session is not None and not session.closed and loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout=2)
+            except Exception as e:
+                print(f"[{self.name}] error closing HTTP session: {e}")
+
+
+class CameraCluster:
+    """Fans each step out to every node and waits for all of them."""
+
+    def __init__(self, nodes, barrier_timeout=BARRIER_TIMEOUT):
+        self.nodes = nodes
+        self.barrier_timeout = barrier_timeout
+        # per-node trigger-to-reply latency plus the barrier wait as a whole
+        self.timer = StageTimer()
+
+    @property
+    def cameras(self):
+        return sorted(cam for node in self.nodes for cam in node.cameras)
+
+    async def capture_step(self, step=None):
+        """
+        Trigger every node concurrently and wait at the step barrier.
+        Returns {node name: reply}; a node that failed or missed the barrier
+        gets {'status': 'error', 'message': ...}.
+        """
+        start = time.perf_counter()
+        tasks = {node.name: asyncio.create_task(self._timed_capture(node, step)) for node in self.nodes}
+        if not tasks:
+            return {}
+        _, pending = await asyncio.wait(tasks.values(), timeout=self.barrier_timeout)
+        for task in pending:
+            task.cancel()
+
+        results = {}
+        for name, task in tasks.items():
+            if task in pending:
+                results[name] = {'status': 'error', 'message': f"no reply within {self.barrier_timeout}s barrier"}
+            elif task.exception() is not None:
+                results[name] = {'status': 'error', 'message': str(task.exception()) or type(task.exception()).__name__}
+            else:
+                results[name] = task.result()
+        self.timer.record('barrier', time.perf_counter() - start)
+        return results
+
+    async def _timed_capture(self, node, step):
+        start = time.perf_counter()
+        try:
+            return await node.capture(step)
+        finally:
+            self.timer.record(node.name, time.perf_counter() - start)
+
+    def stats(self):
+        return self.timer.summary()
+
+    def to_dict(self):
+        return {
+            'barrier_timeout': self.barrier_timeout,
+            'nodes': [node.to_dict() for node in self.nodes],
+            'latency': self.stats(),
+        }
+
+    def close(self):
+        for node in self.nodes:
+            node.close()
+
+
+def load_cluster(path):
+    """Build a CameraCluster from a nodes.json file"""
+    with open(path) as f:
+        config = json.load(f)
+    barrier_timeout = config.get('barrier_timeout', BARRIER_TIMEOUT)
+    nodes = [
+        CameraNode(
+            entry['name'],
+            cameras={int(cam): preset for cam, preset in entry.get('cameras', {}).items()},
+            command_addr=entry.get('command_addr'),
+            http_url=entry.get('http_url'),
+            timeout=barrier_timeout,
+        )
+        for entry in config.get('nodes', [])
+    ]
+    return CameraCluster(nodes, barrier_timeout)
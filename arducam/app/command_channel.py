@@ -0,0 +1,251 @@
+"""
+Persistent command channel between the main and secondary Pi.
+
+Triggering the secondary Pi used to cost a new aiohttp session and TCP
+connection per step, and the reply was thrown away.  This is a small framed
+TCP protocol instead: one long-lived connection, each message a 4-byte
+big-endian length followed by a UTF-8 JSON object.
+
+    request  {"type": "request", "id": 7, "command": "capture", "args": {"step": 3}}
+    reply    {"type": "reply", "id": 7, "step": 3, "ok": true, "result": {...}}
+             {"type": "reply", "id": 7, "step": 3, "ok": false, "error": "..."}
+
+"ping" is answered by the server itself and doubles as the heartbeat.
+Requests are dispatched concurrently, so a heartbeat is answered while a
+capture is still running.
+
+CommandServer and CommandClient each run their own event loop on a daemon
+thread, so callers on any thread (or in a throwaway Flask event loop) can
+use them; `request()` returns a concurrent.futures.Future.
+"""
+import asyncio
+import itertools
+import json
+import struct
+import threading
+import time
+
+HEADER = struct.Struct('>I')
+MAX_FRAME = 16 * 1024 * 1024
+
+DEFAULT_PORT = 5003
+
+
+class CommandError(Exception):
+    """The remote side ran the command and reported a failure."""
+
+
+class ChannelUnavailable(ConnectionError):
+    """No connection to the remote side could be made."""
+
+
+def encode_frame(message):
+    data = json.dumps(message).encode('utf-8')
+    return HEADER.pack(len(data)) + data
+
+
+async def read_frame(reader):
+    (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME:
+        raise ValueError(f"frame of {length} bytes exceeds limit")
+    return json.loads(await reader.readexactly(length))
+
+
+def parse_address(addr, default_port=DEFAULT_PORT):
+    """'host:port' (or bare host) -> (host, port)"""
+    host, _, port = addr.rpartition(':') if ':' in addr else (addr, '', '')
+    return host, int(port) if port else default_port
+
+
+# ──────────────────────────── Server ────────────────────────────────────────
+
+class CommandServer:
+    """Runs `handlers[command](args) -> dict` for each request, on worker threads."""
+
+    def __init__(self, handlers, host='0.0.0.0', port=DEFAULT_PORT):
+        self.handlers = handlers
+        self.host = host
+        self.port = port
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._connections = set()
+        self._thread = None
+
+    def start(self):
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._serve, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._thread = threading.Thread(target=self._loop.run_forever, name="command-server", daemon=True)
+        self._thread.start()
+        print(f"Command channel listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        if not self._loop.is_running():
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    async def _shutdown(self):
+        self._server.close()
+        for task in self._connections:
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    async def _serve(self, reader, writer):
+        self._connections.add(asyncio.current_task())
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                message = await read_frame(reader)
+                task = asyncio.create_task(self._dispatch(message, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            self._connections.discard(asyncio.current_task())
+
+    async def _dispatch(self, message, writer, write_lock):
+        command = message.get('command')
+        args = message.get('args') or {}
+        reply = {'type': 'reply', 'id': message.get('id'), 'step': args.get('step')}
+        try:
+            if command == 'ping':
+                result = {'time': time.time()}
+            elif command in self.handlers:
+                result = await asyncio.to_thread(self.handlers[command], args)
+            else:
+                raise CommandError(f"unknown command: {command}")
+            reply.update(ok=True, result=result)
+        except Exception as e:
+            reply.update(ok=False, error=str(e))
+        async with write_lock:
+            writer.write(encode_frame(reply))
+            await writer.drain()
+
+
+# ──────────────────────────── Client ────────────────────────────────────────
+
+class CommandClient:
+    """Keeps one connection to a CommandServer open, with heartbeats and reconnects."""
+
+    def __init__(self, host, port=DEFAULT_PORT, timeout=30.0, connect_timeout=3.0,
+                 heartbeat_interval=5.0, retry_interval=30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.heartbeat_interval = heartbeat_interval
+        # after a failed connect, fail fast for this long instead of paying
+        # connect_timeout on every step
+        self.retry_interval = retry_interval
+        self.last_rtt = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._reader = None
+        self._writer = None
+        self._tasks = []
+        self._unavailable_until = 0.0
+        self._loop = asyncio.new_event_loop()
+        self._connect_lock = asyncio.Lock()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="command-client", daemon=True)
+        self._thread.start()
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    def request(self, command, args=None, timeout=None):
+        """Send `command`; the returned Future resolves to the remote result"""
+        return asyncio.run_coroutine_threadsafe(
+            self._request(command, args or {}, timeout or self.timeout), self._loop)
+
+    def call(self, command, args=None, timeout=None):
+        return self.request(command, args, timeout).result()
+
+    def close(self):
+        if not self._loop.is_running():
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    async def _shutdown(self):
+        tasks = self._tasks
+        self._drop_connection(ConnectionError("command channel closed"))
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _ensure_connected(self):
+        async with self._connect_lock:
+            if self.connected:
+                return
+            if time.monotonic() < self._unavailable_until:
+                raise ChannelUnavailable(f"{self.host}:{self.port} unavailable")
+            try:
+                self._reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.connect_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                self._unavailable_until = time.monotonic() + self.retry_interval
+                raise ChannelUnavailable(f"cannot reach {self.host}:{self.port}: {e}") from e
+            print(f"Command channel connected to {self.host}:{self.port}")
+            self._tasks = [
+                asyncio.create_task(self._read_loop(self._reader)),
+                asyncio.create_task(self._heartbeat()),
+            ]
+
+    async def _request(self, command, args, timeout):
+        await self._ensure_connected()
+        msg_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[msg_id] = future
+        try:
+            self._writer.write(encode_frame({'type': 'request', 'id': msg_id, 'command': command, 'args': args}))
+            await self._writer.drain()
+            reply = await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(msg_id, None)
+        if not reply.get('ok'):
+            raise CommandError(reply.get('error', 'remote command failed'))
+        return reply.get('result')
+
+    async def _read_loop(self, reader):
+        try:
+            while True:
+                message = await read_frame(reader)
+                future = self._pending.get(message.get('id'))
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        self._drop_connection(ConnectionError("command channel closed by remote"))
+
+    async def _heartbeat(self):
+        while self.connected:
+            await asyncio.sleep(self.heartbeat_interval)
+            start = time.perf_counter()
+            try:
+                await self._request('ping', {}, self.heartbeat_interval)
+                self.last_rtt = time.perf_counter() - start
+            except (asyncio.TimeoutError, ConnectionError, CommandError):
+                print("Command channel heartbeat missed, reconnecting on next request")
+                self._drop_connection(ConnectionError("command channel heartbeat timed out"))
+                return
+
+    def _drop_connection(self, error):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        current = asyncio.current_task(self._loop) if self._loop.is_running() else None
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+        self._tasks = []
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
@@ -0,0 +1,120 @@
+"""
+One long-lived asyncio loop for the whole app.
+
+Flask runs an `async def` view by handing it to asgiref's async_to_sync,
+which builds a fresh event loop for every request and tears it down
+afterwards - nothing async (a client session, a pending task) can outlive
+the request, and every call pays for the loop setup.  Flask documents
+`Flask.async_to_sync` as the hook for changing that; `LoopFlask`
+overrides it to run every async view on a `BackgroundLoop`:
+
+  * one loop, running forever on its own thread, started the first time
+    something needs it (importing the app starts no threads);
+  * views, scan jobs and anything else submit coroutines to it with
+    `run()` (blocking) or `submit()` (a concurrent Future);
+  * aiohttp sessions and similar loop-bound objects created while serving
+    one request are still usable by the next.
+
+The WSGI server and Socket.IO are unchanged; only where the coroutines run
+moves.  Blocking calls inside them still belong in `asyncio.to_thread`,
+since they would now stall every other coroutine on the loop.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+
+from flask import Flask
+
+
+class BackgroundLoop:
+    """An event loop running on a daemon thread until close()."""
+
+    def __init__(self, name="app-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_loop(self):
+        """True when called from the loop's own thread"""
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro, context=None):
+        """Schedule `coro` on the loop (in `context`, if given); returns a concurrent.futures.Future"""
+        future = concurrent.futures.Future()
+
+        def start():
+            if not future.set_running_or_notify_cancel():
+                coro.close()
+                return
+            task = self.loop.create_task(coro, context=context)
+            task.add_done_callback(lambda t: _settle(t, future))
+
+        self.loop.call_soon_threadsafe(start)
+        return future
+
+    def run(self, coro, timeout=None, context=None):
+        """Run `coro` on the loop and wait for its result"""
+        if self.in_loop():
+            raise RuntimeError("BackgroundLoop.run() called from the loop thread; await instead")
+        return self.submit(coro, context).result(timeout)
+
+    async def _shutdown(self):
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.loop.shutdown_asyncgens()
+        self.loop.stop()
+
+    def close(self, timeout=5):
+        if not self.loop.is_running():
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self.loop.close()
+
+
+class LoopFlask(Flask):
+    """Flask app whose async views all run on one BackgroundLoop."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._background_loop = None
+        self._background_loop_lock = threading.Lock()
+
+    @property
+    def background_loop(self):
+        """The app's BackgroundLoop, started on first use"""
+        with self._background_loop_lock:
+            if self._background_loop is None:
+                self._background_loop = BackgroundLoop()
+            return self._background_loop
+
+    def close_background_loop(self, timeout=5):
+        """Stop the loop if it was ever started"""
+        with self._background_loop_lock:
+            loop, self._background_loop = self._background_loop, None
+        if loop is not None:
+            loop.close(timeout)
+
+    def async_to_sync(self, func):
+        def run(*args, **kwargs):
+            # the view's task runs in a copy of this thread's context, so
+            # `request` and the app context still resolve on the loop thread
+            return self.background_loop.run(func(*args, **kwargs), context=contextvars.copy_context())
+        return run
+
+
+def _settle(task, future):
+    if task.cancelled():
+        future.set_exception(concurrent.futures.CancelledError())
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
@@ -0,0 +1,299 @@
+"""
+Per-camera focus calibration.
+
+multi_cameras_auto_focus.py swept the VCM from 10 to 1000 in steps of 15,
+grabbing a full frame and scoring the whole image at every position, once
+per hand-copied channel block.  Here each camera is calibrated by:
+
+  * scoring a centre ROI of a low-resolution preview frame, shrunk again
+    with INTER_AREA before the (vectorised) laplacian / sobel metric;
+  * a coarse grid over the lens range to find the peak's neighbourhood,
+    then a golden-section search inside that bracket - ~20 frames instead
+    of ~60 full-size ones;
+  * looping over every mux channel of the rig.
+
+Results go to focus_calibration.json ({camera: {"lens_position": ...}}),
+which main.py and capture.py merge into CAMERA_TUNING at startup.
+
+    python focus_calibration.py --rig main            # cameras 1, 6, 7, 8
+    python focus_calibration.py --rig secondary       # cameras 5, 4, 3, 2
+    python focus_calibration.py --synthetic           # search on synthetic focus stacks
+"""
+import argparse
+import json
+import math
+import os
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+CALIBRATION_FILE = os.environ.get(
+    'FOCUS_CALIBRATION', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'focus_calibration.json'))
+
+# LensPosition range searched, in dioptres (0 = infinity)
+LENS_MIN = 0.0
+LENS_MAX = 10.0
+
+PREVIEW_SIZE = (1280, 960)
+ROI_FRACTION = 0.5     # centre crop, fraction of width/height
+METRIC_WIDTH = 320     # ROI is shrunk to this width before scoring
+
+COARSE_STEPS = 9
+TOLERANCE = 0.05       # dioptres
+
+_INV_PHI = (math.sqrt(5) - 1) / 2
+
+
+# ──────────────────────────── Sharpness metrics ─────────────────────────────
+
+def prepare(frame, roi=ROI_FRACTION, width=METRIC_WIDTH):
+    """Grey, centre-cropped, downscaled view of `frame` for scoring"""
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2GRAY if frame.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    h, w = frame.shape
+    ch, cw = int(h * roi), int(w * roi)
+    top, left = (h - ch) // 2, (w - cw) // 2
+    crop = frame[top:top + ch, left:left + cw]
+    if cw > width:
+        crop = cv2.resize(crop, (width, int(ch * width / cw)), interpolation=cv2.INTER_AREA)
+    return crop
+
+
+def laplacian(gray):
+    return float(np.abs(cv2.Laplacian(gray, cv2.CV_32F)).mean())
+
+
+def sobel(gray):
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1)
+    return float(np.sqrt(gx * gx + gy * gy).mean())
+
+
+METRICS = {'laplacian': laplacian, 'sobel': sobel}
+
+
+# ──────────────────────────── Search ────────────────────────────────────────
+
+def find_focus(score, lo=LENS_MIN, hi=LENS_MAX, coarse_steps=COARSE_STEPS, tol=TOLERANCE):
+    """
+    Lens position in [lo, hi] maximising `score(position)`.
+    A coarse grid picks the best neighbourhood (so a secondary peak cannot
+    trap the search), then golden-section narrows it to `tol`.
+    Returns (position, score, evaluations).
+    """
+    cache = {}
+
+    def f(x):
+        x = round(x, 4)
+        if x not in cache:
+            cache[x] = score(x)
+        return cache[x]
+
+    grid = np.linspace(lo, hi, coarse_steps)
+    best = max(range(coarse_steps), key=lambda i: f(grid[i]))
+    a = grid[max(best - 1, 0)]
+    b = grid[min(best + 1, coarse_steps - 1)]
+
+    c = b - _INV_PHI * (b - a)
+    d = a + _INV_PHI * (b - a)
+    while b - a > tol:
+        if f(c) > f(d):
+            b, d = d, c
+            c = b - _INV_PHI * (b - a)
+        else:
+            a, c = c, d
+            d = a + _INV_PHI * (b - a)
+
+    position = max(cache, key=cache.get)
+    return position, cache[position], len(cache)
+
+
+# ──────────────────────────── Synthetic focus stack ─────────────────────────
+
+class SyntheticFocusStack:
+    """Renders a fixed texture blurred by its distance from `in_focus` - a stand-in camera."""
+
+    def __init__(self, in_focus, size=PREVIEW_SIZE, blur_per_dioptre=2.5, noise=2.0, seed=0):
+        rng = np.random.default_rng(seed)
+        w, h = size
+        # blocky texture with edges at several scales
+        base = rng.integers(0, 255, (h // 8, w // 8), dtype=np.uint8)
+        self.texture = cv2.resize(base, (w, h), interpolation=cv2.INTER_NEAREST)
+        self.in_focus = in_focus
+        self.blur_per_dioptre = blur_per_dioptre
+        self.noise = noise
+        self.rng = rng
+        self.position = LENS_MIN
+
+    def set_lens(self, position):
+        self.position = position
+
+    def frame(self):
+        sigma = abs(self.position - self.in_focus) * self.blur_per_dioptre
+        img = cv2.GaussianBlur(self.texture, (0, 0), sigma) if sigma > 0.05 else self.texture
+        if self.noise:
+            img = np.clip(img + self.rng.normal(0, self.noise, img.shape), 0, 255).astype(np.uint8)
+        return img
+
+
+# ──────────────────────────── Camera ────────────────────────────────────────
+
+class PreviewCamera:
+    """Picamera2 in a small preview mode with manual lens control."""
+
+    def __init__(self, size=PREVIEW_SIZE, settle_frames=2):
+        from picamera2 import Picamera2
+        from camera_engine import AF_MODE_MANUAL
+        self.picam2 = Picamera2()
+        self.picam2.configure(self.picam2.create_preview_configuration(main={"size": size}))
+        self.picam2.set_controls({"AfMode": AF_MODE_MANUAL})
+        self.picam2.start()
+        self.settle_frames = settle_frames
+
+    def set_lens(self, position):
+        self.picam2.set_controls({"LensPosition": float(position)})
+        # the lens moves over the next couple of frames
+        for _ in range(self.settle_frames):
+            self.picam2.capture_metadata()
+
+    def frame(self):
+        return self.picam2.capture_array("main")
+
+    def close(self):
+        self.picam2.stop()
+        self.picam2.close()
+
+
+def calibrate_camera(camera, metric='laplacian', **search):
+    """Focus search on one camera; returns the calibration record"""
+    measure = METRICS[metric]
+
+    def score(position):
+        camera.set_lens(position)
+        return measure(prepare(camera.frame()))
+
+    start = time.perf_counter()
+    position, value, evaluations = find_focus(score, **search)
+    camera.set_lens(position)
+    return {
+        'lens_position': round(float(position), 3),
+        'score': round(value, 3),
+        'metric': metric,
+        'frames': evaluations,
+        'seconds': round(time.perf_counter() - start, 2),
+        'calibrated_at': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+# ──────────────────────────── Calibration file ──────────────────────────────
+
+def load_calibration(path=CALIBRATION_FILE):
+    """{camera: lens_position} from the calibration file ({} if there is none)"""
+    try:
+        with open(path) as f:
+            return {int(cam): entry['lens_position'] for cam, entry in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring focus calibration {path}: {e}")
+        return {}
+
+
+def load_scores(path=CALIBRATION_FILE, metric='laplacian'):
+    """{camera: in-focus sharpness} from calibration records scored with `metric`"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Ignoring focus calibration {path}: {e}")
+        return {}
+    return {int(cam): entry['score'] for cam, entry in data.items()
+            if entry.get('metric') == metric and entry.get('score')}
+
+
+def save_calibration(results, path=CALIBRATION_FILE):
+    """Merge {camera: record} into the calibration file"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        data = {}
+    data.update({str(cam): record for cam, record in results.items()})
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def apply_calibration(tuning, calibration):
+    """Copy of `tuning` with calibrated lens positions swapped in"""
+    return {
+        cam: dict(preset, lens_position=calibration[cam]) if cam in calibration else preset
+        for cam, preset in tuning.items()
+    }
+
+
+# ──────────────────────────── CLI ───────────────────────────────────────────
+
+def calibrate_rig(channels, metric='laplacian', path=CALIBRATION_FILE):
+    """Calibrate every (camera, label, mux channel, GPIO levels) in `channels`"""
+    import RPi.GPIO as gp
+    from camera_engine import I2CMux
+
+    gp.setwarnings(False)
+    gp.setmode(gp.BOARD)
+    for pin in (7, 11, 12):
+        gp.setup(pin, gp.OUT)
+    mux = I2CMux()
+    camera = PreviewCamera()
+    results = {}
+    try:
+        for cam, label, channel, (pin7, pin11, pin12) in channels:
+            mux.select(channel)
+            gp.output(7, pin7)
+            gp.output(11, pin11)
+            gp.output(12, pin12)
+            results[cam] = calibrate_camera(camera, metric)
+            print(f"Camera {cam} ({label}): lens {results[cam]['lens_position']} "
+                  f"in {results[cam]['frames']} frames, {results[cam]['seconds']} s")
+    finally:
+        camera.close()
+    save_calibration(results, path)
+    print(f"Saved {len(results)} cameras to {path}")
+    return results
+
+
+def synthetic_check(trials=8, metric='laplacian'):
+    """Run the search against synthetic stacks with known focus positions"""
+    rng = np.random.default_rng(1)
+    worst = 0.0
+    for trial in range(trials):
+        truth = float(rng.uniform(LENS_MIN + 0.5, LENS_MAX - 0.5))
+        record = calibrate_camera(SyntheticFocusStack(truth, seed=trial), metric)
+        error = abs(record['lens_position'] - truth)
+        worst = max(worst, error)
+        print(f"truth {truth:6.3f}  found {record['lens_position']:6.3f}  error {error:.3f}  "
+              f"frames {record['frames']}  {record['seconds']} s")
+    print(f"worst error {worst:.3f} dioptres")
+    return worst
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-camera focus calibration")
+    parser.add_argument('--rig', choices=['main', 'secondary'], help='calibrate this Pi\'s cameras')
+    parser.add_argument('--metric', choices=sorted(METRICS), default='laplacian')
+    parser.add_argument('--output', default=CALIBRATION_FILE, help='calibration file to update')
+    parser.add_argument('--synthetic', action='store_true', help='check the search on synthetic focus stacks')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        synthetic_check(metric=args.metric)
+    elif args.rig:
+        from camera_engine import MAIN_PI_CHANNELS, SECONDARY_PI_CHANNELS
+        calibrate_rig(MAIN_PI_CHANNELS if args.rig == 'main' else SECONDARY_PI_CHANNELS, args.metric, args.output)
+    else:
+        parser.error("give --rig or --synthetic")
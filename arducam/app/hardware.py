@@ -0,0 +1,162 @@
+"""
+Hardware arbiter.
+
+The stepper, the camera-select pins and the I2C mux used to be driven
+straight from whichever thread needed them - the scan loop, the reset
+thread, /rotateOneStep, /rotateAndRecord, /capture - with nothing stopping
+two of them from interleaving, and the buzzer slept through its pattern on
+the caller's thread (1.8 s at the end of every scan).  Here:
+
+  * one worker thread owns the motor, the mux and the camera-select pins
+    and runs every command on them from a priority queue (camera selects
+    ahead of motion, motion ahead of housekeeping; FIFO within a level);
+  * activities that must not overlap (scan, reset, recording, a manual
+    step or capture) take an exclusive lease first - a second one is
+    refused with HardwareBusy instead of fighting over the pins, or (a
+    queued scan) waits a bounded time for the holder to finish;
+  * the buzzer is played by its own thread from a pattern queue, so
+    `buzz()` returns at once.
+
+The gpio / mux / motor objects are passed in, so the same arbiter runs on
+FakeGPIO and the simulated mux off the Pi.
+"""
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# command priorities, lowest first
+CAMERA = 0
+MOTION = 1
+HOUSEKEEPING = 2
+
+BEEP_ON = 0.5
+BEEP_OFF = 0.1
+
+# how often a waiting acquire() re-checks should_stop
+LEASE_POLL = 0.2
+
+
+class HardwareBusy(RuntimeError):
+    """Another activity holds the hardware."""
+
+
+class HardwareArbiter:
+    """Single owner of the carousel motor, camera mux, select pins and buzzer."""
+
+    def __init__(self, gpio, motor, mux, buzzer_pin, select_pins=(7, 11, 12)):
+        self.gpio = gpio
+        self.motor = motor
+        self.mux = mux
+        self.buzzer_pin = buzzer_pin
+        self.select_pins = select_pins
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lease = threading.Condition()
+        self.owner = None
+        self._patterns = queue.Queue()
+        self._closed = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="hardware", daemon=True)
+        self._buzzer = threading.Thread(target=self._play, name="buzzer", daemon=True)
+        self._worker.start()
+        self._buzzer.start()
+
+    def acquire(self, owner, wait=0, should_stop=None):
+        """
+        Take the hardware for `owner` ('scan', 'reset', ...). If someone has
+        it, wait up to `wait` seconds for it to be released (giving up early
+        once `should_stop()` is true), then raise HardwareBusy.
+        """
+        deadline = time.monotonic() + wait
+        with self._lease:
+            while self.owner is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (should_stop is not None and should_stop()):
+                    raise HardwareBusy(f"{self.owner} in progress")
+                self._lease.wait(min(remaining, LEASE_POLL))
+            self.owner = owner
+
+    def release(self, owner):
+        with self._lease:
+            if self.owner == owner:
+                self.owner = None
+                self._lease.notify_all()
+
+    @contextmanager
+    def lease(self, owner):
+        """`with arbiter.lease('scan'):` - acquire() / release() around a block"""
+        self.acquire(owner)
+        try:
+            yield self
+        finally:
+            self.release(owner)
+
+    def submit(self, fn, priority=HOUSEKEEPING):
+        """Run `fn()` on the hardware thread; returns a Future"""
+        if self._closed.is_set():
+            raise RuntimeError("hardware arbiter is closed")
+        future = Future()
+        self._queue.put((priority, next(self._seq), fn, future))
+        return future
+
+    def call(self, fn, priority=HOUSEKEEPING):
+        """submit() and wait for the result"""
+        return self.submit(fn, priority).result()
+
+    def select_camera(self, channel, pins):
+        """Switch the mux to `channel` and set the select pins to `pins`"""
+        def select():
+            self.mux.select(channel)
+            for pin, level in zip(self.select_pins, pins):
+                self.gpio.output(pin, level)
+        self.call(select, CAMERA)
+
+    def move(self, steps, direction, profile=None, on_step=None, should_stop=None):
+        """Carousel move (see StepperMotor.move); returns pulses issued"""
+        return self.call(lambda: self.motor.move(steps, direction, profile, on_step, should_stop), MOTION)
+
+    def jog(self, direction, should_stop, profile=None, on_step=None):
+        """Carousel jog (see StepperMotor.jog); returns pulses issued"""
+        return self.call(lambda: self.motor.jog(direction, should_stop, profile, on_step), MOTION)
+
+    def _run(self):
+        while True:
+            priority, _, fn, future = self._queue.get()
+            if fn is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+
+    def buzz(self, count=1, on=BEEP_ON, off=BEEP_OFF):
+        """Queue `count` beeps; returns immediately"""
+        self._patterns.put([(on, off)] * count)
+
+    def _play(self):
+        while not self._closed.is_set():
+            try:
+                pattern = self._patterns.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            for on, off in pattern:
+                self.gpio.output(self.buzzer_pin, self.gpio.HIGH)
+                self._closed.wait(on)
+                self.gpio.output(self.buzzer_pin, self.gpio.LOW)
+                if self._closed.wait(off):
+                    return
+
+    def stats(self):
+        return {'owner': self.owner, 'queued_commands': self._queue.qsize(),
+                'queued_patterns': self._patterns.qsize()}
+
+    def close(self):
+        self._closed.set()
+        self._queue.put((HOUSEKEEPING + 1, next(self._seq), None, None))
+        self._worker.join(2)
+        self._buzzer.join(2)
+
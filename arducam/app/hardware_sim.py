@@ -0,0 +1,275 @@
+"""
+Simulated rig hardware for running a scan on an ordinary Linux box.
+
+main.py swaps these in when ARDUCAM_SIMULATE=1:
+    gpio           FakeGPIO (records pin changes; stepper timing is real)
+    index sensor   SimCarousel: follows the step/direction pins and raises
+                   the sensor input while the carousel is over its flag
+    mux            FakeI2CMux in place of i2cset
+    camera backend SimCameraBackend: full-size synthetic JPEGs with a
+                   per-shot latency; BLUR_RATE of them come out blurred
+    video          video_options(): a fake libcamera-vid streaming filler
+                   frames (and --save-pts timestamps) at the real frame
+                   rate, a muxer that just stores the stream, and frame
+                   extraction that writes synthetic JPEGs
+and StubRemotePi serves the secondary Pi's POST /capture and the "capture"
+command of its command channel, "shooting" its four cameras and streaming
+each one to the main Pi's /upload like capture.py.
+
+Latencies are module constants so a benchmark can tune them before the
+app is imported.
+"""
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import cv2
+import numpy as np
+
+from camera_engine import FakeCameraBackend
+from command_channel import CommandServer
+from motion import FakeGPIO
+
+# Picamera2 full-resolution still, sensor already streaming
+CAPTURE_LATENCY = 0.35
+# i2cset fork + adapter switch
+MUX_LATENCY = 0.01
+# typical 4656x3496 q85 JPEG
+JPEG_BYTES = 4_000_000
+
+# fraction of simulated shots that come out blurred (quality gate retakes)
+BLUR_RATE = 0.0
+
+REMOTE_CAMERAS = [5, 4, 3, 2]
+
+# H.264 bytes per simulated video frame (1080p30 at ~10 Mbit/s)
+VIDEO_FRAME_BYTES = 40_000
+
+
+def synthetic_jpeg(size=None, blurred=False):
+    """
+    Textured 640x480 JPEG padded after EOI to `size` bytes (decoders ignore
+    the tail), so the quality gate has real edges to score.
+    """
+    size = JPEG_BYTES if size is None else size
+    blocks = np.random.default_rng(0).integers(40, 215, (60, 80), dtype=np.uint8)
+    img = cv2.resize(blocks, (640, 480), interpolation=cv2.INTER_NEAREST)
+    if blurred:
+        img = cv2.GaussianBlur(img, (0, 0), 8)
+    data = cv2.imencode('.jpg', img)[1].tobytes()
+    return data + b'\0' * max(0, size - len(data))
+
+
+class FakeI2CMux:
+    """Records channel selections instead of calling i2cset."""
+
+    def __init__(self, latency=None):
+        self.latency = MUX_LATENCY if latency is None else latency
+        self.selected = []
+
+    def select(self, value):
+        time.sleep(self.latency)
+        self.selected.append(value)
+
+
+class SimCameraBackend(FakeCameraBackend):
+    """Fake camera with realistic shot latency and file size."""
+
+    name = 'sim'
+
+    def __init__(self, latency=None, size=None):
+        self.sharp = synthetic_jpeg(size)
+        self.blurred = synthetic_jpeg(size, blurred=True)
+        super().__init__(latency=CAPTURE_LATENCY if latency is None else latency, payload=self.sharp)
+
+    def capture_file(self, path):
+        self.payload = self.blurred if random.random() < BLUR_RATE else self.sharp
+        super().capture_file(path)
+
+
+gpio = FakeGPIO()
+mux = FakeI2CMux()
+
+
+def camera_backend():
+    return SimCameraBackend()
+
+
+# ──────────────────────────── Index sensor ──────────────────────────────────
+
+# the carousel powers up this many pulses (direction 0) past the sensor flag
+SENSOR_START = 3000
+# pulses the flag covers
+SENSOR_WIDTH = 40
+
+
+class SimCarousel:
+    """Carousel position from the pulses on the driver pins, driving the index sensor input."""
+
+    def __init__(self, gpio, sensor_pin, pulse_pin, direction_pin, steps_per_rev, position=None, width=None):
+        self.gpio = gpio
+        self.sensor_pin = sensor_pin
+        self.pulse_pin = pulse_pin
+        self.direction_pin = direction_pin
+        self.steps_per_rev = steps_per_rev
+        self.position = SENSOR_START if position is None else position
+        self.width = SENSOR_WIDTH if width is None else width
+        gpio.watch(self._on_output)
+        self._update()
+
+    def _on_output(self, pin, value):
+        if pin != self.pulse_pin or not value:
+            return
+        # direction LOW counts up, as step_counter does
+        self.position += -1 if self.gpio.input(self.direction_pin) else 1
+        self._update()
+
+    def _update(self):
+        self.gpio.set_input(self.sensor_pin, self.position % self.steps_per_rev < self.width)
+
+
+# ──────────────────────────── Video ─────────────────────────────────────────
+
+_FAKE_VIDEO = """
+import signal, sys, time
+framerate, frame_bytes, pts_path = float(sys.argv[1]), int(sys.argv[2]), sys.argv[3]
+signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+pts = open(pts_path, 'w') if pts_path else None
+if pts:
+    pts.write('# timecode format v2\\n')
+start = time.perf_counter()
+n = 0
+while True:
+    sys.stdout.buffer.write(b'\\0' * frame_bytes)
+    sys.stdout.flush()
+    if pts:
+        pts.write('%.3f\\n' % ((time.perf_counter() - start) * 1000))
+        pts.flush()
+    n += 1
+    time.sleep(max(0.0, start + n / framerate - time.perf_counter()))
+"""
+
+
+def fake_camera_command(framerate=30, pts_path=None, **_):
+    return [sys.executable, '-c', _FAKE_VIDEO, str(framerate), str(VIDEO_FRAME_BYTES), pts_path or '']
+
+
+def fake_muxer_command(path, framerate=30):
+    return [sys.executable, '-c', 'import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[1], "wb"))',
+            path]
+
+
+def fake_extract_frames(video, frames, paths):
+    data = synthetic_jpeg()
+    for path in paths:
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+def video_options():
+    """VideoRecorder keyword arguments for the simulated camera"""
+    return {'camera_cmd': fake_camera_command, 'muxer_cmd': fake_muxer_command, 'extractor': fake_extract_frames}
+
+
+# ──────────────────────────── Stub secondary Pi ─────────────────────────────
+
+class StubRemotePi:
+    """HTTP + command-channel stand-in for capture.py on the secondary Pi."""
+
+    def __init__(self, upload_url, host='127.0.0.1', port=0, cameras=None, capture_latency=None):
+        self.upload_url = upload_url
+        self.cameras = cameras or REMOTE_CAMERAS
+        self.capture_latency = CAPTURE_LATENCY if capture_latency is None else capture_latency
+        self.payload = synthetic_jpeg()
+        self.session = requests.Session()
+        self.uploader = ThreadPoolExecutor(max_workers=1)
+        self.request_times = []
+        self.presets = {}  # last preset received per camera
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.commands = CommandServer({'capture': self._capture_command}, host=host, port=0)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/capture"
+
+    @property
+    def command_addr(self):
+        return f"{self.commands.host}:{self.commands.port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != '/capture':
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get('Content-Length') or 0)
+                args = json.loads(self.rfile.read(length) or b'{}')
+                stub.presets.update(args.get('presets') or {})
+                start = time.perf_counter()
+                try:
+                    names = stub.capture_and_upload()
+                    body, status = {'status': 'success', 'images': names}, 200
+                except Exception as e:
+                    body, status = {'status': 'error', 'message': str(e)}, 500
+                stub.request_times.append(time.perf_counter() - start)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        return Handler
+
+    def _capture_command(self, args):
+        self.presets.update(args.get('presets') or {})
+        start = time.perf_counter()
+        try:
+            names = self.capture_and_upload()
+        finally:
+            self.request_times.append(time.perf_counter() - start)
+        return {'status': 'success', 'step': args.get('step'), 'images': names,
+                'uploaded': names, 'failed': []}
+
+    def capture_and_upload(self):
+        # like capture.py: each file is uploaded while the next one is shot
+        names, uploads = [], []
+        for cam in self.cameras:
+            time.sleep(MUX_LATENCY + self.capture_latency)
+            now = datetime.now()
+            name = f"cam{cam}_{now:%Y%m%d_%H%M%S}_{now.microsecond // 1000:03d}.jpg"
+            names.append(name)
+            uploads.append(self.uploader.submit(self.upload, name))
+        for future in uploads:
+            future.result()
+        return names
+
+    def upload(self, name):
+        response = self.session.put(f"{self.upload_url}/{name}", data=self.payload,
+                                    headers={"Content-Type": "image/jpeg"})
+        response.raise_for_status()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        self.commands.start()
+        return self
+
+    def stop(self):
+        self.commands.stop()
+        self.server.shutdown()
+        self.server.server_close()
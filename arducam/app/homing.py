@@ -0,0 +1,100 @@
+"""
+Carousel homing on the index sensor.
+
+The sensor on pin 15 was set up as an input and never read: a "reset"
+jogged the carousel until someone pressed stop, decrementing step_counter
+all the way, so a scan started wherever the operator happened to let go.
+`home()` finds the sensor itself:
+
+  1. fast approach - jog towards the sensor at full speed until GPIO edge
+     detection reports its rising edge; the motor then ramps down, ending
+     some pulses past the edge;
+  2. back off - reverse over that overshoot plus a margin (a bounded move,
+     so at full speed), leaving the carousel just short of the sensor;
+  3. slow re-approach - creep forward at a constant low speed (no ramp, so
+     the motor stops on the pulse after the edge) and call that zero.
+
+The edge callback only sets an Event, which the motion loop checks between
+pulses, so pulse timing is untouched.  A carousel already on the sensor
+skips the fast approach.  Moves go through the hardware arbiter, so the
+caller holds its lease.
+"""
+import threading
+import time
+
+from motion import MotionProfile
+
+FAST_PROFILE = MotionProfile(max_velocity=1500, acceleration=5000, start_velocity=400)
+# start == max: constant speed, nothing to ramp down
+SLOW_PROFILE = MotionProfile(max_velocity=100, acceleration=1000, start_velocity=100)
+# pulses short of the edge the slow approach starts from
+BACKOFF_MARGIN = 100
+# pulses to search before giving up - a revolution and a bit
+MAX_SEARCH = 26000
+
+
+class HomingError(RuntimeError):
+    """The sensor was not found or did not clear, or homing was stopped."""
+
+
+def _approach(hardware, edge, direction, profile, should_stop, max_steps):
+    """Jog until the edge; returns (pulses issued, pulses issued before the edge was seen)"""
+    pulses = 0
+    seen_at = None
+
+    def on_step():
+        nonlocal pulses, seen_at
+        pulses += 1
+        if seen_at is None and edge.is_set():
+            seen_at = pulses
+
+    hardware.jog(direction, lambda: edge.is_set() or pulses >= max_steps or should_stop(),
+                 profile=profile, on_step=on_step)
+    if seen_at is None and edge.is_set():
+        seen_at = pulses  # seen while the last pulse was going out
+    if seen_at is None:
+        if should_stop():
+            raise HomingError("homing stopped")
+        raise HomingError(f"sensor not seen within {max_steps} steps")
+    return pulses, seen_at
+
+
+def home(hardware, sensor_pin, direction=1, should_stop=None, max_search=MAX_SEARCH):
+    """
+    Home the carousel, approaching the sensor in `direction`. Returns a
+    report; `position` is how many pulses past the sensor edge it stopped.
+    """
+    gpio = hardware.gpio
+    should_stop = should_stop or (lambda: False)
+    edge = threading.Event()
+    started = time.perf_counter()
+    report = {'direction': direction, 'fast_steps': 0, 'backoff_steps': 0}
+    gpio.add_event_detect(sensor_pin, gpio.RISING, callback=lambda channel: edge.set())
+    try:
+        if gpio.input(sensor_pin):
+            print("Homing: already on the sensor, backing off")
+            overshoot = 0
+        else:
+            pulses, seen_at = _approach(hardware, edge, direction, FAST_PROFILE, should_stop, max_search)
+            report['fast_steps'] = pulses
+            overshoot = pulses - seen_at
+
+        reverse = 1 - direction
+        report['backoff_steps'] = hardware.move(overshoot + BACKOFF_MARGIN, reverse, profile=FAST_PROFILE)
+        if gpio.input(sensor_pin):
+            # past the far side of the sensor, or sitting on a wide one: back off until clear
+            cleared = hardware.jog(reverse, lambda: not gpio.input(sensor_pin) or should_stop(),
+                                   profile=SLOW_PROFILE)
+            if gpio.input(sensor_pin):
+                raise HomingError("homing stopped" if should_stop() else "sensor did not clear")
+            report['backoff_steps'] += cleared + hardware.move(BACKOFF_MARGIN, reverse, profile=SLOW_PROFILE)
+
+        edge.clear()
+        pulses, seen_at = _approach(hardware, edge, direction, SLOW_PROFILE, should_stop,
+                                    report['backoff_steps'] + BACKOFF_MARGIN)
+        report['slow_steps'] = pulses
+        report['position'] = pulses - seen_at
+    finally:
+        gpio.remove_event_detect(sensor_pin)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
@@ -0,0 +1,104 @@
+"""
+In-memory index of the captures directory.
+
+/diagnostics_data used to list IMAGE_DIR, scan the listing once per camera
+and stat every file on each 3 s poll, competing with the scan for SD-card
+I/O.  The index is built once at startup and then kept current by the
+code paths that add or remove images, so reads are O(1).
+
+Scan images that go straight to the USB stick (ingested uploads, staged
+captures) never land in the directory; they are counted as delivered, so
+the per-camera totals still cover the whole scan.
+"""
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from itertools import islice
+
+_CAM_RE = re.compile(r'^cam(\d+)_')
+PREVIEW_SUFFIX = '_preview.jpg'
+
+
+def camera_of(name):
+    """Camera number from a cam{n}_... filename, or None"""
+    m = _CAM_RE.match(name)
+    return int(m.group(1)) if m else None
+
+
+def is_preview(name):
+    """The quarter-resolution copy kept for a scan image that went straight to USB"""
+    return name.endswith(PREVIEW_SUFFIX)
+
+
+class ImageIndex:
+    """Per-camera counters plus the images in arrival order, for the most recent ones."""
+
+    def __init__(self, recent=8):
+        self._lock = threading.Lock()
+        self._order = OrderedDict()  # name -> None, oldest first
+        self._counts = Counter()
+        self._delivered = Counter()  # camera -> scan images written only to USB
+        self._recent = recent
+
+    def rebuild(self, directory):
+        """One full scan of `directory`; oldest first so the order ends on the newest"""
+        try:
+            images = [f for f in os.listdir(directory) if f.endswith('.jpg')]
+            images.sort(key=lambda f: os.path.getmtime(os.path.join(directory, f)))
+        except OSError as e:
+            print(f"Error building image index: {e}")
+            images = []
+        with self._lock:
+            self._order.clear()
+            self._counts.clear()
+            for name in images:
+                self._add_locked(name)
+
+    def _add_locked(self, name):
+        if name in self._order:
+            # overwritten in place - just move it to the newest end
+            self._order.move_to_end(name)
+            return
+        self._order[name] = None
+        # a preview stands in for an image already counted on the stick
+        if not is_preview(name):
+            self._counts[camera_of(name)] += 1
+
+    def add(self, name):
+        if not name.endswith('.jpg'):
+            return
+        with self._lock:
+            self._add_locked(name)
+
+    def add_delivered(self, name):
+        """Count a scan image that reached the stick without a copy in the directory"""
+        if not name.endswith('.jpg') or is_preview(name):
+            return
+        with self._lock:
+            self._delivered[camera_of(name)] += 1
+
+    def remove(self, name):
+        with self._lock:
+            if self._order.pop(name, False) is False:
+                return
+            if not is_preview(name):
+                self._counts[camera_of(name)] -= 1
+
+    def clear(self):
+        with self._lock:
+            self._order.clear()
+            self._counts.clear()
+            self._delivered.clear()
+
+    def __len__(self):
+        return len(self._order)
+
+    def counts(self, cameras):
+        with self._lock:
+            return {f'cam{cam}': self._counts.get(cam, 0) + self._delivered.get(cam, 0) for cam in cameras}
+
+    def latest(self):
+        """Most recent images, newest first - still `recent` of them after removals"""
+        with self._lock:
+            return list(islice(reversed(self._order), self._recent))
@@ -1,32 +1,51 @@
-from flask import Flask, jsonify, request, render_template
-from picamera2 import Picamera2
 import time
+IMPORT_STARTED = time.perf_counter()
+
+from flask import jsonify, request, render_template, send_file
 from datetime import datetime
-import RPi.GPIO as gp
 import os
-import cv2
-from ctypes import CDLL
 import shutil
-import glob
-import subprocess
-import requests
 import asyncio
-import aiohttp
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO
 import threading
 import re
-
-app = Flask(__name__)
+import json
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from camera_engine import CameraEngine, I2CMux, MAIN_PI_CHANNELS, make_backend
+from scan_pipeline import ScanPipeline, StageTimer
+from motion import MotionProfile, StepperMotor, StepTimeline
+from image_index import ImageIndex, camera_of
+from usb_transfer import BulkCopier
+from scan_archive import ScanArchive
+from staging import StagingRing
+from video_recorder import FRAME_LATENCY, STOP_TIMEOUT, VideoRecorder, nearest_frame, read_pts
+from scan_jobs import ScanJobQueue
+from hardware import HardwareArbiter, HardwareBusy
+from homing import HomingError, home
+from scan_manifest import ScanManifest, copy_entry, copy_with_hash, new_hasher, reconcile
+from cluster import CameraCluster, CameraNode, load_cluster
+from event_loop import LoopFlask
+
+# Importing this module touches no hardware and leaves out the heavy
+# imports (cv2, picamera2, RPi.GPIO): init_rig() does both, started by
+# create_app() or by the first request that needs the rig.
+
+# ARDUCAM_SIMULATE=1 swaps GPIO, the camera mux and the sensor for the
+# simulated parts in hardware_sim.py (see bench_scan.py)
+SIMULATE = os.environ.get('ARDUCAM_SIMULATE') == '1'
+gp = None  # RPi.GPIO, or hardware_sim.gpio when simulating
+
+# async views (and scan jobs) all run on one persistent event loop, so
+# client sessions and tasks outlive the request that created them
+app = LoopFlask(__name__)
+atexit.register(app.close_background_loop)
 socketio = SocketIO(app, async_mode="threading")  # Ensure async mode
 
-gp.setwarnings(False)
-gp.setmode(gp.BOARD)
-
 buzzer = 18
 
 #sensor
 sensor_pin = 15
-gp.setup(sensor_pin,gp.IN, pull_up_down=gp.PUD_DOWN)
 
 # stepper/driver
 direction_pin   = 38
@@ -38,34 +57,128 @@ steps           = 375 #prev 480
 metal_detected_count = 1  # Global counter
 step_counter = 0
 
-gp.setup(direction_pin, gp.OUT)
-gp.setup(pulse_pin, gp.OUT)
-gp.output(direction_pin,cw_direction)
-gp.setup(buzzer, gp.OUT)
-
-# camera - might not be needed?  TODO: test removal
-gp.setup(7, gp.OUT)
-gp.setup(11, gp.OUT)
-gp.setup(12, gp.OUT)
-
-if not os.path.exists('static/captures'):
-    os.makedirs('static/captures')
-
-IMAGE_DIR = os.path.join(app.static_folder, 'captures')
-
-REMOTE_PI_URL = "http://192.168.10.221:5002/capture"
+# /rotateAndRecord: camera -> fragmented-MP4 muxer pipeline, built by init_rig()
+video_recorder = None
+
+# trapezoidal move limits (steps/s, steps/s^2); the old sleep loop topped out below 500 steps/s
+CAROUSEL_PROFILE = MotionProfile(max_velocity=1500, acceleration=5000, start_velocity=400)
+# recording wants a steady, slow sweep - same ~500 steps/s the video was tuned for
+RECORD_PROFILE = MotionProfile(max_velocity=500, acceleration=2000, start_velocity=200)
+# continuous scans turn at a constant 400 steps/s while recording: about a minute per revolution
+CONTINUOUS_PROFILE = MotionProfile(max_velocity=400, acceleration=2000, start_velocity=200)
+# a full carousel revolution - the default /rotate, 64 positions of `steps`
+STEPS_PER_REVOLUTION = 64 * steps
+carousel_motor = None
+
+# homing approaches the sensor turning ccw, the way the old reset unwound
+HOMING_DIRECTION = ccw_direction
+# the rig has the index sensor wired: scans home first and /resetCarousel
+# homes.  INDEX_SENSOR=0 on a rig without one scans from where the carousel
+# stands and resets by jogging until /stopReset (both overridable per request)
+INDEX_SENSOR = os.environ.get('INDEX_SENSOR', '1') == '1'
+carousel_homed = False  # step_counter counts from the sensor edge
+last_home = None  # report of the last homing
+
+IMAGE_DIR = os.environ.get('ARDUCAM_IMAGE_DIR', os.path.join(app.static_folder, 'captures'))
+
+# dashboard thumbnails, rendered in the background as images arrive
+THUMBNAIL_DIR = os.environ.get('THUMBNAIL_DIR', os.path.join(os.path.dirname(IMAGE_DIR), 'thumbnails'))
+thumbnail_cache = None
+
+# per-camera counts + latest 8 for /diagnostics_data; one scan at startup,
+# then kept current by capture(), /upload and the delete paths
+image_index = ImageIndex(recent=8)
+
+REMOTE_PI_URL = os.environ.get('REMOTE_PI_URL', "http://192.168.10.221:5002/capture")
+REMOTE_COMMAND_ADDR = os.environ.get('REMOTE_COMMAND_ADDR', "192.168.10.221:5003")
+
+# Capture nodes triggered alongside the local cameras every step. Without a
+# nodes.json the rig is the single secondary Pi at the addresses above.
+NODES_CONFIG = os.environ.get('NODES_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nodes.json'))
+camera_cluster = None
+
+# per-camera lens / exposure presets, applied as control updates by the engine;
+# init_rig() swaps in the lens positions found by focus_calibration.py
+CAMERA_TUNING = {
+    1: {'lens_position': 6.0, 'shutter': 50000, 'gain': 2.5},
+    6: {'lens_position': 6.5, 'shutter': 50000, 'gain': 3.0},
+    7: {'lens_position': 5.0, 'shutter': 50000, 'gain': 3.0},
+    8: {'lens_position': 5.5, 'shutter': 50000, 'gain': 3.0},
+}
+
+# Opened lazily on the first capture and kept open across scan steps
+camera_engine = None
+camera_mux = None
+
+# Motor, mux, camera-select pins and buzzer are only driven through this;
+# scans, resets, recordings and manual steps/captures each take its lease
+hardware = None
+# seconds a scan job that comes up while a manual step, capture, reset or
+# recording holds the lease waits for it before failing
+SCAN_LEASE_WAIT = 60.0
+
+# main Pi cameras in shooting order: (camera, label, mux channel, GPIO 7/11/12 levels)
+CAMERA_CHANNELS = MAIN_PI_CHANNELS
+
+# Each local frame is scored while the next camera shoots; a camera whose
+# frame fails is reshot before the carousel moves on
+quality_gate = None
+MAX_RETAKES = 1
 
 # Global variable to track current scan folder
 current_scan_folder = None
+
+# Per-scan manifests (what each scan's USB folder should hold), kept on the Pi
+MANIFEST_DIR = os.environ.get('MANIFEST_DIR', os.path.join(os.path.dirname(IMAGE_DIR), 'manifests'))
+scan_manifest = None
+
+# /rotate output_mode: 'files' (one JPEG per image) or 'tar' (one store-only
+# archive per scan, see scan_archive.py)
+OUTPUT_MODES = ('files', 'tar')
+# /rotate mode: 'still' (stop and shoot every camera at each position) or
+# 'continuous' (record video through one constant-speed turn per camera and
+# pull a still out for each angle)
+SCAN_MODES = ('still', 'continuous')
+scan_archive = None
 scan_in_progress = False
 
+# Optional RAM staging (see staging.py): with STAGING_DIR on a tmpfs, a
+# scan's images wait there for the USB writer instead of on the SD card,
+# and the scan loop stalls before the budget is exceeded
+STAGING_DIR = os.environ.get('STAGING_DIR')
+STAGING_BUDGET = int(os.environ.get('STAGING_BUDGET_MB', '256')) * 1024 * 1024
+staging = None       # built by init_rig() when STAGING_DIR is set
+scan_staging = None  # `staging` while a scan is capturing
+
+# Files received on /upload that no scan step has claimed yet
+uploaded_images = []
+uploaded_images_lock = threading.Lock()
+
+# /upload/<name> bodies are copied to disk in chunks of this size, so a
+# 12MP image never has to sit fully in memory
+UPLOAD_CHUNK = 1024 * 1024
+# During a scan /upload/<name> writes straight into the scan folder on the
+# stick; keep a quarter-resolution copy on the Pi for the dashboard
+INGEST_PREVIEWS = True
+preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+
+# /download_images: kernel-side copies on a small pool, batched fsync
+usb_copier = BulkCopier()
+
 # NEW ── carousel reset state ────────────────────────────────────────────────
 reset_in_progress: bool = False  # True while reset thread is running
 stop_reset_flag: bool = False    # Signal for the reset thread to stop
 reset_thread: threading.Thread | None = None
 
+def publish(event, **data):
+    """Push a rig event to every connected page (replaces status polling)"""
+    socketio.emit(event, data, namespace='/')
+
 def get_usb_mounts():
     """Get list of mounted USB drives"""
+    # explicit override, e.g. a plain directory standing in for the stick
+    if os.environ.get('USB_MOUNTS'):
+        return os.environ['USB_MOUNTS'].split(os.pathsep)
     try:
         user = os.getlogin()
         usb_path = f'/media/{user}'
@@ -117,40 +230,160 @@ def get_latest_images(count=8):
         print(f"Error getting latest images: {e}")
         return []
 
-async def transfer_latest_images_to_usb(usb_path):
-    """Transfer latest captured images to USB folder"""
+def take_uploaded_images():
+    """Return (and forget) the files /upload has saved since the last call"""
+    with uploaded_images_lock:
+        images = list(uploaded_images)
+        uploaded_images.clear()
+    return images
+
+def split_late_uploads(uploads, replies):
+    """
+    (this step's, late) uploads, going by the files each node's reply lists.
+    A node that missed the barrier sends no list, so what it uploads after
+    its deadline shows up in a later step unlisted.
+    """
+    listed = set()
+    for reply in replies.values():
+        if reply.get('status') == 'success' and 'images' not in reply:
+            return list(uploads), []  # a node that does not list its files: keep everything
+        listed.update(os.path.basename(name) for name in reply.get('images') or [])
+    return [n for n in uploads if n in listed], [n for n in uploads if n not in listed]
+
+def image_path(name, staging_ring=None):
+    """Where an image lives: its RAM-staged copy if it has one, else IMAGE_DIR"""
+    staged = staging_ring.locate(name) if staging_ring is not None else None
+    return staged or os.path.join(IMAGE_DIR, name)
+
+def spill_staged(staging_ring, names):
+    """Move staged images the USB writer could not deliver onto the SD card"""
+    spilled = staging_ring.spill(names)
+    for name in spilled:
+        image_index.add(name)
+        thumbnail_cache.prefetch(os.path.join(IMAGE_DIR, name), name)
+    if spilled:
+        print(f"Spilled {len(spilled)} staged images to {IMAGE_DIR}")
+    return spilled
+
+def release_staged(staging_ring, name):
+    """A staged image is on the stick: count it, keep a dashboard preview, then free its RAM"""
+    image_index.add_delivered(name)
+    if not INGEST_PREVIEWS:
+        staging_ring.release(name)
+        return
+    def preview_then_release():
+        try:
+            save_preview(staging_ring.path(name), name)
+        finally:
+            staging_ring.release(name)
+    preview_executor.submit(preview_then_release)
+
+def transfer_step_images_to_usb(usb_path, images, step=None, manifest=None, staging_ring=None):
+    """Transfer one scan step's images to USB folder, plus any earlier ones the manifest still owes"""
     try:
+        if manifest is not None:
+            for img in images:
+                src_path = image_path(img, staging_ring)
+                if os.path.exists(src_path):
+                    st = os.stat(src_path)
+                    # a staged image's source is where a spill would put it
+                    manifest.record(img, st.st_size, st.st_mtime, source=os.path.join(IMAGE_DIR, img), step=step)
+
         # Check if USB is still mounted
         if not os.path.exists(usb_path):
             print(f"USB path no longer exists: {usb_path}")
-            return 0
-        
-        # Get latest images (last 8 images - 4 from each Pi)
-        latest_images = get_latest_images(8)
-        
+            if staging_ring is not None:
+                spill_staged(staging_ring, images)
+            if manifest is not None:
+                manifest.save()  # these stay pending until the stick is back
+            raise RuntimeError(f"USB path no longer exists: {usb_path}")
+
+        # images a step could not deliver while the stick was out go first
+        backlog = [img for img in manifest.pending() if img not in images] if manifest is not None else []
+        if backlog:
+            print(f"Catching up {len(backlog)} images that missed the USB stick")
+
         transferred_count = 0
-        for img in latest_images:
-            src_path = os.path.join(IMAGE_DIR, img)
-            dest_path = os.path.join(usb_path, img)
-            
-            if os.path.exists(src_path):
-                try:
-                    # Check if file already exists on USB (avoid duplicates)
-                    if not os.path.exists(dest_path):
-                        shutil.copy2(src_path, dest_path)
-                        transferred_count += 1
-                        print(f"Transferred: {img}")
-                    else:
-                        print(f"File already exists on USB: {img}")
-                except Exception as e:
-                    print(f"Error transferring {img}: {e}")
-                    continue
-        
+        bytes_written = 0
+        delivered = set()
+        failed = {}
+        for img in backlog + images:
+            src_path = image_path(img, staging_ring)
+            if not os.path.exists(src_path):
+                continue
+            try:
+                # written as <img>.part, flushed, then renamed - a yanked stick
+                # never leaves a truncated file under the real name
+                if manifest is not None:
+                    bytes_written += copy_entry(manifest, img, usb_path, src=src_path)
+                else:
+                    bytes_written += copy_with_hash(src_path, os.path.join(usb_path, img))[0]
+                transferred_count += 1
+                print(f"Transferred: {img}")
+                delivered.add(img)
+                if staging_ring is not None and img in staging_ring:
+                    release_staged(staging_ring, img)
+            except Exception as e:
+                print(f"Error transferring {img}: {e}")
+                failed[img] = str(e)
+                continue
+
+        # a failed copy must not pin the image in RAM
+        if staging_ring is not None:
+            spill_staged(staging_ring, [img for img in images if img not in delivered])
+        if manifest is not None:
+            manifest.save()
         print(f"Transferred {transferred_count} images to USB folder: {usb_path}")
+        publish('usb_written', step=step, files=transferred_count, bytes=bytes_written)
+        if failed:
+            img, message = next(iter(failed.items()))
+            raise RuntimeError(f"{len(failed)} images not written to USB ({img}: {message})")
         return transferred_count
     except Exception as e:
         print(f"Error transferring images to USB: {e}")
-        return 0
+        if staging_ring is not None:
+            spill_staged(staging_ring, images)
+        raise
+
+@app.route('/sync_scan', methods=['POST'])
+def sync_scan():
+    """Bring a scan's USB folder back in line with its manifest (after a re-plug or an interrupted scan)"""
+    data = request.get_json() or {}
+    folder_name = data.get('folder_name')
+    if not folder_name or not isValidFolderName(folder_name):
+        return jsonify({'status': 'error', 'message': 'Invalid folder name. Use only letters, numbers, and underscores.'})
+    if scan_in_progress:
+        return jsonify({'status': 'error', 'message': 'Scan in progress'})
+    manifest_path = os.path.join(MANIFEST_DIR, f"{folder_name}.json")
+    if not os.path.exists(manifest_path):
+        return jsonify({'status': 'error', 'message': f'No manifest for scan {folder_name}'})
+    try:
+        scan_folder = validate_and_prepare_usb(folder_name)
+        report = reconcile(ScanManifest(manifest_path, folder_name), scan_folder, verify=bool(data.get('verify')))
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    # no step: a re-sync covers the whole scan
+    publish('usb_written', files=len(report['copied']) + len(report['recopied']), bytes=report['bytes'])
+    return jsonify({'status': 'success', 'scan_folder': scan_folder, 'report': report})
+
+def archive_step_images(archive, images, step=None, staging_ring=None):
+    """Append one scan step's images to the scan archive on USB"""
+    try:
+        paths = [image_path(img, staging_ring) for img in images]
+        paths = [path for path in paths if os.path.exists(path)]
+        size = archive.add_step(step, paths)
+        print(f"Archived {len(paths)} images ({size} bytes) to {archive.path}")
+        publish('usb_written', step=step, files=len(paths), bytes=size)
+        if staging_ring is not None:
+            for img in images:
+                if img in staging_ring:
+                    release_staged(staging_ring, img)
+        return len(paths)
+    except Exception as e:
+        print(f"Error archiving images to USB: {e}")
+        if staging_ring is not None:
+            spill_staged(staging_ring, images)
+        raise RuntimeError(f"USB archive write failed: {e}") from e
 
 @app.route('/check_usb', methods=['GET'])
 def check_usb():
@@ -204,10 +437,14 @@ def create_scan_folder():
 def scan_status():
     """Get current scan status"""
     global scan_in_progress, current_scan_folder, step_counter
+    current = scan_jobs.current
     return jsonify({
         'scan_in_progress': scan_in_progress,
         'current_scan_folder': current_scan_folder,
-        'step_counter': step_counter
+        'step_counter': step_counter,
+        'homed': carousel_homed,
+        'job': current.to_dict() if current else None,
+        'queued': sum(1 for job in scan_jobs.jobs() if job.state == 'queued'),
     })
 
 @app.route("/")
@@ -215,115 +452,607 @@ def index():
     user = {'username': 'JackO'}
     return render_template('index.html', title='Arducam', user=user)
  
-@app.route('/rotate', methods=['POST'])
-async def rotate_carousel():
+def scan_params(data):
+    """Validated job parameters from a scan request, or (None, error message)"""
+    folder_name = data.get('folder_name')
+    output_mode = data.get('output_mode', 'files')
+    mode = data.get('mode', 'still')
+    if not folder_name:
+        return None, 'Folder name is required'
+    if not isValidFolderName(folder_name):
+        return None, 'Invalid folder name. Use only letters, numbers, and underscores.'
+    if output_mode not in OUTPUT_MODES:
+        return None, f'Unknown output_mode {output_mode!r}; use one of {list(OUTPUT_MODES)}'
+    if mode not in SCAN_MODES:
+        return None, f'Unknown mode {mode!r}; use one of {list(SCAN_MODES)}'
+    params = {
+        'folder_name': folder_name,
+        'step_counter_limit': int(data.get('step_counter_limit', 24000)),
+        'output_mode': output_mode,
+        'mode': mode,
+        'home': bool(data.get('home', INDEX_SENSOR)),
+    }
+    if mode == 'continuous':
+        local = [entry[0] for entry in CAMERA_CHANNELS]
+        cameras = data.get('cameras') or local[:1]
+        if not isinstance(cameras, list) or any(cam not in local for cam in cameras):
+            return None, f'cameras must be a list of main Pi cameras {local}'
+        angles = int(data.get('angles', 64))
+        if angles < 1:
+            return None, 'angles must be at least 1'
+        params.update(cameras=cameras, angles=angles)
+    return params, None
+
+def open_scan_output(folder_name, output_mode):
+    """Scan folder on USB plus its archive (tar mode) or manifest (files mode)"""
+    try:
+        scan_folder = validate_and_prepare_usb(folder_name)
+        archive = manifest = None
+        if output_mode == 'tar':
+            # the archive carries its own index; there are no per-file copies to reconcile
+            archive = ScanArchive.for_scan(scan_folder, folder_name)
+        else:
+            manifest = ScanManifest.for_scan(MANIFEST_DIR, folder_name)
+    except Exception as e:
+        raise RuntimeError(f'USB setup failed: {str(e)}')
+    print(f"Scan folder created: {scan_folder}")
+    return scan_folder, archive, manifest
+
+async def home_for_scan(job):
+    """Home before the scan if the job asks to; the caller holds the 'scan' lease"""
+    if not job.params.get('home'):
+        return None
+    try:
+        return await asyncio.to_thread(home_carousel, HOMING_DIRECTION, lambda: job.cancel_requested)
+    except Exception as e:
+        raise RuntimeError(f'Homing failed: {e} (start with {{"home": false}} to scan from where the carousel is)')
+
+async def capture_scan(job):
+    """
+    Capture phase of a scan job: rotate and shoot every step, queueing each
+    step's images to the USB stage. Returns finish(), which drains the USB
+    stage and builds the result on the post-processing thread while the
+    next job captures.
+    """
     global metal_detected_count
     global step_counter
     global current_scan_folder
     global scan_in_progress
-    
-    try:
-        if scan_in_progress:
-            return jsonify({'status': 'error', 'message': 'Scan already in progress'})
-        
-        scan_in_progress = True
-        step_counter = 0
+    global scan_manifest
+    global scan_archive
+    global scan_staging
 
-        data = request.get_json()
-        step_counter_limit = data.get('step_counter_limit', 24000)
-        folder_name = data.get('folder_name')
-        
-        print(f"Step counter limit: {step_counter_limit}")
-        print(f"Folder name: {folder_name}")
+    folder_name = job.params['folder_name']
+    step_counter_limit = job.params['step_counter_limit']
+    output_mode = job.params['output_mode']
+    print(f"Scan job {job.id}: folder {folder_name}, step counter limit {step_counter_limit}")
 
-        # Validate folder name
-        if not folder_name:
-            return jsonify({'status': 'error', 'message': 'Folder name is required'})
-        
-        if not isValidFolderName(folder_name):
-            return jsonify({'status': 'error', 'message': 'Invalid folder name. Use only letters, numbers, and underscores.'})
+    # waits out a manual step / capture (or a short reset); HardwareBusy after SCAN_LEASE_WAIT
+    await asyncio.to_thread(hardware.acquire, 'scan', SCAN_LEASE_WAIT, lambda: job.cancel_requested)
 
-        # Validate USB and create scan folder
-        try:
-            scan_folder = validate_and_prepare_usb(folder_name)
-            current_scan_folder = scan_folder
-            print(f"Scan folder created: {scan_folder}")
-        except Exception as e:
-            scan_in_progress = False
-            return jsonify({'status': 'error', 'message': f'USB setup failed: {str(e)}'})
-
-        metal_detected_count = 1
-        filenames = []
-        print('Rotating and capturing with USB transfer...')
+    # Home, then validate USB and create scan folder
+    try:
+        home_report = await home_for_scan(job)
+        # USB write test, makedirs and manifest load: off the shared event loop
+        scan_folder, archive, manifest = await asyncio.to_thread(open_scan_output, folder_name, output_mode)
+    except Exception:
+        hardware.release('scan')
+        raise
+
+    current_scan_folder = scan_folder
+    scan_manifest = manifest
+    scan_archive = archive
+    scan_staging = staging_ring = staging
+    scan_in_progress = True
+    if home_report is None:
+        step_counter = 0  # not homed: count from wherever the carousel stands
+    metal_detected_count = 1
+    filenames = []
+    print('Rotating and capturing with USB transfer...')
+
+    # USB writes run on the pipeline's own thread so the copy of step N
+    # overlaps the rotation to, and capture of, step N+1.
+    timer = StageTimer()
+    if archive is not None:
+        usb_stage = lambda step, images: archive_step_images(archive, images, step, staging_ring)
+    else:
+        usb_stage = lambda step, images: transfer_step_images_to_usb(scan_folder, images, step, manifest, staging_ring)
+    pipeline = ScanPipeline(
+        [('usb', usb_stage)],
+        timer=timer,
+    )
+    usb_errors = []
+
+    def collect_usb_errors():
+        # the USB stage keeps going after a failed step; the scan reports it
+        for failure in pipeline.take_errors():
+            usb_errors.append(failure)
+            publish('scan_error', step=failure['step'], message=f"USB write failed: {failure['message']}")
+    scan_started = time.perf_counter()
+    steps_done = 0
+    remote_errors = []
+    quality_retakes = []
+    error = None
+    total_scan_steps = -(-step_counter_limit // steps)
+    # uploads from before the scan are not part of it
+    take_uploaded_images()
+    late_step = None  # last step a node missed the barrier of
+    job.update(steps_done=0, total_steps=total_scan_steps, step_counter=0, scan_folder=scan_folder)
+    publish('scan_status', scan_in_progress=True, current_scan_folder=scan_folder, step_counter=step_counter,
+            job_id=job.id)
 
-        try:
-            while step_counter < step_counter_limit:
-                print(f"Step {step_counter + 1} of {step_counter_limit}")
-                
-                # Run both capture tasks concurrently
-                capture_task = asyncio.create_task(capture_images())
-                remote_capture_task = asyncio.create_task(trigger_capture_on_remote())
+    try:
+        # counted in positions: after homing, step_counter starts a pulse or so off zero
+        while steps_done < total_scan_steps:
+            # cancellation is honoured between steps, never mid-capture
+            if job.cancel_requested:
+                print(f"Scan job {job.id} cancelled after {steps_done} steps")
+                break
+            print(f"Step {steps_done + 1} of {total_scan_steps} (step counter {step_counter})")
+
+            # Hold RAM for this step's images; waits while the USB writer is behind
+            if staging_ring is not None:
+                step_bytes = (len(CAMERA_CHANNELS) + len(camera_cluster.cameras)) * staging_ring.image_estimate()
+                with timer.measure('staging_wait'):
+                    if not await asyncio.to_thread(staging_ring.reserve, step_bytes, lambda: job.cancel_requested):
+                        continue
+            publish('scan_step', phase='started', step=steps_done, total_steps=total_scan_steps,
+                    step_counter=step_counter, step_counter_limit=step_counter_limit, job_id=job.id)
+
+            local_images = []
+
+            # Run both capture tasks concurrently
+            with timer.measure('capture'):
+                capture_task = asyncio.create_task(capture_local_images(local_images, quality_retakes))
+                remote_capture_task = asyncio.create_task(camera_cluster.capture_step(steps_done))
 
                 # Wait for both tasks to complete
-                await asyncio.gather(capture_task, remote_capture_task)
+                local_result, remote_results = await asyncio.gather(capture_task, remote_capture_task, return_exceptions=True)
+                if isinstance(local_result, Exception):
+                    print(f"Local capture failed: {local_result}")
+                    publish('scan_error', step=steps_done, message=f"Local capture failed: {local_result}")
+                if isinstance(remote_results, Exception):
+                    remote_results = {'cluster': {'status': 'error', 'message': str(remote_results)}}
+                for node, result in remote_results.items():
+                    if result.get('status') != 'success':
+                        detail = result.get('message') or f"upload failed for {result.get('failed')}"
+                        print(f"Remote capture on {node} failed: {detail}")
+                        remote_errors.append({'step': steps_done, 'node': node, 'message': detail})
+                        publish('scan_error', step=steps_done, message=f"Remote capture on {node} failed: {detail}")
+            if staging_ring is not None:
+                staging_ring.unreserve()
+
+            # Nodes upload before answering, so the inbox holds this step's
+            # remote files - plus any a node that missed an earlier barrier
+            # sent late, which go out with the step they were shot for.
+            remote_images, late_images = split_late_uploads(take_uploaded_images(), remote_results)
+            if any(result.get('status') != 'success' and not result.get('images') for result in remote_results.values()):
+                late_step = steps_done
+            if late_images and late_step is not None and late_step < steps_done:
+                print(f"{len(late_images)} late uploads belong to step {late_step}")
+                filenames.extend(late_images)
+                await asyncio.to_thread(pipeline.submit, late_step, late_images)
+            else:
+                remote_images += late_images
+            step_images = local_images + remote_images
+            filenames.extend(step_images)
+
+            # Hand this step's images to the USB stage (blocks while the stage is behind)
+            await asyncio.to_thread(pipeline.submit, steps_done, step_images)
+            collect_usb_errors()
+
+            # After the capture is complete, rotate the carousel
+            with timer.measure('rotate'):
+                await asyncio.to_thread(advance_carousel)
+            publish('scan_step', phase='finished', step=steps_done, total_steps=total_scan_steps,
+                    step_counter=step_counter, step_counter_limit=step_counter_limit, images=step_images,
+                    job_id=job.id)
+            publish('diagnostics_update', **diagnostics_snapshot())
+            steps_done += 1
+            job.update(steps_done=steps_done, step_counter=step_counter)
+
+        # stragglers from the last step, if they made it before the scan ends
+        late_images = take_uploaded_images()
+        if late_images and steps_done:
+            late_step = steps_done - 1 if late_step is None else late_step
+            print(f"{len(late_images)} late uploads belong to step {late_step}")
+            filenames.extend(late_images)
+            await asyncio.to_thread(pipeline.submit, late_step, late_images)
+    except Exception as e:
+        error = f'Scan interrupted: {str(e)}'
+        print(f"Error during scan: {str(e)}")
+        publish('scan_error', step=steps_done, message=error)
+    finally:
+        hardware.release('scan')
+        # later uploads belong to the next job, or to no scan at all
+        scan_in_progress = False
+        scan_manifest = None
+        scan_archive = None
+        scan_staging = None
+        if staging_ring is not None:
+            staging_ring.unreserve()
+        publish('scan_status', scan_in_progress=False, current_scan_folder=current_scan_folder,
+                step_counter=step_counter, job_id=job.id)
+    capture_seconds = time.perf_counter() - scan_started
+
+    def finish():
+        try:
+            with timer.measure('usb_drain'):
+                pipeline.close()
+            collect_usb_errors()
+            # one stat per file; only files that are missing or changed get read
+            sync_report = None
+            if archive is not None:
+                with timer.measure('usb_close'):
+                    archive.close()
+            elif os.path.isdir(scan_folder):
+                with timer.measure('usb_reconcile'):
+                    sync_report = reconcile(manifest, scan_folder)
+        finally:
+            # a scan stopped early still leaves a readable archive
+            if archive is not None:
+                try:
+                    archive.close()
+                except Exception as e:
+                    print(f"Error closing scan archive: {e}")
+            hardware.buzz(3)
+        if error:
+            raise RuntimeError(error)
+        return {
+            'images': filenames,
+            'scan_folder': scan_folder,
+            'steps': steps_done,
+            'seconds_per_step': round(capture_seconds / steps_done, 3) if steps_done else 0,
+            'timings': timer.summary(),
+            'remote_errors': remote_errors,
+            'usb_errors': usb_errors,
+            'node_latency': camera_cluster.stats(),
+            'quality_retakes': quality_retakes,
+            'sync': sync_report,
+            'output_mode': output_mode,
+            'archive': archive.stats() if archive is not None else None,
+            'staging': staging_ring.stats() if staging_ring is not None else None,
+            'home': home_report,
+        }
+
+    return finish
+
+# ──────────────────────────── Continuous scan ───────────────────────────────
+
+async def capture_continuous_scan(job):
+    """
+    Capture phase of a continuous scan: for each camera, one constant-speed
+    turn while it records video, with the time of every motor pulse logged.
+    Returns finish(), which pulls the frame nearest each requested angle out
+    of each video and writes them to the scan folder like a still scan.
+    """
+    global step_counter
+    global current_scan_folder
+    global scan_in_progress
+    global scan_manifest
+    global scan_archive
 
-                # Transfer images to USB immediately after capture
-                if current_scan_folder:
-                    transferred_count = await transfer_latest_images_to_usb(current_scan_folder)
-                    print(f"Transferred {transferred_count} images to USB")
+    folder_name = job.params['folder_name']
+    turn_steps = job.params['step_counter_limit']
+    output_mode = job.params['output_mode']
+    cameras = job.params['cameras']
+    angles = job.params['angles']
+    print(f"Continuous scan job {job.id}: folder {folder_name}, cameras {cameras}, {angles} angles over {turn_steps} steps")
 
-                # After the capture is complete, rotate the carousel
-                rotate_carousel_one_step()
+    await asyncio.to_thread(hardware.acquire, 'scan', SCAN_LEASE_WAIT, lambda: job.cancel_requested)
+    try:
+        home_report = await home_for_scan(job)
+        # USB write test, makedirs and manifest load: off the shared event loop
+        scan_folder, archive, manifest = await asyncio.to_thread(open_scan_output, folder_name, output_mode)
+    except Exception:
+        hardware.release('scan')
+        raise
+
+    current_scan_folder = scan_folder
+    scan_manifest = manifest
+    scan_archive = archive
+    scan_in_progress = True
+    if home_report is None:
+        step_counter = 0
+    channels = {entry[0]: entry for entry in CAMERA_CHANNELS}
+    timer = StageTimer()
+    turns = []
+    error = None
+    scan_started = time.perf_counter()
+    job.update(steps_done=0, total_steps=len(cameras), step_counter=0, scan_folder=scan_folder)
+    publish('scan_status', scan_in_progress=True, current_scan_folder=scan_folder, step_counter=step_counter,
+            job_id=job.id)
 
-            return jsonify({'status': 'success', 'images': filenames, 'scan_folder': current_scan_folder})
-        except Exception as e:
-            print(f"Error during scan: {str(e)}")
-            return jsonify({'status': 'error', 'message': f'Scan interrupted: {str(e)}'})
+    try:
+        for cam in cameras:
+            if job.cancel_requested:
+                print(f"Scan job {job.id} cancelled after {len(turns)} turns")
+                break
+            _, label, channel, pins = channels[cam]
+            await asyncio.to_thread(hardware.select_camera, channel, pins)
+            video = os.path.join(IMAGE_DIR, f"video_cam{cam}_{file_timestamp()}.mp4")
+            recording = video_recorder.start(video, lens_position=CAMERA_TUNING.get(cam, {}).get('lens_position'),
+                                             pts_path=video[:-len('.mp4')] + '.pts')
+            try:
+                # the turn starts once frames are flowing, so the video covers all of it
+                with timer.measure('camera_start'):
+                    if not await asyncio.to_thread(recording.wait_streaming):
+                        raise RuntimeError(f"Camera {label} did not start streaming")
+                timeline = StepTimeline()
+                # steps this turn starts off its nominal position (the homed offset)
+                offset = step_counter - len(turns) * turn_steps
+                with timer.measure('turn'):
+                    moved = await asyncio.to_thread(hardware.move, turn_steps, 0, CONTINUOUS_PROFILE,
+                                                    timeline.on_step, lambda: job.cancel_requested)
+            finally:
+                recording.stop()
+            step_counter += moved
+            turns.append((cam, recording, timeline, offset))
+            print(f"Camera {label}: recorded {moved} steps to {video}")
+            publish('scan_step', phase='finished', step=len(turns) - 1, total_steps=len(cameras),
+                    step_counter=step_counter, step_counter_limit=turn_steps * len(cameras), job_id=job.id)
+            job.update(steps_done=len(turns), step_counter=step_counter)
     except Exception as e:
-        print(f"Error occurred: {str(e)}")
-        return jsonify({'status': 'error', 'message': str(e)})
+        error = f'Scan interrupted: {str(e)}'
+        print(f"Error during continuous scan: {str(e)}")
+        publish('scan_error', step=len(turns), message=error)
     finally:
+        hardware.release('scan')
         scan_in_progress = False
-        sound_buzzer(3)
+        scan_manifest = None
+        scan_archive = None
+        publish('scan_status', scan_in_progress=False, current_scan_folder=current_scan_folder,
+                step_counter=step_counter, job_id=job.id)
+    capture_seconds = time.perf_counter() - scan_started
+
+    def finish():
+        # angle index -> images, the continuous scan's counterpart of a step
+        step_images = {}
+        frames = []
+        usb_errors = []
+        sync_report = None
+        try:
+            for cam, recording, timeline, offset in turns:
+                result = recording.wait(STOP_TIMEOUT)
+                if result is None or not result['ok']:
+                    raise RuntimeError(f"Camera {cam} video not saved: {result['error'] if result else 'muxer did not finish'}")
+                with timer.measure('extract'):
+                    picks = extract_angles(cam, recording, timeline, angles, turn_steps, offset)
+                for pick in picks:
+                    step_images.setdefault(pick['step'], []).append(pick['image'])
+                frames.extend(picks)
+            for step in sorted(step_images):
+                with timer.measure('usb'):
+                    try:
+                        if archive is not None:
+                            archive_step_images(archive, step_images[step], step)
+                        else:
+                            transfer_step_images_to_usb(scan_folder, step_images[step], step, manifest)
+                    except Exception as e:
+                        usb_errors.append({'stage': 'usb', 'step': step, 'message': str(e)})
+                        publish('scan_error', step=step, message=f"USB write failed: {e}")
+            write_angles(scan_folder, folder_name, frames)
+            if archive is not None:
+                with timer.measure('usb_close'):
+                    archive.close()
+            elif os.path.isdir(scan_folder):
+                with timer.measure('usb_reconcile'):
+                    sync_report = reconcile(manifest, scan_folder)
+        finally:
+            if archive is not None:
+                try:
+                    archive.close()
+                except Exception as e:
+                    print(f"Error closing scan archive: {e}")
+            hardware.buzz(3)
+        if error:
+            raise RuntimeError(error)
+        return {
+            'mode': 'continuous',
+            'images': [pick['image'] for pick in frames],
+            'frames': frames,
+            'videos': [recording.path for _, recording, _, _ in turns],
+            'scan_folder': scan_folder,
+            'steps': len(step_images),
+            'seconds_per_step': round(capture_seconds / len(step_images), 3) if step_images else 0,
+            'capture_s': round(capture_seconds, 3),
+            'timings': timer.summary(),
+            'remote_errors': [],
+            'usb_errors': usb_errors,
+            'node_latency': {},
+            'quality_retakes': [],
+            'sync': sync_report,
+            'output_mode': output_mode,
+            'archive': archive.stats() if archive is not None else None,
+            'home': home_report,
+        }
+
+    return finish
+
+def extract_angles(cam, recording, timeline, angles, turn_steps, offset=0):
+    """
+    Write the frame nearest each of `angles` evenly spaced positions of a
+    recorded turn into IMAGE_DIR as cam{n}_{timestamp}_{ms}.jpg; returns one
+    entry per image with its angle from the turn's nominal start, which is
+    `offset` steps before where the turn actually started.
+    """
+    frame_times = read_pts(recording.pts_path) if os.path.exists(recording.pts_path) else []
+    if not frame_times:
+        raise RuntimeError(f"No frame timestamps for {recording.path}")
+    # perf_counter time frame 0 was exposed
+    video_start = recording.first_frame_at - FRAME_LATENCY
+    wall_offset = time.time() - time.perf_counter()
+    picks = []
+    for k in range(angles):
+        target = max(0, round(k * turn_steps / angles) - offset)
+        if target > len(timeline.times):
+            break  # the turn was cut short before this angle
+        frame = nearest_frame(frame_times, timeline.time_at(target) - video_start)
+        shot_at = video_start + frame_times[frame]
+        at = datetime.fromtimestamp(shot_at + wall_offset)
+        picks.append({
+            'step': k,
+            'camera': cam,
+            'image': f"cam{cam}_{file_timestamp(at)}.jpg",
+            'frame': frame,
+            'angle': round((timeline.step_at(shot_at) + offset) * 360.0 / STEPS_PER_REVOLUTION, 2),
+        })
+    paths = [os.path.join(IMAGE_DIR, pick['image']) for pick in picks]
+    if picks:
+        video_recorder.extract(recording.path, [pick['frame'] for pick in picks], paths)
+    for pick, path in zip(picks, paths):
+        image_index.add(pick['image'])
+        thumbnail_cache.prefetch(path, pick['image'])
+        announce_image(pick['image'])
+    return picks
+
+def write_angles(scan_folder, folder_name, frames):
+    """angles.json in the scan folder: each image's camera, video frame and angle"""
+    try:
+        with open(os.path.join(scan_folder, 'angles.json'), 'w') as f:
+            json.dump({'scan': folder_name, 'images': {pick['image']: pick for pick in frames}}, f, indent=1)
+    except OSError as e:
+        print(f"Error writing angles.json: {e}")
+
+def run_scan_job(job):
+    capture = capture_continuous_scan if job.params.get('mode') == 'continuous' else capture_scan
+    return app.background_loop.run(capture(job))
+
+def job_changed(job):
+    publish('scan_job', **job.to_dict())
+
+# One scan captures at a time; the previous scan's USB drain and reconcile
+# overlap the next scan's capture (started by init_rig)
+scan_jobs = None
+
+def job_response(job):
+    """/rotate-style response for a finished job"""
+    if job.state == 'failed':
+        return {'status': 'error', 'message': job.error, 'job_id': job.id}
+    return dict(job.result or {}, status='success', job_id=job.id, cancelled=job.state == 'cancelled')
+
+@app.route('/scans', methods=['POST'])
+def submit_scan():
+    """Queue a scan; returns its job id at once"""
+    params, error = scan_params(request.get_json() or {})
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    if hardware.owner not in (None, 'scan'):
+        return jsonify({'status': 'error', 'message': f'{hardware.owner} in progress'}), 409
+    job = scan_jobs.submit(params)
+    return jsonify({'status': 'success', 'job': job.to_dict(), 'position': scan_jobs.position(job)}), 202
+
+@app.route('/scans', methods=['GET'])
+def list_scans():
+    current = scan_jobs.current
+    return jsonify({'jobs': [job.to_dict() for job in scan_jobs.jobs()],
+                    'current': current.id if current else None})
+
+@app.route('/scans/<job_id>', methods=['GET'])
+def get_scan(job_id):
+    job = scan_jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'Unknown scan job {job_id}'}), 404
+    return jsonify(dict(job.to_dict(), position=scan_jobs.position(job)))
+
+@app.route('/scans/<job_id>/cancel', methods=['POST'])
+def cancel_scan(job_id):
+    """Drop a queued scan, or stop a running one after its current step"""
+    job = scan_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'Unknown scan job {job_id}'}), 404
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+@app.route('/rotate', methods=['POST'])
+def rotate_carousel():
+    """Queue a scan and, unless `wait` is false, answer once it has finished"""
+    data = request.get_json() or {}
+    params, error = scan_params(data)
+    if error:
+        return jsonify({'status': 'error', 'message': error})
+    if hardware.owner not in (None, 'scan'):
+        return jsonify({'status': 'error', 'message': f'{hardware.owner} in progress'}), 409
+    job = scan_jobs.submit(params)
+    if not data.get('wait', True):
+        return jsonify({'status': 'queued', 'job_id': job.id, 'position': scan_jobs.position(job)})
+    job.wait()
+    return jsonify(job_response(job))
  
 # ──────────────────────────── Carousel Reset Thread ─────────────────────────
 
-def _reset_carousel_worker(direction: int = 1):
-    """Background thread that continuously steps the carousel until told to stop."""
-    global stop_reset_flag, reset_in_progress, step_counter
+def home_carousel(direction=HOMING_DIRECTION, should_stop=None):
+    """Home on the index sensor and zero step_counter there; the caller holds the hardware lease"""
+    global step_counter, carousel_homed, last_home
+    carousel_homed = False
+    publish('home_status', homing=True)
+    try:
+        report = home(hardware, sensor_pin, direction, should_stop)
+    except HomingError as e:
+        publish('home_status', homing=False, homed=False, message=str(e))
+        raise
+    # the motor stopped report['position'] pulses past the edge; direction 0 counts up
+    step_counter = report['position'] if direction == cw_direction else -report['position']
+    carousel_homed = True
+    last_home = report
+    print(f"Carousel homed in {report['seconds']} s: {report}")
+    publish('home_status', homing=False, homed=True, step_counter=step_counter, **report)
+    return report
+
+def _reset_carousel_worker(direction: int = HOMING_DIRECTION, manual: bool = False):
+    """Background thread that homes the carousel, or (manual) steps it until told to stop."""
+    global stop_reset_flag, reset_in_progress, carousel_homed
     try:
         print("[ResetThread] started")
-        gp.output(direction_pin, direction)
-        # Continuous stepping until stop flag is set
-        while not stop_reset_flag:
-            gp.output(pulse_pin, gp.HIGH)
-            time.sleep(0.001)
-            gp.output(pulse_pin, gp.LOW)
-            time.sleep(0.001)
-            step_counter -= 1  # we are unwinding the counter
-        print("[ResetThread] stop signal received – exiting thread")
+        publish('reset_status', reset_in_progress=True, step_counter=step_counter)
+
+        if manual:
+            def unwind():
+                global step_counter
+                step_counter -= 1  # we are unwinding the counter
+
+            # Continuous stepping until stop flag is set, then ramp down
+            carousel_homed = False
+            hardware.jog(direction, lambda: stop_reset_flag, on_step=unwind)
+            print("[ResetThread] stop signal received – exiting thread")
+        else:
+            home_carousel(direction, lambda: stop_reset_flag)
+    except Exception as e:
+        if stop_reset_flag:
+            print(f"[ResetThread] stopped: {e}")
+        else:
+            print(f"[ResetThread] error: {e}")
+            publish('scan_error', message=f"Carousel reset failed: {e}")
     finally:
+        hardware.release('reset')
         reset_in_progress = False
         stop_reset_flag = False
+        publish('reset_status', reset_in_progress=False, step_counter=step_counter, homed=carousel_homed)
 
 @app.route('/resetCarousel', methods=['POST'])
 def start_reset_carousel():
-    """Start carousel reset in background thread."""
+    """Start homing (or, with {"manual": true} or INDEX_SENSOR off, a jog until /stopReset) in a background thread."""
     global reset_in_progress, stop_reset_flag, reset_thread
 
     if reset_in_progress:
         return jsonify({'status': 'error', 'message': 'Reset already running'}), 400
 
     data = request.get_json(silent=True) or {}
-    direction = int(data.get('direction', 1))  # 1 = CCW (unwind) by default
+    direction = int(data.get('direction', HOMING_DIRECTION))  # 1 = CCW (unwind) by default
+    manual = bool(data.get('manual', not INDEX_SENSOR))
+
+    # refused while a scan or recording has the carousel; released by the worker
+    try:
+        hardware.acquire('reset')
+    except HardwareBusy as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
 
     # Prepare and start thread
     stop_reset_flag = False
     reset_in_progress = True
-    reset_thread = threading.Thread(target=_reset_carousel_worker, args=(direction,), daemon=True)
+    reset_thread = threading.Thread(target=_reset_carousel_worker, args=(direction, manual), daemon=True)
     reset_thread.start()
     print("[API] resetCarousel started thread")
-    return jsonify({'status': 'started'})
+    return jsonify({'status': 'started', 'mode': 'manual' if manual else 'home'})
 
 @app.route('/stopReset', methods=['POST'])
 def stop_reset_carousel():
@@ -337,48 +1066,44 @@ def stop_reset_carousel():
 
 @app.route('/resetStatus', methods=['GET'])
 def reset_status():
-    """Return whether reset is running."""
-    return jsonify({'reset_in_progress': reset_in_progress})
+    """Return whether reset is running, and whether the carousel is homed."""
+    return jsonify({'reset_in_progress': reset_in_progress, 'homed': carousel_homed,
+                    'step_counter': step_counter, 'last_home': last_home})
 
 
-@app.route('/rotateOneStep', methods=['POST'])
-def rotate_carousel_one_step():
-    global metal_detected_count
+def count_steps(moved, direction):
+    """Keep step_counter relative to home: cw (0) counts up, ccw down"""
     global step_counter
-    #step_counter = 0
+    step_counter += moved if int(direction) == cw_direction else -moved
+
+def advance_carousel(direction=0):
+    """Move the carousel one scan position; the caller holds the hardware lease"""
+    print("Rotating carousel one step...")
+    time.sleep(.1)
+    count_steps(hardware.move(steps, direction), direction)
+    print(step_counter)
 
+@app.route('/rotateOneStep', methods=['POST'])
+def rotate_carousel_one_step():
     try:
         filenames = []
         print('rotate carousel one step a')
 
-        if request and request.method == 'POST':
-            print('Checking request...')
-            if request.is_json:
-                data = request.get_json()
-                direction = data.get('direction', 0)  # Get direction from request
-                print(f"Direction from request: {direction}")
-            else:
-                print('Request is not JSON or invalid Content-Type')
-                direction = 0
+        direction = 0
+        if request.is_json:
+            data = request.get_json()
+            direction = data.get('direction', 0)  # Get direction from request
+            print(f"Direction from request: {direction}")
         else:
-            print('No request context or non-POST request.')
-            direction = 0
-
-        print("Rotating carousel one step...")
+            print('Request is not JSON or invalid Content-Type')
 
-        time.sleep(.1)
-        gp.output(direction_pin, direction)
-
-        for _ in range(steps):
-            gp.output(pulse_pin, gp.HIGH)
-            time.sleep(.001)
-            gp.output(pulse_pin, gp.LOW)
-            time.sleep(.001)
-            step_counter += 1
-            print(step_counter)
+        with hardware.lease('step'):
+            advance_carousel(direction)
 
         return jsonify({'status': 'success', 'images': filenames})
 
+    except HardwareBusy as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
@@ -387,72 +1112,92 @@ def rotate_carousel_one_step():
 @app.route('/capture', methods=['POST'])
 async def capture_images():
     try:
-        filenames = []
-
-        print('Start testing the camera A')
-        i2c = "i2cset -y 10 0x24 0x24 0x02"
-        await asyncio.to_thread(os.system, i2c)
-        gp.output(7, False)
-        gp.output(11, False)
-        gp.output(12, True)
-        filename = await asyncio.to_thread(capture, 1)
-        filenames.append(filename)
-
-        print('Start testing the camera F') 
-        i2c = "i2cset -y 10 0x24 0x24 0x12"
-        await asyncio.to_thread(os.system, i2c)
-        gp.output(7, True)
-        gp.output(11, False)
-        gp.output(12, True)
-        filename = await asyncio.to_thread(capture, 6)
-        filenames.append(filename)
-
-        print('Start testing the camera G')
-        i2c = "i2cset -y 10 0x24 0x24 0x22"
-        await asyncio.to_thread(os.system, i2c)
-        gp.output(7, False)
-        gp.output(11, True)
-        gp.output(12, False)
-        filename = await asyncio.to_thread(capture, 7)
-        filenames.append(filename)
-
-        print('Start testing the camera H')
-        i2c = "i2cset -y 10 0x24 0x24 0x32"
-        await asyncio.to_thread(os.system, i2c)
-        gp.output(7, True)
-        gp.output(11, True)
-        gp.output(12, False)
-        filename = await asyncio.to_thread(capture, 8)
-        filenames.append(filename)
-
+        with hardware.lease('capture'):
+            filenames = await capture_local_images()
         return jsonify({'status': 'success', 'images': filenames})
-        
+
+    except HardwareBusy as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
         
 
+async def shoot_camera(cam, label, channel, pins):
+    """Select one camera on the mux and take a frame; returns the filename"""
+    print(f'Start testing the camera {label}')
+    await asyncio.to_thread(hardware.select_camera, channel, pins)
+    filename = await asyncio.to_thread(capture, cam)
+    publish('camera_captured', camera=cam, image=filename, count=image_index.counts([cam])[f'cam{cam}'])
+    return filename
+
+async def capture_local_images(filenames=None, retakes=None):
+    """
+    Shoot the main Pi's cameras in CAMERA_CHANNELS order; returns the files written.
+    Frames that fail the quality gate are reshot (up to MAX_RETAKES) before
+    returning; each retake is appended to `retakes` if given.
+    """
+    # appended as each shot lands, so a caller passing its own list keeps
+    # the files that made it even if a later camera fails
+    filenames = [] if filenames is None else filenames
+    checks = []
+    for entry in CAMERA_CHANNELS:
+        cam = entry[0]
+        filename = await shoot_camera(*entry)
+        filenames.append(filename)
+        # scored on the gate's pool while the next camera shoots
+        checks.append((entry, filename, quality_gate.submit(cam, image_path(filename, scan_staging))))
+
+    for entry, filename, check in checks:
+        cam = entry[0]
+        result = await asyncio.wrap_future(check)
+        for _ in range(MAX_RETAKES):
+            if result['ok']:
+                break
+            print(f"Camera {cam} failed the quality gate ({', '.join(result['reasons'])}), retaking {filename}")
+            publish('quality_retake', camera=cam, image=filename, reasons=result['reasons'],
+                    sharpness=result.get('sharpness'))
+            if retakes is not None:
+                retakes.append({'camera': cam, 'image': filename, 'reasons': result['reasons']})
+            retaken = await shoot_camera(*entry)
+            if retaken != filename:
+                discard_image(filename)
+            filenames[filenames.index(filename)] = retaken
+            filename = retaken
+            result = await asyncio.to_thread(quality_gate.check, cam, image_path(filename, scan_staging))
+        if not result['ok']:
+            print(f"Camera {cam} still failing the quality gate: {result['reasons']}")
+            publish('scan_error', message=f"Camera {cam} failed the quality gate ({', '.join(result['reasons'])}) after {MAX_RETAKES} retake(s)")
+    return filenames
+
+def discard_image(name):
+    """Drop a rejected frame from IMAGE_DIR (or staging) and the index"""
+    if scan_staging is not None and name in scan_staging:
+        scan_staging.release(name)
+        return
+    try:
+        os.remove(os.path.join(IMAGE_DIR, name))
+    except FileNotFoundError:
+        pass
+    image_index.remove(name)
+    thumbnail_cache.discard(name)
+
 # Function to trigger capture on the remote Pi (async)
 @app.route('/captureRemote', methods=['POST'])
 async def trigger_capture_on_remote():
     print('Attempting to trigger remote capture...')
     try:
-        filenames = []
-        async with aiohttp.ClientSession() as session:
-            print('Sending POST request to remote Pi...')
-            async with session.post('http://192.168.10.221:5002/capture') as response:
-                print(f"Response status: {response.status}")
-                if response.status == 200:
-                    print('Remote capture triggered successfully!')
-                else:
-                    print(f"Failed to trigger remote capture. HTTP Status: {response.status}")
-                    print(f"Response text: {await response.text()}")
-                return jsonify({'status': 'success', 'images': filenames})
-    except aiohttp.ClientError as e:
-        print(f"Client error occurred while triggering remote capture: {str(e)}")
+        results = await camera_cluster.capture_step()
+        ok = all(r.get('status') == 'success' for r in results.values())
+        return jsonify({'status': 'success' if ok else 'error', 'nodes': results})
     except Exception as e:
-        print(f"Unexpected error occurred while triggering remote capture: {str(e)}")
+        print(f"Error occurred while triggering remote capture: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)})
 
+@app.route('/nodes', methods=['GET'])
+def list_nodes():
+    """Capture node registry with per-node trigger latency"""
+    return jsonify(camera_cluster.to_dict())
+
 # def capture(cam):
 #     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 #     filename = f'capture_cam{cam}_{timestamp}.jpg'
@@ -476,32 +1221,52 @@ async def trigger_capture_on_remote():
 #     os.system(cmd)
 #     return filename
 
-def capture(cam):
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    fname = f"static/captures/cam{cam}_{ts}.jpg"
-
-    # --immediate  : skip the default 2 s preview+analysis
-    # -t 1         : one-millisecond run time (needed because -t 0 disables stills)
-    # -n           : no preview window
-    # -q 85        : sensible JPEG quality
-    # -r           : *don’t* save RAW (drops the second stream)
-    # --mode 1920:1080:10 : HD sensor binning → much lighter than 4656×3496
-    # Manual lens/shutter/gain as you already have
-    base = (
-        "libcamera-still -t 1 --immediate -n -q 85 "
-        "--mode 4656:3496:10 "
-    )
+def file_timestamp(at=None):
+    """Timestamp for file names, to the millisecond - a pipelined step can take under a second"""
+    at = at or datetime.now()
+    return f"{at:%Y%m%d_%H%M%S}_{at.microsecond // 1000:03d}"
 
-    tuning = {
-        1: "--lens-position 6.0 --shutter 50000 --gain 2.5",
-        6: "--lens-position 6.5 --shutter 50000 --gain 3.0",
-        7: "--lens-position 5.0 --shutter 50000 --gain 3.0",
-        8: "--lens-position 5.5 --shutter 50000 --gain 3.0",
-    }[cam]
-
-    os.system(f"{base} {tuning} -o {fname}")
+def capture(cam):
+    fname = f"cam{cam}_{file_timestamp()}.jpg"
+
+    # The engine keeps the sensor streaming in 4656x3496 between shots and
+    # only pushes this camera's lens/shutter/gain from CAMERA_TUNING.
+    staging_ring = scan_staging
+    claimed = staging_ring.image_estimate() if staging_ring is not None else 0
+    if staging_ring is not None and staging_ring.claim(claimed):
+        # held in RAM for the USB writer; the dashboard gets a preview once it is delivered
+        try:
+            camera_engine.capture(cam, staging_ring.path(fname))
+        except Exception:
+            staging_ring.unclaim(claimed)
+            raise
+        staging_ring.add(fname, claimed)
+        return fname
+    path = os.path.join(IMAGE_DIR, fname)
+    camera_engine.capture(cam, path)
+    image_index.add(fname)
+    thumbnail_cache.prefetch(path, fname)
     return fname
 
+def thumbnail_url(name):
+    return f"/thumbnail/{name}"
+
+@app.route("/thumbnail/<name>", methods=["GET"])
+def thumbnail(name):
+    """Small JPEG of a capture; repeat requests with If-None-Match / If-Modified-Since get 304"""
+    if name != os.path.basename(name) or not name.endswith('.jpg'):
+        return jsonify({"status": "error", "message": "Invalid image name"}), 400
+    src_path = os.path.join(IMAGE_DIR, name)
+    if not os.path.exists(src_path):
+        return jsonify({"status": "error", "message": "Image not found"}), 404
+    try:
+        path = thumbnail_cache.get(src_path, name)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    # no-cache: the browser keeps the tile but revalidates, so a retake
+    # that overwrote the image is picked up
+    return send_file(path, mimetype='image/jpeg', conditional=True, etag=True, max_age=0)
+
 
 @app.route("/list_images", methods=["GET"])
 def list_images():
@@ -509,9 +1274,9 @@ def list_images():
     # Sort by cam number first, then timestamp
     images.sort(key=lambda f: (
         int(f.split('_')[1][3:]),  # Extract camera number (e.g., cam2 -> 2)
-        f.split('_')[2]            # Extract timestamp (e.g., 20250110_154243)
+        f.split('_', 2)[2]         # Extract timestamp (e.g., 20250110_154243_125)
     ))
-    return jsonify(images)
+    return jsonify([{'name': f, 'thumbnail': thumbnail_url(f)} for f in images])
 
 @app.route("/list_usb", methods=["GET"])
 def list_usb():
@@ -526,6 +1291,9 @@ def delete_images():
         img_path = os.path.join(IMAGE_DIR, img)
         if os.path.exists(img_path):
             os.remove(img_path)
+        image_index.remove(img)
+        thumbnail_cache.discard(img)
+    publish('diagnostics_update', **diagnostics_snapshot())
     return jsonify({"status": "success"})
 
 @app.route("/check_existing_images", methods=["GET"])
@@ -544,6 +1312,9 @@ def check_existing_images():
 def clear_all_images():
     """Clear all images from the captures directory"""
     try:
+        # queued and finishing scans still copy from here
+        if scan_jobs.busy():
+            return jsonify({"status": "error", "message": "Scans are queued or still being written to USB"})
         if not os.path.exists(IMAGE_DIR):
             return jsonify({"status": "success", "message": "No images directory found", "deleted_count": 0})
         
@@ -554,39 +1325,48 @@ def clear_all_images():
             img_path = os.path.join(IMAGE_DIR, img)
             try:
                 os.remove(img_path)
+                thumbnail_cache.discard(img)
                 deleted_count += 1
             except Exception as e:
                 print(f"Error deleting {img}: {e}")
         
+        # re-sync with whatever could not be deleted
+        image_index.rebuild(IMAGE_DIR)
+        publish('diagnostics_update', **diagnostics_snapshot())
         return jsonify({"status": "success", "deleted_count": deleted_count})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 def download_images_thread(selected_images, usb_path, delete_after_download, app):
     try:
-        total_files = len(selected_images)
-        for index, img in enumerate(selected_images):
-            src_path = os.path.join(IMAGE_DIR, img)
-            dest_path = os.path.join(usb_path, img)
-            shutil.copy(src_path, dest_path)
+        pairs = [(os.path.join(IMAGE_DIR, img), os.path.join(usb_path, img)) for img in selected_images]
 
-            progress = int(((index + 1) / total_files) * 100)
-            socketio.emit('progress_update', {'progress': progress}, namespace='/')
+        def report(progress):
+            socketio.emit('progress_update', progress, namespace='/')
 
-            time.sleep(0.5)
+        result = usb_copier.run(pairs, progress=report)
+        summary = result.summary()
+        print(f"Copied {summary['files']}/{summary['total_files']} images to {usb_path} "
+              f"at {summary['mb_per_s']} MB/s")
 
         if delete_after_download:
-            for img in selected_images:
-                os.remove(os.path.join(IMAGE_DIR, img))
-
-        socketio.emit('progress_update', {'progress': 100}, namespace='/')
+            # only files whose copy was flushed and size-checked
+            for src_path in result.verified:
+                img = os.path.basename(src_path)
+                os.remove(src_path)
+                image_index.remove(img)
+                thumbnail_cache.discard(img)
+
+        socketio.emit('progress_update', dict(summary, progress=100), namespace='/')
+        if result.failed:
+            failed = ', '.join(os.path.basename(f) for f in result.failed)
+            socketio.emit('progress_error', {'message': f"{len(result.failed)} file(s) not copied: {failed}"}, namespace='/')
 
     except Exception as e:
         socketio.emit('progress_error', {'message': str(e)})
 
     finally:
-        with app.app_context():  # Use the correct app context
-            sound_buzzer(2)
+        hardware.buzz(2)
 
 
 @app.route("/download_images", methods=["POST"])
@@ -604,75 +1384,166 @@ def download_images():
 
     return jsonify({"status": "started"})  # Immediately respond to the client
 
+def announce_image(name):
+    """Tell connected pages a camera image arrived"""
+    cam = camera_of(name)
+    if cam is not None:
+        publish('camera_captured', camera=cam, image=name, count=image_index.counts([cam])[f'cam{cam}'])
+
+def record_upload(name):
+    """Book-keeping for a remote image saved into IMAGE_DIR"""
+    image_index.add(name)
+    thumbnail_cache.prefetch(os.path.join(IMAGE_DIR, name), name)
+    with uploaded_images_lock:
+        uploaded_images.append(name)
+    announce_image(name)
+
+def stream_to_file(stream, path, chunk_size=UPLOAD_CHUNK, hasher=None, fsync=False):
+    """Copy a request body to `path` chunk by chunk; the file only appears once complete"""
+    part_path = path + '.part'
+    size = 0
+    with open(part_path, 'wb') as f:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            if hasher is not None:
+                hasher.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(part_path, path)
+    return size
+
+def save_preview(src_path, name):
+    """Write a quarter-resolution copy of `src_path` into IMAGE_DIR for the dashboard"""
+    try:
+        import cv2
+        # DCT-domain downscale while decoding - much cheaper than a full decode
+        img = cv2.imread(src_path, cv2.IMREAD_REDUCED_COLOR_4)
+        if img is None:
+            print(f"Preview failed, could not decode: {src_path}")
+            return
+        preview_name = name[:-len('.jpg')] + '_preview.jpg'
+        preview_path = os.path.join(IMAGE_DIR, preview_name)
+        cv2.imwrite(preview_path, img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        image_index.add(preview_name)
+        thumbnail_cache.prefetch(preview_path, preview_name)
+    except Exception as e:
+        print(f"Preview failed for {name}: {e}")
+
 @app.route('/upload', methods=['POST'])
 def upload_images():
     try:
+        saved = []
         for file in request.files.getlist("images"):
             if file.filename:
                 save_path = os.path.join(IMAGE_DIR, file.filename)
                 file.save(save_path)
                 print(f"Saved: {save_path}")
+                record_upload(file.filename)
+                saved.append(file.filename)
+
+        # the sender deletes its copy of each file listed here
+        return {"status": "success", "message": "Images received", "images": saved}, 200
+    except Exception as e:
+        return {"status": "error", "message": str(e)}, 500
+
+@app.route('/upload/<filename>', methods=['PUT', 'POST'])
+def upload_image_stream(filename):
+    """Receive one image as a raw request body"""
+    try:
+        name = os.path.basename(filename)
+        if not name.endswith('.jpg'):
+            return {"status": "error", "message": "Only .jpg uploads are accepted"}, 400
+
+        # in tar output mode the step's remote files are archived from the Pi like local ones
+        scan_folder = current_scan_folder if scan_in_progress and scan_archive is None else None
+        staging_ring = scan_staging if scan_in_progress else None
+        claimed = (request.content_length or staging_ring.image_estimate()) if staging_ring is not None else 0
+        if staging_ring is not None and staging_ring.claim(claimed):
+            # Active scan with RAM staging: the USB writer takes it from here
+            try:
+                size = stream_to_file(request.stream, staging_ring.path(name))
+            except Exception:
+                staging_ring.unclaim(claimed)
+                raise
+            staging_ring.add(name, claimed)
+            print(f"Staged: {name} ({size} bytes)")
+            with uploaded_images_lock:
+                uploaded_images.append(name)
+            announce_image(name)
+            return {"status": "success", "images": [name], "ingested": False, "staged": True}, 200
+        if scan_folder and os.path.isdir(scan_folder):
+            # Active scan: ingest straight into the scan folder, skipping the
+            # SD-card copy and the later SD -> USB copy. The sender deletes
+            # its copy on our answer, so the file must be on the stick first.
+            manifest = scan_manifest
+            dest_path = os.path.join(scan_folder, name)
+            hasher = new_hasher(manifest.hash_name) if manifest is not None else None
+            size = stream_to_file(request.stream, dest_path, hasher=hasher, fsync=True)
+            if manifest is not None:
+                manifest.record(name, size, time.time(), hasher.hexdigest())
+                manifest.mark_copied(name, dest_path)
+            print(f"Ingested: {name} ({size} bytes) -> {scan_folder}")
+            image_index.add_delivered(name)
+            if INGEST_PREVIEWS:
+                preview_executor.submit(save_preview, os.path.join(scan_folder, name), name)
+            announce_image(name)
+        else:
+            size = stream_to_file(request.stream, os.path.join(IMAGE_DIR, name))
+            print(f"Saved: {name} ({size} bytes)")
+            record_upload(name)
 
-        return {"status": "success", "message": "Images received"}, 200
+        # the sender deletes its copy of each file listed here
+        return {"status": "success", "images": [name], "ingested": bool(scan_folder)}, 200
     except Exception as e:
         return {"status": "error", "message": str(e)}, 500
 
 @app.route('/rotateAndRecord', methods=['POST'])
 def rotate_and_record():
-    global metal_detected_count
     try:
-        filenames = []
         print('Rotate carousel and record video')
 
         direction = 0  # Default direction
+        wait = False
         if request and request.method == 'POST' and request.is_json:
             data = request.get_json()
             direction = data.get('direction', 0)
+            wait = bool(data.get('wait', False))
 
         print(f"Direction: {direction}")
-        gp.output(direction_pin, direction)
 
         # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        raw_video_filename = f"static/captures/video_cam1_{timestamp}.h264"
-        mp4_video_filename = f"static/captures/video_cam1_{timestamp}.mp4"
-
-        # Start recording video
-        record_process = subprocess.Popen(
-            ["libcamera-vid", "-t", "0", 
-            "--lens-position", "6.0", 
-            "--viewfinder-width", "1920", "--viewfinder-height", "1080",
-            "-o", raw_video_filename], 
-            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-        )
-
-        print(f"Recording started: {raw_video_filename}")
-
-        # Rotate stepper motor
-        for _ in range(3000):
-            gp.output(pulse_pin, gp.HIGH)
-            time.sleep(.001)
-            gp.output(pulse_pin, gp.LOW)
-            time.sleep(.001)
-
-        # Stop recording
-        record_process.terminate()
-        print(f"Recording stopped: {raw_video_filename}")
-
-        # Convert to .mp4 using ffmpeg
-        convert_process = subprocess.run(
-            ["ffmpeg", "-i", raw_video_filename, "-c:v", "copy", "-an", mp4_video_filename],
-            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-        )
-
-        if convert_process.returncode == 0:
-            print(f"Video converted to: {mp4_video_filename}")
-            os.remove(raw_video_filename)  # Delete original .h264 file
-        else:
-            print(f"Failed to convert {raw_video_filename} to .mp4")
+        video_filename = os.path.join(IMAGE_DIR, f"video_cam1_{file_timestamp()}.mp4")
 
-        return jsonify({'status': 'success', 'video': mp4_video_filename})
+        with hardware.lease('record'):
+            # H.264 is piped straight into a fragmented-MP4 muxer, so the
+            # file is playable while it is written and needs no remux
+            recording = video_recorder.start(video_filename)
+            print(f"Recording started: {video_filename}")
 
+            # Rotate stepper motor
+            try:
+                count_steps(hardware.move(3000, direction, profile=RECORD_PROFILE), direction)
+            finally:
+                # the muxer flushes its last fragment in the background
+                recording.stop()
+        print(f"Recording stopped: {video_filename}")
+
+        if wait:
+            result = recording.wait(STOP_TIMEOUT)
+            if result is None or not result['ok']:
+                message = result['error'] if result else 'muxer did not finish'
+                return jsonify({'status': 'error', 'message': f'Video not saved: {message}', 'video': video_filename})
+            return jsonify({'status': 'success', **result})
+        # 'video_saved' is published once the file is finalised
+        return jsonify({'status': 'success', 'video': video_filename, 'finalising': True})
+
+    except HardwareBusy as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
@@ -680,15 +1551,8 @@ def rotate_and_record():
 @app.route('/soundBuzzer', methods=['POST'])
 def sound_buzzer(buzzCount=1):
     try:
-        filenames = []
-      
-        # Rotate stepper motor
-        for _ in range(buzzCount):
-            gp.output(buzzer, gp.HIGH)
-            time.sleep(.5)
-            gp.output(buzzer, gp.LOW)
-            time.sleep(.1)
-
+        # played on the arbiter's buzzer thread; returns straight away
+        hardware.buzz(buzzCount)
         return jsonify({'status': 'success'})
 
     except Exception as e:
@@ -697,61 +1561,199 @@ def sound_buzzer(buzzCount=1):
 @app.route('/diagnostics')
 def diagnostics():
     """Show diagnostics dashboard"""
-    return render_template('diagnostics.html', title='Diagnostics Dashboard')
+    return render_template('diagnostics.html', title='Diagnostics Dashboard', cameras=all_cameras())
+
+def all_cameras():
+    """Local cameras plus every node's, in camera-number order"""
+    return sorted({cam for cam, *_ in CAMERA_CHANNELS} | set(camera_cluster.cameras))
+
+def diagnostics_snapshot():
+    """Dashboard state served by /diagnostics_data and pushed as diagnostics_update"""
+    # Calculate progress
+    total_steps = 24000
+    progress_percentage = min(100, (step_counter / total_steps) * 100) if scan_in_progress else 0
+    
+    # Calculate expected images per camera
+    images_per_camera_expected = total_steps // steps if steps > 0 else 0
+    
+    # Count actual images per camera, latest 8 images (most recent) -
+    # both maintained in memory as images come and go
+    image_counts = image_index.counts(all_cameras())
+    latest_images = [{'name': name, 'thumbnail': thumbnail_url(name)} for name in image_index.latest()]
+    
+    return {
+        'scan_in_progress': scan_in_progress,
+        'progress_percentage': round(progress_percentage, 1),
+        'step_counter': step_counter,
+        'homed': carousel_homed,
+        'total_steps': total_steps,
+        'images_per_camera_expected': images_per_camera_expected,
+        'image_counts': image_counts,
+        'latest_images': latest_images,
+        'quality': quality_gate.stats(),
+        'thumbnails': thumbnail_cache.stats(),
+        'staging': staging.stats() if staging is not None else None,
+        'hardware': hardware.stats(),
+    }
 
 @app.route('/diagnostics_data', methods=['GET'])
 def diagnostics_data():
     """Get diagnostics data for dashboard"""
-    global step_counter, scan_in_progress, steps
-    
     try:
-        # Calculate progress
-        total_steps = 24000
-        progress_percentage = min(100, (step_counter / total_steps) * 100) if scan_in_progress else 0
-        
-        # Calculate expected images per camera
-        images_per_camera_expected = total_steps // steps if steps > 0 else 0
-        
-        # Count actual images per camera
-        image_counts = {}
-        latest_images = []
-        
-        if os.path.exists(IMAGE_DIR):
-            all_images = [f for f in os.listdir(IMAGE_DIR) if f.endswith('.jpg')]
-            
-            # Count images per camera
-            for cam_num in [1, 2, 3, 4, 5, 6, 7, 8]:
-                count = len([img for img in all_images if img.startswith(f'cam{cam_num}_')])
-                image_counts[f'cam{cam_num}'] = count
-            
-            # Get latest 8 images (most recent)
-            if all_images:
-                all_images.sort(key=lambda f: os.path.getmtime(os.path.join(IMAGE_DIR, f)), reverse=True)
-                latest_images = all_images[:8]
-        
-        return jsonify({
-            'scan_in_progress': scan_in_progress,
-            'progress_percentage': round(progress_percentage, 1),
-            'step_counter': step_counter,
-            'total_steps': total_steps,
-            'images_per_camera_expected': images_per_camera_expected,
-            'image_counts': image_counts,
-            'latest_images': latest_images
-        })
-        
+        return jsonify(diagnostics_snapshot())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ──────────────────────────── Startup ───────────────────────────────────────
+
+# seconds since this module started importing
+STARTUP = {}
+# a request that needs the rig waits this long for init_rig() before a 503
+RIG_INIT_TIMEOUT = 30
+# served while the rig is still coming up
+RIG_FREE_ENDPOINTS = {'static', 'index', 'health'}
+
+_rig_lock = threading.Lock()
+_rig_thread = None
+_rig_ready = threading.Event()
+_rig_error = None
+
+def init_rig():
+    """GPIO, motor, mux, camera engine, capture nodes, quality gate and scan worker"""
+    global gp, carousel_motor, thumbnail_cache, camera_cluster, CAMERA_TUNING
+    global camera_engine, camera_mux, hardware, quality_gate, staging, scan_jobs, video_recorder
+    started = time.perf_counter()
+
+    # heavy imports (cv2 / numpy, picamera2 on first capture) happen here
+    if SIMULATE:
+        import hardware_sim
+        gp = hardware_sim.gpio
+    else:
+        import RPi.GPIO as gp
+    from focus_calibration import apply_calibration, load_calibration, load_scores
+    from quality_gate import QualityGate
+    from thumbnails import ThumbnailCache
+
+    gp.setwarnings(False)
+    gp.setmode(gp.BOARD)
+    gp.setup(sensor_pin, gp.IN, pull_up_down=gp.PUD_DOWN)
+    gp.setup(direction_pin, gp.OUT)
+    gp.setup(pulse_pin, gp.OUT)
+    gp.output(direction_pin, cw_direction)
+    gp.setup(buzzer, gp.OUT)
+    # camera - might not be needed?  TODO: test removal
+    gp.setup(7, gp.OUT)
+    gp.setup(11, gp.OUT)
+    gp.setup(12, gp.OUT)
+    if SIMULATE:
+        hardware_sim.SimCarousel(gp, sensor_pin, pulse_pin, direction_pin, STEPS_PER_REVOLUTION)
+    carousel_motor = StepperMotor(gp, pulse_pin, direction_pin, CAROUSEL_PROFILE)
+
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    thumbnail_cache = ThumbnailCache(THUMBNAIL_DIR)
+    image_index.rebuild(IMAGE_DIR)
+
+    if os.path.exists(NODES_CONFIG):
+        camera_cluster = load_cluster(NODES_CONFIG)
+    else:
+        # capture.py's own CAMERA_TUNING applies (no presets sent)
+        camera_cluster = CameraCluster([CameraNode('secondary', {cam: {} for cam in (2, 3, 4, 5)},
+                                                   command_addr=REMOTE_COMMAND_ADDR, http_url=REMOTE_PI_URL)])
+    atexit.register(lambda: camera_cluster.close())
+
+    CAMERA_TUNING = apply_calibration(CAMERA_TUNING, load_calibration())
+    camera_engine = CameraEngine(hardware_sim.camera_backend() if SIMULATE else make_backend(), CAMERA_TUNING)
+    atexit.register(camera_engine.close)
+    camera_mux = hardware_sim.mux if SIMULATE else I2CMux()
+    hardware = HardwareArbiter(gp, carousel_motor, camera_mux, buzzer)
+    atexit.register(hardware.close)
+
+    quality_gate = QualityGate(workers=2, references=load_scores())
+    video_recorder = VideoRecorder(on_done=lambda result: publish('video_saved', **result),
+                                   **(hardware_sim.video_options() if SIMULATE else {}))
+    atexit.register(video_recorder.close)
+    if STAGING_DIR:
+        # spilled to the SD card at exit - after scan_jobs.close() below has drained
+        staging = StagingRing(STAGING_DIR, STAGING_BUDGET, IMAGE_DIR)
+        atexit.register(staging.close)
+    scan_jobs = ScanJobQueue(run_scan_job, on_change=job_changed)
+    atexit.register(scan_jobs.close, 5)
+
+    STARTUP['rig_init_s'] = round(time.perf_counter() - started, 3)
+    STARTUP['rig_ready_s'] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    print(f"Rig ready in {STARTUP['rig_ready_s']} s ({STARTUP['rig_init_s']} s of hardware init)")
+
+def _init_rig_once():
+    global _rig_error
+    try:
+        init_rig()
+    except Exception as e:
+        _rig_error = e
+        print(f"Rig initialisation failed: {e}")
+    finally:
+        _rig_ready.set()
+
+def start_rig():
+    """Start init_rig() on a background thread, once"""
+    global _rig_thread
+    with _rig_lock:
+        if _rig_thread is None:
+            _rig_thread = threading.Thread(target=_init_rig_once, name="rig-init", daemon=True)
+            _rig_thread.start()
+
+def ensure_rig(timeout=None):
+    """Wait for the rig (starting it if nobody has); raises RuntimeError if it is not usable"""
+    start_rig()
+    if not _rig_ready.wait(timeout):
+        raise RuntimeError("Rig is still initialising")
+    if _rig_error is not None:
+        raise RuntimeError(f"Rig initialisation failed: {_rig_error}")
+
+@app.before_request
+def require_rig():
+    if request.endpoint in RIG_FREE_ENDPOINTS:
+        return None
+    try:
+        ensure_rig(RIG_INIT_TIMEOUT)
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness plus startup timings; answers while the rig is still coming up"""
+    return jsonify({
+        'status': 'ok',
+        'rig_ready': _rig_ready.is_set() and _rig_error is None,
+        'rig_error': str(_rig_error) if _rig_error else None,
+        'startup': STARTUP,
+    })
+
+def create_app(start_hardware=True):
+    """
+    The app, ready to accept requests. The rig is brought up on a
+    background thread (start_hardware=False leaves it to the first request
+    that needs it); requests that need it wait in require_rig().
+    """
+    if start_hardware:
+        start_rig()
+    STARTUP.setdefault('app_ready_s', round(time.perf_counter() - IMPORT_STARTED, 3))
+    print(f"App ready in {STARTUP['app_ready_s']} s")
+    return app
+
 if __name__ == '__main__':
     try:
-        socketio.run(app, host='192.168.11.178', port=5002, debug=True, allow_unsafe_werkzeug=True)
+        socketio.run(create_app(), host='192.168.11.178', port=5002, debug=True, allow_unsafe_werkzeug=True)
 
-        #TODO test and remove
-        gp.output(7, False)
-        gp.output(11, False)
-        gp.output(12, True)
- 
-        gp.cleanup()
+        if gp is not None:
+            #TODO test and remove
+            gp.output(7, False)
+            gp.output(11, False)
+            gp.output(12, True)
+
+            camera_engine.close()
+            gp.cleanup()
 
     except KeyboardInterrupt:
-        gp.cleanup()
\ No newline at end of file
+        if gp is not None:
+            camera_engine.close()
+            gp.cleanup()
@@ -0,0 +1,301 @@
+"""
+Stepper motion engine.
+
+The carousel used to be driven by toggling the pulse pin with two
+``time.sleep(.001)`` calls per pulse, which caps it below 500 steps/s and
+leaves every pulse at the mercy of the scheduler.  Here a move is planned
+up front as a trapezoidal velocity profile (ramp up, cruise, ramp down),
+turned into a list of pulse intervals, and played back against absolute
+deadlines: the timing loop sleeps until just before each deadline and
+busy-waits the rest.  Each deadline is counted from when the previous
+pulse actually went out, so a thread that wakes up late loses that time
+instead of firing the missed pulses back to back - a burst faster than the
+profile would stall the motor and lose steps.
+
+`FakeGPIO` stands in for RPi.GPIO and timestamps every pin change, which is
+enough to check the generated pulse train off the Pi.
+"""
+import bisect
+import math
+import threading
+import time
+from collections import deque
+
+# Linux wakes a sleeping thread up to a few hundred microseconds late;
+# anything closer to the deadline than this is busy-waited instead.
+SPIN_MARGIN = 0.0005
+
+# Driver minimums (DM542/TB6600 class): pulse high >= 2.5 us,
+# direction set >= 5 us before the first pulse edge.
+PULSE_WIDTH = 0.00001
+DIRECTION_SETUP = 0.00001
+# pin changes FakeGPIO keeps - a revolution's pulses, both edges
+EVENT_HISTORY = 100_000
+
+
+class MotionProfile:
+    """Velocity / acceleration limits for a move, in steps/s and steps/s^2."""
+
+    def __init__(self, max_velocity=1500.0, acceleration=5000.0, start_velocity=400.0):
+        if not 0 < start_velocity <= max_velocity:
+            raise ValueError("need 0 < start_velocity <= max_velocity")
+        if acceleration <= 0:
+            raise ValueError("acceleration must be positive")
+        self.max_velocity = float(max_velocity)
+        self.acceleration = float(acceleration)
+        self.start_velocity = float(start_velocity)
+
+    def velocity_after(self, steps):
+        """Velocity reached after accelerating for `steps` pulses from start_velocity"""
+        return math.sqrt(self.start_velocity ** 2 + 2 * self.acceleration * steps)
+
+    def steps_to_stop(self, velocity):
+        """Pulses needed to ramp down from `velocity` to start_velocity"""
+        return max(0, int((velocity ** 2 - self.start_velocity ** 2) / (2 * self.acceleration)))
+
+    def to_dict(self):
+        return {
+            'max_velocity': self.max_velocity,
+            'acceleration': self.acceleration,
+            'start_velocity': self.start_velocity,
+        }
+
+
+def build_schedule(steps, profile):
+    """
+    Plan a trapezoidal move of `steps` pulses.
+    Returns the interval (seconds) before each pulse; short moves that never
+    reach max_velocity come out as a triangle.
+    """
+    intervals = []
+    for i in range(steps):
+        v = min(profile.velocity_after(i), profile.velocity_after(steps - 1 - i), profile.max_velocity)
+        intervals.append(1.0 / v)
+    return intervals
+
+
+def wait_until(deadline):
+    """Sleep until shortly before `deadline` (perf_counter time), then spin"""
+    remaining = deadline - time.perf_counter()
+    if remaining > SPIN_MARGIN:
+        time.sleep(remaining - SPIN_MARGIN)
+    while time.perf_counter() < deadline:
+        pass
+
+
+class StepperMotor:
+    """Plays pulse schedules on a step/direction driver."""
+
+    def __init__(self, gpio, pulse_pin, direction_pin, profile=None):
+        self.gpio = gpio
+        self.pulse_pin = pulse_pin
+        self.direction_pin = direction_pin
+        self.profile = profile or MotionProfile()
+        self._lock = threading.Lock()
+
+    def _pulse(self):
+        """One step pulse; returns when its rising edge went out"""
+        self.gpio.output(self.pulse_pin, self.gpio.HIGH)
+        edge = time.perf_counter()
+        wait_until(edge + PULSE_WIDTH)
+        self.gpio.output(self.pulse_pin, self.gpio.LOW)
+        return edge
+
+    def _set_direction(self, direction):
+        self.gpio.output(self.direction_pin, direction)
+        wait_until(time.perf_counter() + DIRECTION_SETUP)
+
+    def move(self, steps, direction, profile=None, on_step=None, should_stop=None):
+        """
+        Move `steps` pulses in `direction` and return how many were issued.
+        `should_stop` is polled every pulse; once it returns True the motor
+        ramps down over the shortest safe distance and the move ends early.
+        """
+        profile = profile or self.profile
+        schedule = build_schedule(steps, profile)
+        with self._lock:
+            self._set_direction(direction)
+            deadline = time.perf_counter()
+            issued = 0
+            for interval in schedule:
+                if should_stop is not None and should_stop():
+                    issued += self._ramp_down(1.0 / interval, profile, deadline, on_step)
+                    break
+                wait_until(deadline)
+                deadline = self._pulse()
+                issued += 1
+                if on_step is not None:
+                    on_step()
+                deadline += interval
+            return issued
+
+    def jog(self, direction, should_stop, profile=None, on_step=None):
+        """Run at up to max_velocity until `should_stop()`, then ramp down; returns pulses issued"""
+        profile = profile or self.profile
+        with self._lock:
+            self._set_direction(direction)
+            deadline = time.perf_counter()
+            issued = 0
+            v = profile.start_velocity
+            while not should_stop():
+                wait_until(deadline)
+                deadline = self._pulse()
+                issued += 1
+                if on_step is not None:
+                    on_step()
+                v = min(profile.velocity_after(issued), profile.max_velocity)
+                deadline += 1.0 / v
+            issued += self._ramp_down(v, profile, deadline, on_step)
+            return issued
+
+    def _ramp_down(self, velocity, profile, deadline, on_step):
+        """Decelerate from `velocity`; caller holds the lock"""
+        count = profile.steps_to_stop(velocity)
+        for i in range(count):
+            wait_until(deadline)
+            deadline = self._pulse()
+            if on_step is not None:
+                on_step()
+            deadline += 1.0 / max(profile.velocity_after(count - 1 - i), profile.start_velocity)
+        return count
+
+
+class StepTimeline:
+    """When each pulse of a move was issued - pass `on_step` to move() / jog()."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.times = []  # perf_counter time of pulse 1, 2, ...
+
+    def on_step(self):
+        self.times.append(time.perf_counter())
+
+    def time_at(self, step):
+        """When the carousel had moved `step` pulses (clamped to the pulses issued)"""
+        if step <= 0 or not self.times:
+            return self.started_at
+        return self.times[min(step, len(self.times)) - 1]
+
+    def step_at(self, t):
+        """Pulses issued by perf_counter time `t`"""
+        return bisect.bisect_right(self.times, t)
+
+    def to_dict(self):
+        return {
+            'steps': len(self.times),
+            'duration_s': round(self.times[-1] - self.started_at, 3) if self.times else 0,
+        }
+
+
+# ──────────────────────────── Fake GPIO ─────────────────────────────────────
+
+class FakeGPIO:
+    """
+    RPi.GPIO-compatible stand-in that records every pin change. Inputs are
+    driven with set_input(), which fires add_event_detect() callbacks
+    (synchronously, where RPi.GPIO would use its own thread); listeners
+    added with watch() see every output.
+    """
+
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, max_events=EVENT_HISTORY):
+        self.mode = None
+        self.pins = {}
+        self.events = deque(maxlen=max_events)  # (perf_counter time, pin, value), the latest max_events
+        self._detect = {}  # pin -> (edge, [callbacks], detected flag)
+        self._watchers = []
+        self._lock = threading.Lock()
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        with self._lock:
+            self.pins[pin] = initial if initial is not None else self.LOW
+
+    def output(self, pin, value):
+        value = int(bool(value))
+        with self._lock:
+            self.pins[pin] = value
+            self.events.append((time.perf_counter(), pin, value))
+        for watcher in self._watchers:
+            watcher(pin, value)
+
+    def input(self, pin):
+        return self.pins.get(pin, self.LOW)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        with self._lock:
+            if pin in self._detect:
+                raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+            self._detect[pin] = [edge, [callback] if callback else [], False]
+
+    def add_event_callback(self, pin, callback):
+        with self._lock:
+            self._detect[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        with self._lock:
+            self._detect.pop(pin, None)
+
+    def event_detected(self, pin):
+        with self._lock:
+            detect = self._detect.get(pin)
+            if detect is None or not detect[2]:
+                return False
+            detect[2] = False
+            return True
+
+    def set_input(self, pin, value):
+        """Drive an input pin from outside, as a sensor would"""
+        value = int(bool(value))
+        with self._lock:
+            old = self.pins.get(pin, self.LOW)
+            self.pins[pin] = value
+            detect = self._detect.get(pin)
+            if detect is None or old == value:
+                return
+            edge = self.RISING if value else self.FALLING
+            if detect[0] not in (edge, self.BOTH):
+                return
+            detect[2] = True
+            callbacks = list(detect[1])
+        for callback in callbacks:
+            callback(pin)
+
+    def watch(self, listener):
+        """Call `listener(pin, value)` after every output()"""
+        self._watchers.append(listener)
+
+    def cleanup(self, *args):
+        with self._lock:
+            self.pins.clear()
+
+    def clear_events(self):
+        with self._lock:
+            self.events.clear()
+
+    def rising_edges(self, pin):
+        """Timestamps of every recorded LOW->HIGH transition on `pin`"""
+        with self._lock:
+            events = list(self.events)
+        return [t for t, p, v in events if p == pin and v == self.HIGH]
+
+    def pulse_intervals(self, pin):
+        edges = self.rising_edges(pin)
+        return [b - a for a, b in zip(edges, edges[1:])]
@@ -0,0 +1,134 @@
+"""
+Per-frame quality gate.
+
+A blurred or blown-out frame used to surface only when the scan was
+reviewed, costing a full re-scan.  Each fresh capture is now scored on a
+worker thread while the next camera shoots:
+
+  * decoded with IMREAD_REDUCED_GRAYSCALE_4, so libjpeg only does a 1/4
+    scale IDCT instead of decoding 16 MP;
+  * sharpness = the focus tool's laplacian on the centre ROI;
+  * clipping = fraction of pixels at the top / bottom of the range.
+
+Sharpness is judged against that camera's own recent passing frames (the
+subject and backdrop differ per camera, so no single absolute number
+works).  A frame must always clear an absolute floor that a defocused
+frame does not.  Until a camera has a history, every frame past the floor
+is held back as provisional, and once MIN_HISTORY of them agree with each
+other they become the history - so a soft first frame cannot drag the
+reference down.  Meanwhile the camera's in-focus score from focus
+calibration stands in as the reference; it is only a hint, since the
+calibration target may score higher than the scan subject ever can, and
+the history replaces it after a few frames either way.
+"""
+import statistics
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from focus_calibration import laplacian, prepare
+
+# a frame below this fraction of the camera's median sharpness is a retake
+SHARPNESS_RATIO = 0.5
+# absolute floor - a defocused frame scores a few units, an in-focus one
+# tens to hundreds
+MIN_SHARPNESS = 10.0
+MIN_HISTORY = 3
+HISTORY = 16
+
+# fraction of pixels allowed at >= 250 / <= 5; the white backdrop alone
+# clips about a quarter of camera 8's frame
+MAX_CLIPPED_HIGH = 0.6
+MAX_CLIPPED_LOW = 0.90
+
+
+def measure(path):
+    """Sharpness and clipping of the JPEG at `path` from a 1/4-scale decode"""
+    gray = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return None
+    pixels = gray.size
+    return {
+        'sharpness': round(laplacian(prepare(gray)), 3),
+        'clipped_high': round(float(np.count_nonzero(gray >= 250)) / pixels, 4),
+        'clipped_low': round(float(np.count_nonzero(gray <= 5)) / pixels, 4),
+    }
+
+
+class QualityGate:
+    """Scores frames on a small thread pool and remembers each camera's normal sharpness."""
+
+    def __init__(self, workers=2, references=None):
+        """`references`: {camera: in-focus sharpness}, e.g. focus_calibration.load_scores()"""
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quality")
+        self._lock = threading.Lock()
+        self._history = defaultdict(lambda: deque(maxlen=HISTORY))
+        self._provisional = defaultdict(list)  # past the floor before there is a history, not yet trusted
+        self._references = dict(references or {})
+        self.checked = 0
+        self.failed = 0
+
+    def submit(self, cam, path):
+        """Score `path` in the background; the Future resolves to check()'s result"""
+        return self._executor.submit(self.check, cam, path)
+
+    def check(self, cam, path):
+        """{'ok', 'reasons', 'sharpness', 'clipped_high', 'clipped_low'} for one frame"""
+        metrics = measure(path)
+        with self._lock:
+            history = self._history[cam]
+            seeded = len(history) >= MIN_HISTORY
+            reference = statistics.median(history) if seeded else self._references.get(cam)
+        if metrics is None:
+            result = {'ok': False, 'reasons': ['unreadable']}
+        else:
+            reasons = []
+            if metrics['sharpness'] < MIN_SHARPNESS:
+                reasons.append('blurred')
+            elif reference is not None and metrics['sharpness'] < SHARPNESS_RATIO * reference:
+                reasons.append('blurred')
+            if metrics['clipped_high'] > MAX_CLIPPED_HIGH:
+                reasons.append('overexposed')
+            if metrics['clipped_low'] > MAX_CLIPPED_LOW:
+                reasons.append('underexposed')
+            result = dict(metrics, ok=not reasons, reasons=reasons)
+            if reference is not None:
+                result['reference_sharpness'] = round(reference, 3)
+
+        with self._lock:
+            self.checked += 1
+            if not result['ok']:
+                self.failed += 1
+            if result['ok'] and seeded:
+                self._history[cam].append(result['sharpness'])
+            elif not seeded and result['reasons'] in ([], ['blurred']) \
+                    and result['sharpness'] >= MIN_SHARPNESS and len(self._history[cam]) < MIN_HISTORY:
+                # past the floor, even if the calibrated hint called it blurred
+                self._seed_locked(cam, result['sharpness'])
+        return result
+
+    def _seed_locked(self, cam, sharpness):
+        """Collect frames past the floor; the ones close to the sharpest of them start the history"""
+        provisional = self._provisional[cam]
+        provisional.append(sharpness)
+        if len(provisional) < MIN_HISTORY:
+            return
+        best = max(provisional)
+        self._history[cam].extend(s for s in provisional if s >= SHARPNESS_RATIO * best)
+        provisional.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'checked': self.checked,
+                'failed': self.failed,
+                'reference_sharpness': {
+                    f'cam{cam}': round(statistics.median(h), 3) for cam, h in self._history.items() if h
+                },
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,109 @@
+"""
+Single-file scan output.
+
+Hundreds of separate JPEGs on a FAT/exFAT stick cost a directory update
+and a cluster-chain allocation per file, and the workstation pays again
+when copying them off.  In `tar` output mode a scan is written instead as
+one uncompressed tar in the scan folder:
+
+  * each step's images are appended as plain members through a large
+    write buffer, so the stick sees long sequential writes;
+  * the file is fsync'd once per step rather than once per image;
+  * `index.json` is appended last, with the step, size, mtime and data
+    offset of every image - an image can be read straight out of the tar
+    with one seek;
+  * `close()` always writes the index and the end-of-archive blocks, so a
+    scan stopped early still leaves a valid archive.
+
+Only the scan stopping part-way through an image (the stick pulled
+mid-write) leaves a truncated tar; every member before it still extracts.
+An archive is never opened over an existing file: a scan that reuses a
+folder name writes `<scan>_2.tar` (then `_3`, ...) next to the earlier one.
+"""
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+
+WRITE_BUFFER = 4 * 1024 * 1024
+INDEX_NAME = 'index.json'
+MAX_ARCHIVES = 100  # per scan folder
+
+
+class ScanArchive:
+    """Store-only tar in a scan folder, appended to one step at a time."""
+
+    def __init__(self, path, scan_name=None):
+        """Create the archive at `path`; FileExistsError rather than overwrite one"""
+        self.path = path
+        self.scan_name = scan_name or os.path.splitext(os.path.basename(path))[0]
+        self.index = []
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'xb', buffering=WRITE_BUFFER)
+        self._tar = tarfile.open(fileobj=self._file, mode='w', format=tarfile.PAX_FORMAT,
+                                 copybufsize=WRITE_BUFFER)
+        self._closed = False
+
+    @classmethod
+    def for_scan(cls, scan_folder, scan_name):
+        """`<scan>.tar` in `scan_folder`, or the first free `<scan>_<n>.tar` if a scan already wrote it"""
+        for n in range(1, MAX_ARCHIVES + 1):
+            name = f"{scan_name}.tar" if n == 1 else f"{scan_name}_{n}.tar"
+            try:
+                return cls(os.path.join(scan_folder, name), scan_name)
+            except FileExistsError:
+                continue
+        raise FileExistsError(f"{MAX_ARCHIVES} archives already in {scan_folder}")
+
+    def add_step(self, step, paths):
+        """Append the files at `paths` as one step; returns bytes written"""
+        written = 0
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"archive {self.path} is closed")
+            for path in paths:
+                name = os.path.basename(path)
+                info = self._tar.gettarinfo(path, arcname=name)
+                with open(path, 'rb') as f:
+                    self._tar.addfile(info, f)
+                # addfile leaves the offset just past the padded data
+                offset = self._tar.offset - -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                self.index.append({'name': name, 'step': step, 'size': info.size,
+                                   'mtime': info.mtime, 'offset': offset})
+                written += info.size
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.bytes += written
+        return written
+
+    def close(self):
+        """Write the index and the end-of-archive marker; safe to call twice"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            try:
+                data = json.dumps({'scan': self.scan_name, 'closed_at': time.time(),
+                                   'images': self.index}, indent=1).encode()
+                info = tarfile.TarInfo(INDEX_NAME)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                self._tar.addfile(info, io.BytesIO(data))
+                self._tar.close()
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            finally:
+                self._file.close()
+
+    def stats(self):
+        with self._lock:
+            return {'path': self.path, 'images': len(self.index), 'bytes': self.bytes}
+
+
+def read_index(path):
+    """The index of a closed scan archive"""
+    with tarfile.open(path, 'r') as tar:
+        return json.load(tar.extractfile(INDEX_NAME))
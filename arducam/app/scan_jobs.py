@@ -0,0 +1,225 @@
+"""
+Background scan jobs.
+
+POST /rotate used to run the whole scan inside the HTTP request, with the
+scan's state in module globals and no way to stop it short of killing the
+server.  Scans are now jobs:
+
+  * `submit()` returns a job with an id straight away; jobs run one at a
+    time, in order, on a dedicated worker thread;
+  * a job's `run(job)` does the capture and returns a `finish()` callable -
+    draining the USB stage, reconciling or closing the archive - which runs
+    on a separate post-processing thread, so the next queued job starts
+    capturing while the previous one is still being finished;
+  * `cancel()` drops a queued job at once, and asks a running one to stop
+    at the next step boundary (`job.cancel_requested`); its images so far
+    are still finished normally.  A job past capture is not cancelled;
+  * every job can be inspected while queued, running and for a while after.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHING = 'finishing'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+TERMINAL = (DONE, CANCELLED, FAILED)
+
+# finished jobs kept for inspection
+HISTORY = 50
+
+
+class ScanJob:
+    """One scan request and everything known about it so far."""
+
+    def __init__(self, params):
+        self.id = uuid.uuid4().hex[:12]
+        self.params = dict(params)
+        self.state = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.captured_at = None
+        self.finished_at = None
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def update(self, **progress):
+        self.progress.update(progress)
+
+    def wait(self, timeout=None):
+        """Block until the job is done, cancelled or failed; True if it is"""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'state': self.state,
+            'params': self.params,
+            'progress': dict(self.progress),
+            'cancel_requested': self.cancel_requested,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'captured_at': self.captured_at,
+            'finished_at': self.finished_at,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class ScanJobQueue:
+    """FIFO of scan jobs with one capture worker and one post-processing worker."""
+
+    def __init__(self, run, on_change=None, history=HISTORY):
+        """`run(job)` captures and returns finish() -> result; `on_change(job)` sees every state change"""
+        self._run = run
+        self._on_change = on_change
+        self._history = history
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._jobs = OrderedDict()  # id -> job, oldest first
+        self._closed = False
+        self.current = None
+        self._post = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scan-post")
+        self._worker = threading.Thread(target=self._loop, name="scan-worker", daemon=True)
+        self._worker.start()
+
+    def submit(self, params):
+        job = ScanJob(params)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("scan queue is closed")
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._trim_locked()
+            self._cond.notify()
+        self._changed(job)
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job or stop a running one at its next step; None if
+        unknown.  A job already finishing has captured everything and is
+        left to complete.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.state in TERMINAL or job.state == FINISHING:
+                return job
+            job._cancel.set()
+            queued = job.state == QUEUED
+            if queued:
+                self._pending.remove(job)
+                job.state = CANCELLED
+                job.finished_at = time.time()
+                job._done.set()
+        self._changed(job)
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def busy(self):
+        """True while any job is queued, capturing or being finished"""
+        with self._cond:
+            return any(job.state not in TERMINAL for job in self._jobs.values())
+
+    def position(self, job):
+        """Jobs ahead of `job` in the queue (0 = next), None once it has started"""
+        with self._cond:
+            try:
+                return list(self._pending).index(job)
+            except ValueError:
+                return None
+
+    def _trim_locked(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.state in TERMINAL]
+        for job_id in finished[:max(0, len(finished) - self._history)]:
+            del self._jobs[job_id]
+
+    def _changed(self, job):
+        if self._on_change is not None:
+            try:
+                self._on_change(job)
+            except Exception as e:
+                print(f"Scan job listener failed: {e}")
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                job = self._pending.popleft()
+                job.state = RUNNING
+                job.started_at = time.time()
+                self.current = job
+            self._changed(job)
+
+            try:
+                finish = self._run(job)
+            except Exception as e:
+                print(f"Scan job {job.id} failed: {e}")
+                # e.g. cancelled while still waiting for the hardware
+                self._end(job, CANCELLED if job.cancel_requested else FAILED, error=str(e))
+                continue
+            finally:
+                with self._cond:
+                    self.current = None
+
+            job.state = FINISHING
+            job.captured_at = time.time()
+            self._changed(job)
+            self._post.submit(self._finish, job, finish)
+
+    def _finish(self, job, finish):
+        try:
+            result = finish()
+        except Exception as e:
+            print(f"Scan job {job.id} failed while finishing: {e}")
+            self._end(job, FAILED, error=str(e))
+            return
+        self._end(job, CANCELLED if job.cancel_requested else DONE, result=result)
+
+    def _end(self, job, state, result=None, error=None):
+        with self._cond:
+            job.result = result
+            job.error = error
+            job.state = state
+            job.finished_at = time.time()
+            self._trim_locked()
+        job._done.set()
+        self._changed(job)
+
+    def close(self, timeout=None):
+        """Stop taking jobs, cancel queued ones and let the running one stop at its next step"""
+        with self._cond:
+            self._closed = True
+            pending = list(self._pending)
+            current = self.current
+            self._cond.notify_all()
+        for job in pending:
+            self.cancel(job.id)
+        if current is not None:
+            current._cancel.set()
+        self._worker.join(timeout)
+        self._post.shutdown(wait=True)
@@ -0,0 +1,198 @@
+"""
+Per-scan manifest and USB reconciliation.
+
+The USB stage used to skip a file whenever `os.path.exists(dest)` - so a
+half-written file left by a yanked stick counted as done, and a file whose
+step found the stick missing was never sent.  Each scan now keeps a
+manifest on the Pi recording, per image, the source size / mtime, a fast
+content hash, and the size / mtime the copy had on the stick right after
+it was written.
+
+`reconcile()` brings a stick back in line:
+  * a copy whose size and mtime still match what was recorded is trusted
+    without reading it, so a resync only touches what changed;
+  * anything else is hashed (in parallel) and re-copied from the Pi if it
+    is missing or differs;
+  * `verify=True` hashes every copy regardless.
+
+Copies are written to `<name>.part`, flushed and renamed, so a file under
+its final name is always complete.  Files ingested straight onto the stick
+(remote uploads during a scan) have no copy on the Pi; if one of those is
+lost it is reported as unrecoverable.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xxhash
+except ImportError:  # pip install xxhash; blake2b is slower but always there
+    xxhash = None
+
+HASH_NAME = 'xxh3_64' if xxhash is not None else 'blake2b'
+CHUNK = 1024 * 1024
+VERIFY_WORKERS = 4
+
+
+def new_hasher(name=HASH_NAME):
+    if name == 'xxh3_64':
+        if xxhash is None:
+            raise RuntimeError("manifest uses xxh3_64 but xxhash is not installed")
+        return xxhash.xxh3_64()
+    return hashlib.blake2b(digest_size=16)
+
+
+def file_hash(path, name=HASH_NAME):
+    h = new_hasher(name)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def copy_with_hash(src, dest, name=HASH_NAME):
+    """Copy via `dest`.part + fsync + rename, hashing on the way; returns (size, digest)"""
+    h = new_hasher(name)
+    part = dest + '.part'
+    size = 0
+    with open(src, 'rb') as fsrc, open(part, 'wb') as fdst:
+        while True:
+            chunk = fsrc.read(CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+            fdst.write(chunk)
+            size += len(chunk)
+        fdst.flush()
+        os.fsync(fdst.fileno())
+    os.replace(part, dest)
+    return size, h.hexdigest()
+
+
+class ScanManifest:
+    """name -> {size, mtime, hash, source, step, copied} for one scan, saved as JSON."""
+
+    def __init__(self, path, scan_name):
+        self.path = path
+        self.scan_name = scan_name
+        self.hash_name = HASH_NAME
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.hash_name = data.get('hash', HASH_NAME)
+            self.entries = data.get('files', {})
+
+    @classmethod
+    def for_scan(cls, manifest_dir, scan_name):
+        os.makedirs(manifest_dir, exist_ok=True)
+        return cls(os.path.join(manifest_dir, f"{scan_name}.json"), scan_name)
+
+    def record(self, name, size, mtime, digest=None, source=None, step=None):
+        """Register an image of the scan (not yet on the stick)"""
+        with self._lock:
+            entry = self.entries.setdefault(name, {})
+            entry.update(size=size, mtime=mtime, hash=digest, source=source, step=step)
+            entry.setdefault('copied', None)
+
+    def mark_copied(self, name, dest):
+        """Remember the stick copy's size / mtime as they are right after writing"""
+        st = os.stat(dest)
+        with self._lock:
+            self.entries[name]['copied'] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    def pending(self):
+        """Images that have never reached the stick"""
+        with self._lock:
+            return [name for name, entry in self.entries.items() if entry.get('copied') is None]
+
+    def to_dict(self):
+        with self._lock:
+            return {'scan': self.scan_name, 'hash': self.hash_name,
+                    'files': {name: dict(entry) for name, entry in self.entries.items()}}
+
+    def save(self, path=None):
+        path = path or self.path
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+
+def copy_entry(manifest, name, scan_folder, src=None):
+    """Copy one manifest image from its source on the Pi (or `src`, a staged copy of it) to the stick"""
+    entry = manifest.entries[name]
+    dest = os.path.join(scan_folder, name)
+    size, digest = copy_with_hash(src or entry['source'], dest, manifest.hash_name)
+    manifest.record(name, size, entry['mtime'], digest, entry['source'], entry.get('step'))
+    manifest.mark_copied(name, dest)
+    return size
+
+
+def reconcile(manifest, scan_folder, verify=False, workers=VERIFY_WORKERS):
+    """
+    Make `scan_folder` match `manifest`: copy missing files, re-copy corrupt
+    ones.  Returns a report of what was checked and what was done.
+    """
+    start = time.perf_counter()
+    report = {'checked': 0, 'trusted': 0, 'hashed': 0, 'copied': [], 'recopied': [], 'bytes': 0,
+              'unrecoverable': [], 'errors': {}}
+
+    # leftovers of copies interrupted mid-write
+    for leftover in (f for f in os.listdir(scan_folder) if f.endswith('.part')):
+        os.remove(os.path.join(scan_folder, leftover))
+
+    lock = threading.Lock()
+    to_hash = []
+    for name, entry in manifest.to_dict()['files'].items():
+        report['checked'] += 1
+        dest = os.path.join(scan_folder, name)
+        try:
+            st = os.stat(dest)
+        except FileNotFoundError:
+            st = None
+        copied = entry.get('copied')
+        if st is None:
+            to_hash.append((name, entry, None))
+        elif not verify and copied and st.st_size == copied['size'] and st.st_mtime_ns == copied['mtime_ns']:
+            report['trusted'] += 1
+        else:
+            to_hash.append((name, entry, dest))
+
+    def check(item):
+        name, entry, dest = item
+        if dest is not None and entry.get('hash'):
+            with lock:
+                report['hashed'] += 1
+            if file_hash(dest, manifest.hash_name) == entry['hash']:
+                manifest.mark_copied(name, dest)
+                return
+        if not entry.get('source') or not os.path.exists(entry['source']):
+            with lock:
+                report['unrecoverable'].append(name)
+            return
+        copy_entry(manifest, name, scan_folder)
+        with lock:
+            report['recopied' if dest is not None else 'copied'].append(name)
+            report['bytes'] += entry.get('size') or 0
+
+    def guarded(item):
+        try:
+            check(item)
+        except OSError as e:
+            with lock:
+                report['errors'][item[0]] = str(e)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="manifest") as pool:
+        list(pool.map(guarded, to_hash))
+
+    manifest.save()
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    return report
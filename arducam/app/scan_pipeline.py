@@ -0,0 +1,115 @@
+"""
+Staged scan pipeline.
+
+The scan loop used to run capture -> USB copy -> rotate strictly in order,
+so the motor sat idle during copies and the USB stick sat idle during
+motion.  Work that does not need the carousel to be still (USB transfer)
+is handed to downstream stages that each run on their own thread, fed by
+bounded queues:
+
+    scan loop (capture, rotate) --q--> usb stage --q--> ...
+
+Each stage is a single worker draining a FIFO, so steps leave every stage
+in the order they were submitted.  A full queue blocks `submit()`, which
+throttles the scan loop instead of letting the backlog grow without bound.
+A stage that raises does not stop the pipeline: the error is kept, and the
+scan loop collects it with `take_errors()` to report it.
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+_STOP = object()
+
+
+class StageTimer:
+    """Collects per-stage durations and summarises them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self):
+        with self._lock:
+            return {
+                stage: {
+                    'count': len(samples),
+                    'total_s': round(sum(samples), 3),
+                    'mean_s': round(sum(samples) / len(samples), 3),
+                    'max_s': round(max(samples), 3),
+                }
+                for stage, samples in self._samples.items() if samples
+            }
+
+
+class ScanPipeline:
+    """Chain of single-threaded stages joined by bounded queues."""
+
+    def __init__(self, stages, maxsize=2, timer=None):
+        """`stages` is a list of (name, fn); fn(step, item) returns the item for the next stage"""
+        self.timer = timer or StageTimer()
+        self.errors = []
+        self.completed = []
+        self._reported = 0
+        self._lock = threading.Lock()
+        self._queues = [queue.Queue(maxsize=maxsize) for _ in stages]
+        self._threads = []
+        for index, (name, fn) in enumerate(stages):
+            t = threading.Thread(target=self._run_stage, args=(index, name, fn),
+                                 name=f"scan-{name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _run_stage(self, index, name, fn):
+        inbox = self._queues[index]
+        outbox = self._queues[index + 1] if index + 1 < len(self._queues) else None
+        while True:
+            job = inbox.get()
+            if job is _STOP:
+                if outbox is not None:
+                    outbox.put(_STOP)
+                return
+            step, item = job
+            start = time.perf_counter()
+            try:
+                result = fn(step, item)
+            except Exception as e:
+                print(f"[{name}] step {step} failed: {e}")
+                with self._lock:
+                    self.errors.append({'stage': name, 'step': step, 'message': str(e)})
+                result = item
+            self.timer.record(name, time.perf_counter() - start)
+            if outbox is not None:
+                outbox.put((step, result))
+            else:
+                self.completed.append(step)
+
+    def submit(self, step, item):
+        """Queue `item` for step `step`; blocks while the first stage is backed up"""
+        self._queues[0].put((step, item))
+
+    def take_errors(self):
+        """Stage errors raised since the last call"""
+        with self._lock:
+            errors = self.errors[self._reported:]
+            self._reported = len(self.errors)
+        return errors
+
+    def close(self, timeout=None):
+        """Flush every stage and stop the workers"""
+        self._queues[0].put(_STOP)
+        for t in self._threads:
+            t.join(timeout)
@@ -0,0 +1,183 @@
+"""
+RAM staging for scan images.
+
+Every capture used to land on the SD card (IMAGE_DIR) and be read back off
+it by the USB stage - two passes over the card per image, on the same slow
+bus as the stick.  With a staging directory on tmpfs (`STAGING_DIR`, e.g.
+/dev/shm/arducam) a scan's images never touch the card on the happy path:
+
+  * local captures and /upload bodies received during a scan are written
+    to the staging directory;
+  * the bytes held there are capped by a budget - before each step the
+    scan loop reserves room for the step's images and waits (backpressure)
+    while the USB writer is behind, instead of letting RAM run out;
+  * the USB writer releases each image once its copy is on the stick;
+  * whatever it cannot deliver (stick pulled, copy failed) and whatever is
+    still staged at shutdown is spilled to the SD card, where the
+    manifest's resync picks it up; a staging directory left behind by a
+    crash is spilled when the next ring opens on it.
+"""
+import os
+import shutil
+import threading
+import time
+
+# assumed per-image size until the ring has seen real files
+IMAGE_ESTIMATE = 6 * 1024 * 1024
+
+
+def spill_file(src, dest):
+    """Move `src` to `dest` on another filesystem; `dest` only appears once complete"""
+    part = dest + '.part'
+    shutil.copy2(src, part)
+    with open(part, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(part, dest)
+    os.remove(src)
+
+
+class StagingRing:
+    """Budgeted staging directory: reserve(), claim() + add(), release() or spill()."""
+
+    def __init__(self, root, budget, spill_dir):
+        self.root = root
+        self.budget = budget
+        self.spill_dir = spill_dir
+        self._cond = threading.Condition()
+        self._files = {}  # name -> size
+        self._used = 0
+        self._reserved = 0
+        self._added = 0
+        self._added_bytes = 0
+        self.peak = 0
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.spilled = 0
+        os.makedirs(root, exist_ok=True)
+        leftovers = [name for name in os.listdir(root) if not name.endswith('.part')]
+        for name in leftovers:
+            self._files[name] = os.path.getsize(os.path.join(root, name))
+            self._used += self._files[name]
+        if leftovers:
+            print(f"Spilling {len(leftovers)} images left in {root}")
+            self.spill(leftovers)
+
+    def path(self, name):
+        """Where `name` is written when staged"""
+        return os.path.join(self.root, name)
+
+    def locate(self, name):
+        """Path of `name` if it is staged, else None"""
+        with self._cond:
+            return self.path(name) if name in self._files else None
+
+    def __contains__(self, name):
+        with self._cond:
+            return name in self._files
+
+    def image_estimate(self):
+        """Mean size of the images staged so far"""
+        with self._cond:
+            return self._added_bytes // self._added if self._added else IMAGE_ESTIMATE
+
+    def claim(self, nbytes):
+        """
+        Take `nbytes` of the budget for a file about to be written; False
+        (write it elsewhere) if they do not fit.  Hand the same figure to
+        add() once written, or to unclaim() if the write failed.
+        """
+        with self._cond:
+            if self._used + nbytes > self.budget:
+                return False
+            self._used += nbytes
+            self._reserved = max(0, self._reserved - nbytes)
+            self.peak = max(self.peak, self._used)
+            return True
+
+    def unclaim(self, nbytes):
+        with self._cond:
+            self._used -= nbytes
+            self._cond.notify_all()
+
+    def reserve(self, nbytes, should_stop=None):
+        """
+        Wait until `nbytes` fit beside what is staged and hold them for the
+        images about to be added; False if `should_stop()` turned true first.
+        An empty ring always admits, so a budget below one step still moves.
+        """
+        started = None
+        with self._cond:
+            while self._used and self._used + self._reserved + nbytes > self.budget:
+                if should_stop is not None and should_stop():
+                    return False
+                if started is None:
+                    started = time.perf_counter()
+                    self.stalls += 1
+                self._cond.wait(0.5)
+            self._reserved += nbytes
+            if started is not None:
+                self.stall_seconds += time.perf_counter() - started
+        return True
+
+    def unreserve(self):
+        """Drop whatever is left of the reservation"""
+        with self._cond:
+            self._reserved = 0
+            self._cond.notify_all()
+
+    def add(self, name, claimed=0):
+        """Account for a file just written to path(name) under a claim() of `claimed`; returns its size"""
+        size = os.path.getsize(self.path(name))
+        with self._cond:
+            self._used += size - claimed - self._files.get(name, 0)
+            self._files[name] = size
+            self._added += 1
+            self._added_bytes += size
+            self.peak = max(self.peak, self._used)
+        return size
+
+    def release(self, name):
+        """Delete a staged file (delivered, or discarded)"""
+        with self._cond:
+            size = self._files.pop(name, None)
+            if size is None:
+                return
+            self._used -= size
+            self._cond.notify_all()
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def spill(self, names=None):
+        """Move staged files (all by default) to spill_dir; returns the names moved"""
+        with self._cond:
+            names = list(self._files) if names is None else [n for n in names if n in self._files]
+        if not names:
+            return []
+        os.makedirs(self.spill_dir, exist_ok=True)
+        moved = []
+        for name in names:
+            try:
+                spill_file(self.path(name), os.path.join(self.spill_dir, name))
+            except Exception as e:
+                print(f"Error spilling {name}: {e}")
+                continue
+            with self._cond:
+                self._used -= self._files.pop(name, 0)
+                self.spilled += 1
+                self._cond.notify_all()
+            moved.append(name)
+        return moved
+
+    def stats(self):
+        with self._cond:
+            return {'dir': self.root, 'budget': self.budget, 'used': self._used, 'reserved': self._reserved,
+                    'files': len(self._files), 'peak': self.peak, 'stalls': self.stalls,
+                    'stall_s': round(self.stall_seconds, 3), 'spilled': self.spilled}
+
+    def close(self):
+        """Spill everything still staged"""
+        moved = self.spill()
+        if moved:
+            print(f"Spilled {len(moved)} staged images to {self.spill_dir}")
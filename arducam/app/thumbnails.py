@@ -0,0 +1,133 @@
+"""
+On-disk thumbnail cache for the dashboard.
+
+The diagnostics page used to point <img> tags straight at the 4656x3496
+captures, so every refresh pulled megabytes over Wi-Fi while the Pi was
+scanning.  Thumbnails are made on a single background worker with
+IMREAD_REDUCED_COLOR_8 (libjpeg's 1/8-scale IDCT - it never builds the
+full-size bitmap), shrunk to THUMB_WIDTH and kept in a directory capped at
+`max_bytes`, least recently used evicted first.
+
+A thumbnail is current while its mtime is not older than the source's, so
+an image overwritten in place (a retake within the same second) is
+re-rendered on the next request.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+THUMB_WIDTH = 320
+THUMB_QUALITY = 75
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def make_thumbnail(src_path, dest_path, width=THUMB_WIDTH, quality=THUMB_QUALITY):
+    """Write a `width`-wide JPEG thumbnail of `src_path`; returns its size in bytes"""
+    img = cv2.imread(src_path, cv2.IMREAD_REDUCED_COLOR_8)
+    if img is None:
+        raise ValueError(f"cannot decode {src_path}")
+    h, w = img.shape[:2]
+    if w > width:
+        img = cv2.resize(img, (width, max(1, h * width // w)), interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError(f"cannot encode thumbnail of {src_path}")
+    tmp = dest_path + '.part'
+    with open(tmp, 'wb') as f:
+        f.write(data.tobytes())
+    os.replace(tmp, dest_path)
+    return len(data)
+
+
+class ThumbnailCache:
+    """Size-capped LRU of thumbnails in `cache_dir`, rendered on a worker thread."""
+
+    def __init__(self, cache_dir, max_bytes=MAX_CACHE_BYTES, width=THUMB_WIDTH):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.width = width
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # name -> bytes, least recently used first
+        self._total = 0
+        self._inflight = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnail")
+        self._load()
+
+    def _load(self):
+        """Adopt thumbnails left by a previous run, oldest first"""
+        names = [f for f in os.listdir(self.cache_dir) if f.endswith('.jpg')]
+        names.sort(key=lambda f: os.path.getmtime(os.path.join(self.cache_dir, f)))
+        for name in names:
+            size = os.path.getsize(os.path.join(self.cache_dir, name))
+            self._entries[name] = size
+            self._total += size
+        with self._lock:
+            self._evict_locked()
+
+    def path_for(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _is_current(self, src_path, name):
+        try:
+            return os.path.getmtime(self.path_for(name)) >= os.path.getmtime(src_path)
+        except OSError:
+            return False
+
+    def prefetch(self, src_path, name):
+        """Queue a thumbnail for `name`; returns a Future resolving to its path"""
+        with self._lock:
+            future = self._inflight.get(name)
+            if future is None:
+                future = self._executor.submit(self._render, src_path, name)
+                self._inflight[name] = future
+            return future
+
+    def get(self, src_path, name, timeout=10):
+        """Path of an up-to-date thumbnail of `src_path`, rendering it if needed"""
+        if self._is_current(src_path, name):
+            with self._lock:
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+            return self.path_for(name)
+        return self.prefetch(src_path, name).result(timeout)
+
+    def _render(self, src_path, name):
+        try:
+            if not self._is_current(src_path, name):
+                size = make_thumbnail(src_path, self.path_for(name), self.width)
+                with self._lock:
+                    self._total += size - self._entries.pop(name, 0)
+                    self._entries[name] = size
+                    self._evict_locked(keep=name)
+            return self.path_for(name)
+        finally:
+            with self._lock:
+                self._inflight.pop(name, None)
+
+    def _evict_locked(self, keep=None):
+        while self._total > self.max_bytes and self._entries:
+            name = next(iter(self._entries))
+            if name == keep:
+                break
+            self._total -= self._entries.pop(name)
+            try:
+                os.remove(self.path_for(name))
+            except FileNotFoundError:
+                pass
+
+    def discard(self, name):
+        with self._lock:
+            if name in self._entries:
+                self._total -= self._entries.pop(name)
+        try:
+            os.remove(self.path_for(name))
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {'thumbnails': len(self._entries), 'bytes': self._total, 'max_bytes': self.max_bytes}
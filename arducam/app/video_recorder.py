@@ -0,0 +1,240 @@
+"""
+Streaming MP4 recording for /rotateAndRecord.
+
+The route used to record raw H.264 to the SD card with `libcamera-vid -t 0`,
+stop it, then hold the request while `ffmpeg -c:v copy` remuxed the whole
+file into an MP4 and deleted the raw one - every video written twice, the
+remux on the request, and a recording cut short left only a bare elementary
+stream.  Now libcamera-vid writes H.264 to a pipe (`-o -`, headers inline)
+and an ffmpeg muxer on the other end writes the MP4 as it arrives:
+
+  * the MP4 is fragmented (`frag_keyframe+empty_moov`): the moov box goes
+    first and every keyframe starts a fragment, so the file plays and seeks
+    at any point - a killed recorder or a pulled plug loses at most the
+    last fragment (one second at the default keyframe interval);
+  * `stop()` ends the camera; the muxer sees the end of the pipe and
+    flushes its last fragment on its own, so the caller returns as soon as
+    the motion ends and only `wait()` blocks on the finished file.
+
+For continuous scans the recording also keeps what is needed to line
+frames up with the motor's step timeline: the perf_counter time the first
+frame came down the pipe, and libcamera's per-frame timestamps
+(`--save-pts`).  `extract_frames()` then pulls chosen frames out as JPEGs
+in a single decoding pass.
+"""
+import bisect
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+WIDTH = 1920
+HEIGHT = 1080
+FRAMERATE = 30
+LENS_POSITION = 6.0
+# one keyframe, hence one MP4 fragment, per second
+KEYFRAME_INTERVAL = FRAMERATE
+MOVFLAGS = 'frag_keyframe+empty_moov+default_base_moof'
+# camera stop and muxer flush; past this they are killed
+STOP_TIMEOUT = 10
+# camera start-up until the first frame is on the pipe
+START_TIMEOUT = 10
+# a frame reaches the pipe about one frame interval after its exposure
+FRAME_LATENCY = 1.0 / FRAMERATE
+PIPE_CHUNK = 64 * 1024
+
+
+def camera_command(width=WIDTH, height=HEIGHT, framerate=FRAMERATE, lens_position=LENS_POSITION,
+                   intra=KEYFRAME_INTERVAL, pts_path=None):
+    """libcamera-vid writing H.264 with inline headers to stdout until stopped"""
+    cmd = ["libcamera-vid", "-t", "0",
+           "--lens-position", str(lens_position),
+           "--viewfinder-width", str(width), "--viewfinder-height", str(height),
+           "--framerate", str(framerate), "--intra", str(intra), "--inline"]
+    if pts_path:
+        cmd += ["--save-pts", pts_path]
+    return cmd + ["-o", "-"]
+
+
+def muxer_command(path, framerate=FRAMERATE):
+    """ffmpeg copying H.264 from stdin into a fragmented MP4 at `path`"""
+    return ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "h264", "-framerate", str(framerate), "-i", "pipe:0",
+            "-c:v", "copy", "-an", "-movflags", MOVFLAGS, "-f", "mp4", path]
+
+
+def read_pts(path):
+    """Frame times in seconds from the first frame, from a `--save-pts` (timecode v2) file"""
+    with open(path) as f:
+        stamps = [float(line) / 1000.0 for line in f if line.strip() and not line.startswith('#')]
+    return [t - stamps[0] for t in stamps] if stamps else []
+
+
+def nearest_frame(frame_times, t):
+    """Index of the frame whose time is closest to `t`"""
+    i = bisect.bisect_left(frame_times, t)
+    if i == 0:
+        return 0
+    if i == len(frame_times):
+        return len(frame_times) - 1
+    return i if frame_times[i] - t < t - frame_times[i - 1] else i - 1
+
+
+def extract_frames(video, frames, paths, quality=2):
+    """Decode `video` once and write frame number frames[i] to paths[i] as JPEG"""
+    wanted = sorted(set(frames))
+    select = '+'.join(f'eq(n\\,{n})' for n in wanted)
+    workdir = tempfile.mkdtemp(prefix='frames_', dir=os.path.dirname(paths[0]) or None)
+    try:
+        subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", video,
+                        "-vf", f"select='{select}'", "-vsync", "0", "-q:v", str(quality),
+                        os.path.join(workdir, "%06d.jpg")], check=True, capture_output=True)
+        # outputs are numbered 1.. in frame order
+        extracted = {n: os.path.join(workdir, f"{i + 1:06d}.jpg") for i, n in enumerate(wanted)}
+        for n, path in zip(frames, paths):
+            shutil.copyfile(extracted[n], path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class Recording:
+    """One camera -> muxer pipeline writing `path`."""
+
+    def __init__(self, path, camera_cmd, muxer_cmd, on_done=None, pts_path=None):
+        self.path = path
+        self.pts_path = pts_path
+        self.started_at = None
+        self.first_frame_at = None  # perf_counter time the first bytes came down the pipe
+        self.stopped_at = None
+        self.finished_at = None
+        self.result = None
+        self._on_done = on_done
+        self._streaming = threading.Event()
+        self._done = threading.Event()
+        self.muxer = subprocess.Popen(muxer_cmd, stdin=subprocess.PIPE,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            self.camera = subprocess.Popen(camera_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except Exception:
+            self.muxer.kill()
+            self.muxer.wait()
+            raise
+        self.started_at = time.time()
+        # copied through here rather than handed over, to see when frames start
+        self._pipe = threading.Thread(target=self._forward, name="video-pipe", daemon=True)
+        self._pipe.start()
+
+    def _forward(self):
+        try:
+            while True:
+                chunk = self.camera.stdout.read1(PIPE_CHUNK)
+                if not chunk:
+                    break
+                if self.first_frame_at is None:
+                    self.first_frame_at = time.perf_counter()
+                    self._streaming.set()
+                self.muxer.stdin.write(chunk)
+        except (BrokenPipeError, ValueError) as e:
+            print(f"Video pipe closed early: {e}")
+        finally:
+            self._streaming.set()
+            self.camera.stdout.close()
+            try:
+                self.muxer.stdin.close()  # EOF: the muxer writes its last fragment
+            except BrokenPipeError:
+                pass
+
+    def wait_streaming(self, timeout=START_TIMEOUT):
+        """True once the camera's first frame is on the pipe"""
+        self._streaming.wait(timeout)
+        return self.first_frame_at is not None
+
+    def stop(self):
+        """Stop the camera and let the muxer finish in the background; returns at once"""
+        if self.stopped_at is not None:
+            return
+        self.stopped_at = time.time()
+        if self.camera.poll() is None:
+            self.camera.terminate()
+        threading.Thread(target=self._finish, name="video-mux", daemon=True).start()
+
+    def _finish(self):
+        self._pipe.join(STOP_TIMEOUT)
+        for proc in (self.camera, self.muxer):
+            try:
+                proc.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                print(f"{proc.args[0]} did not exit, killing it")
+                proc.kill()
+                proc.wait()
+        errors = self.muxer.stderr.read().decode(errors='replace').strip()
+        self.muxer.stderr.close()
+        self.finished_at = time.time()
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.result = {
+            'video': self.path,
+            'ok': self.muxer.returncode == 0 and size > 0,
+            'bytes': size,
+            'seconds': round(self.stopped_at - self.started_at, 3),
+            'finalise_s': round(self.finished_at - self.stopped_at, 3),
+            'error': errors or None,
+        }
+        self._done.set()
+        if self._on_done is not None:
+            try:
+                self._on_done(self.result)
+            except Exception as e:
+                print(f"Video listener failed: {e}")
+
+    def wait(self, timeout=None):
+        """The result once the MP4 is finalised, or None on timeout"""
+        self._done.wait(timeout)
+        return self.result
+
+    @property
+    def finishing(self):
+        return self.stopped_at is not None and not self._done.is_set()
+
+
+class VideoRecorder:
+    """Starts recordings and keeps the ones whose muxer is still flushing."""
+
+    def __init__(self, width=WIDTH, height=HEIGHT, framerate=FRAMERATE, lens_position=LENS_POSITION,
+                 on_done=None, camera_cmd=camera_command, muxer_cmd=muxer_command, extractor=extract_frames):
+        """`camera_cmd` / `muxer_cmd` build the two commands and `extractor` pulls frames (swapped by the simulator)"""
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.lens_position = lens_position
+        self.on_done = on_done
+        self.camera_cmd = camera_cmd
+        self.muxer_cmd = muxer_cmd
+        self.extract = extractor
+        self._lock = threading.Lock()
+        self._recordings = []
+
+    def start(self, path, lens_position=None, pts_path=None, on_done=None):
+        """Start recording to `path`; `pts_path` also saves each frame's timestamp"""
+        camera_cmd = self.camera_cmd(width=self.width, height=self.height, framerate=self.framerate,
+                                     lens_position=self.lens_position if lens_position is None else lens_position,
+                                     pts_path=pts_path)
+        recording = Recording(path, camera_cmd, self.muxer_cmd(path, self.framerate),
+                              on_done or self.on_done, pts_path)
+        with self._lock:
+            self._recordings = [r for r in self._recordings if r.result is None] + [recording]
+        return recording
+
+    def finishing(self):
+        with self._lock:
+            return [r.path for r in self._recordings if r.finishing]
+
+    def close(self, timeout=STOP_TIMEOUT):
+        """Stop anything still recording and wait for the muxers"""
+        with self._lock:
+            recordings = list(self._recordings)
+        for recording in recordings:
+            recording.stop()
+        for recording in recordings:
+            recording.wait(timeout)
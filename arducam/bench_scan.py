@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+End-to-end scan benchmark against the simulated rig (app/hardware_sim.py)
+
+Runs the real main.py app with ARDUCAM_SIMULATE=1 on a local port, starts a
+stub secondary Pi, drives POST /rotate for a scan and reports seconds per
+step plus the per-stage breakdown returned by the scan loop.  The remote is
+triggered over the command channel unless --http is given; --nodes N runs
+N stub capture nodes to see how step time scales.
+
+    python bench_scan.py --steps 8
+    python bench_scan.py --steps 64 --capture-latency 0.5 --json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# Add the app directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+
+def run_benchmark(steps=8, capture_latency=None, jpeg_bytes=None, keep=False, http=False, nodes=1, blur_rate=None,
+                  output_mode='files', staging_mb=None, continuous=False, home=True):
+    """Run one simulated scan of `steps` carousel positions and return the report"""
+    workdir = tempfile.mkdtemp(prefix='arducam_bench_')
+    usb_dir = os.path.join(workdir, 'usb')
+    os.makedirs(usb_dir)
+    os.environ.update({
+        'ARDUCAM_SIMULATE': '1',
+        'ARDUCAM_IMAGE_DIR': os.path.join(workdir, 'captures'),
+        'USB_MOUNTS': usb_dir,
+    })
+    if staging_mb:
+        os.environ.update({'STAGING_DIR': os.path.join(workdir, 'staging'), 'STAGING_BUDGET_MB': str(staging_mb)})
+
+    import hardware_sim
+    if capture_latency is not None:
+        hardware_sim.CAPTURE_LATENCY = capture_latency
+    if jpeg_bytes is not None:
+        hardware_sim.JPEG_BYTES = jpeg_bytes
+    if blur_rate is not None:
+        hardware_sim.BLUR_RATE = blur_rate
+
+    import requests
+    from werkzeug.serving import make_server
+    import main
+    from cluster import CameraCluster, CameraNode
+    from scan_archive import read_index
+
+    app = main.create_app()
+    main.ensure_rig()
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    # node 0 is the real secondary Pi's cameras, extra nodes get 9, 10, ...
+    remotes = []
+    for n in range(nodes):
+        cameras = hardware_sim.REMOTE_CAMERAS if n == 0 else list(range(5 + 4 * n, 9 + 4 * n))
+        remotes.append(hardware_sim.StubRemotePi(f"{base_url}/upload", cameras=cameras).start())
+    main.camera_cluster.close()
+    main.camera_cluster = CameraCluster([
+        CameraNode(f"node{n}", {cam: {} for cam in remote.cameras},
+                   command_addr=None if http else remote.command_addr, http_url=remote.url)
+        for n, remote in enumerate(remotes)
+    ])
+
+    try:
+        start = time.perf_counter()
+        response = requests.post(f"{base_url}/rotate", json={
+            'step_counter_limit': steps * main.steps,
+            'folder_name': 'bench_scan',
+            'output_mode': output_mode,
+            'home': home,
+            **({'mode': 'continuous', 'angles': steps} if continuous else {}),
+        })
+        wall = time.perf_counter() - start
+        result = response.json()
+        if result.get('status') != 'success':
+            raise RuntimeError(f"scan failed: {result.get('message')}")
+
+        if result['archive']:
+            on_usb = read_index(result['archive']['path'])['images']
+        else:
+            on_usb = [f for f in os.listdir(result['scan_folder']) if f.endswith('.jpg')]
+        remote_times = [t for remote in remotes for t in remote.request_times]
+        return {
+            'steps': result['steps'],
+            'wall_s': round(wall, 3),
+            'seconds_per_step': result['seconds_per_step'],
+            'images_on_usb': len(on_usb),
+            'expected_images': result['steps'] * (1 if continuous else 4 + sum(len(remote.cameras) for remote in remotes)),
+            'mode': result.get('mode', 'still'),
+            'stages': result['timings'],
+            'output_mode': output_mode,
+            'nodes': nodes,
+            'remote_trigger': 'http' if http else 'command channel',
+            'node_latency': result['node_latency'],
+            'remote_errors': len(result['remote_errors']),
+            'usb_errors': len(result['usb_errors']),
+            'quality_retakes': len(result['quality_retakes']),
+            'remote_capture_mean_s': round(sum(remote_times) / len(remote_times), 3) if remote_times else 0,
+            'startup': dict(main.STARTUP),
+            'staging': result.get('staging'),
+            'home': result.get('home'),
+            'images_on_sd': len([f for f in os.listdir(main.IMAGE_DIR) if f.endswith('.jpg') and '_preview' not in f]),
+        }
+    finally:
+        main.camera_cluster.close()
+        for remote in remotes:
+            remote.stop()
+        server.shutdown()
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(report):
+    print(f"\nSteps:             {report['steps']}")
+    print(f"Wall time:         {report['wall_s']} s")
+    print(f"Seconds per step:  {report['seconds_per_step']} ({report['mode']})")
+    print(f"Images on USB:     {report['images_on_usb']} / {report['expected_images']} ({report['output_mode']}, "
+          f"{report['usb_errors']} USB errors)")
+    print(f"Quality retakes:   {report['quality_retakes']}")
+    print(f"Remote nodes:      {report['nodes']} via {report['remote_trigger']} ({report['remote_errors']} errors)")
+    print(f"Remote capture:    {report['remote_capture_mean_s']} s mean")
+    if report['staging']:
+        staged = report['staging']
+        print(f"RAM staging:       peak {staged['peak'] // 1024 // 1024} / {staged['budget'] // 1024 // 1024} MB, "
+              f"{staged['stalls']} stalls ({staged['stall_s']} s), {staged['spilled']} spilled")
+    print(f"Images on SD:      {report['images_on_sd']}")
+    if report['home']:
+        homed = report['home']
+        print(f"Homing:            {homed['seconds']} s ({homed['fast_steps']} fast, {homed['backoff_steps']} back, "
+              f"{homed['slow_steps']} slow steps)")
+    print(f"Startup:           app {report['startup'].get('app_ready_s')} s, rig {report['startup'].get('rig_ready_s')} s")
+    print("\nStage          count   mean_s    max_s  total_s")
+    for stage, t in report['stages'].items():
+        print(f"{stage:<14}{t['count']:>6}{t['mean_s']:>9}{t['max_s']:>9}{t['total_s']:>9}")
+    print("\nNode           count   mean_s    max_s  total_s")
+    for node, t in report['node_latency'].items():
+        print(f"{node:<14}{t['count']:>6}{t['mean_s']:>9}{t['max_s']:>9}{t['total_s']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--steps', type=int, default=8, help='carousel positions to scan')
+    parser.add_argument('--capture-latency', type=float, help='simulated seconds per shot')
+    parser.add_argument('--jpeg-bytes', type=int, help='simulated JPEG size')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary capture/USB folders')
+    parser.add_argument('--http', action='store_true', help='trigger the remote over HTTP instead of the command channel')
+    parser.add_argument('--blur-rate', type=float, help='fraction of simulated shots that come out blurred')
+    parser.add_argument('--nodes', type=int, default=1, help='stub capture nodes to run')
+    parser.add_argument('--output-mode', choices=['files', 'tar'], default='files', help='scan output written to USB')
+    parser.add_argument('--continuous', action='store_true',
+                        help='record one constant-speed turn and extract --steps angles instead of stopping at each')
+    parser.add_argument('--staging-mb', type=int, help='stage images in a RAM budget of this many MB instead of the SD card')
+    parser.add_argument('--no-home', action='store_true', help='scan from where the carousel stands instead of homing first')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.steps, args.capture_latency, args.jpeg_bytes, args.keep, args.http, args.nodes, args.blur_rate,
+                           args.output_mode, args.staging_mb, args.continuous, not args.no_home)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if report['images_on_usb'] < report['expected_images']:
+        sys.exit(f"Only {report['images_on_usb']} of {report['expected_images']} images reached USB")
@@ -3,9 +3,20 @@
 from flask import Flask, jsonify, request
 from datetime import datetime
 import os
+import sys
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import RPi.GPIO as gp  # Assuming you're using GPIO pins to control the multiplexer
 import requests
 
+# Share the capture engine with the main Pi's app
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+from camera_engine import CameraEngine, I2CMux, SECONDARY_PI_CHANNELS, make_backend
+from focus_calibration import apply_calibration, load_calibration
+from command_channel import CommandServer, DEFAULT_PORT
+
 app = Flask(__name__)
 
 # Setup GPIO
@@ -22,55 +33,110 @@ os.makedirs(CAPTURE_DIR, exist_ok=True)  # Ensure capture directory exists
 # Main Pi endpoint for image upload
 MAIN_PI_URL = "http://192.168.11.178:5002/upload"
 
+# Persistent command channel the main Pi triggers captures over
+COMMAND_PORT = DEFAULT_PORT
+command_server = None
+
+# `python capture.py` settings; the reloader parent only watches files
+DEBUG = True
+USE_RELOADER = True
+
+# ── upload settings ────────────────────────────────────────
+UPLOAD_RETRIES = 4           # attempts per file
+UPLOAD_BACKOFF = 0.5         # seconds, doubled after each failed attempt
+UPLOAD_TIMEOUT = (3, 30)     # connect / read seconds
+
+# One keep-alive connection to the main Pi, reused for every file
+upload_session = requests.Session()
+upload_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+# Single uploader thread: files go out in capture order while the
+# next camera is being shot
+upload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload")
+
+# ── per-camera lens / exposure presets ─────────────────────
+CAMERA_TUNING = {
+    2: {'lens_position': 5.0, 'shutter': 50000, 'gain': 3.0},
+    3: {'lens_position': 5.5, 'shutter': 50000, 'gain': 3.5},
+    4: {'lens_position': 5.5, 'shutter': 50000, 'gain': 3.5},
+    5: {'lens_position': 6.5, 'shutter': 50000, 'gain': 3.5},
+}
+
+# lens positions found by focus_calibration.py on this Pi; these win over
+# lens_position in presets sent by the main Pi
+FOCUS_CALIBRATION = load_calibration()
+CAMERA_TUNING = apply_calibration(CAMERA_TUNING, FOCUS_CALIBRATION)
+
+# Opened on the first capture and kept open between /capture requests
+camera_engine = CameraEngine(make_backend(), CAMERA_TUNING)
+atexit.register(camera_engine.close)
+
+camera_mux = I2CMux()
+
+# secondary Pi cameras in shooting order: (camera, label, mux channel, GPIO 7/11/12 levels)
+CAMERA_CHANNELS = SECONDARY_PI_CHANNELS
+
+# HTTP /capture and the command channel share the engine, mux and select
+# pins: one capture round at a time
+capture_lock = threading.Lock()
+
+def capture_and_upload(step=None, presets=None):
+    """
+    Shoot every camera and stream each file to the main Pi.
+    `presets` ({camera: preset}, from the main Pi's nodes.json) override
+    CAMERA_TUNING, except for calibrated lens positions.
+    Returns the structured result sent back over HTTP and the command channel.
+    """
+    presets = {int(cam): preset for cam, preset in (presets or {}).items()}
+    filenames = []
+    uploads = []
+
+    with capture_lock:
+        for cam, preset in apply_calibration(presets, FOCUS_CALIBRATION).items():
+            camera_engine.set_tuning(cam, preset)
+
+        for cam, label, channel, (pin7, pin11, pin12) in CAMERA_CHANNELS:
+            print(f'Start testing the camera {label}')
+            camera_mux.select(channel)
+            gp.output(7, pin7)
+            gp.output(11, pin11)
+            gp.output(12, pin12)
+            filename = capture(cam)
+            filenames.append(filename)
+            # stream it to the main Pi while the next camera shoots
+            uploads.append(upload_executor.submit(upload_image, filename))
+
+    # Answer only once every file is acknowledged (or has given up), so
+    # the main Pi's step sees all of them
+    uploaded = [f for f, future in zip(filenames, uploads) if future.result()]
+    failed = [f for f in filenames if f not in uploaded]
+
+    return {'status': 'success' if not failed else 'error', 'step': step,
+            'images': filenames, 'uploaded': uploaded, 'failed': failed}
+
 @app.route('/capture', methods=['POST'])
 def capture_images():
     try:
-        filenames = []
-
-        print('Start testing the camera E')
-        i2c = "i2cset -y 10 0x24 0x24 0x02"
-        os.system(i2c)
-        gp.output(7, False)
-        gp.output(11, False)
-        gp.output(12, True)
-        filename = capture(5)
-        filenames.append(filename)
-
-        print('Start testing the camera D') 
-        i2c = "i2cset -y 10 0x24 0x24 0x12"
-        os.system(i2c)
-        gp.output(7, True)
-        gp.output(11, False)
-        gp.output(12, True)
-        filename = capture(4)
-        filenames.append(filename)
-
-        print('Start testing the camera C')
-        i2c = "i2cset -y 10 0x24 0x24 0x22"
-        os.system(i2c)
-        gp.output(7, False)
-        gp.output(11, True)
-        gp.output(12, False)
-        filename = capture(3)
-        filenames.append(filename)
-
-        print('Start testing the camera B')
-        i2c = "i2cset -y 10 0x24 0x24 0x32"
-        os.system(i2c)
-        gp.output(7, True)
-        gp.output(11, True)
-        gp.output(12, False)
-        filename = capture(2)
-        filenames.append(filename)
-
-        # Transfer images after capturing
-        transfer_images()
-
-        return jsonify({'status': 'success', 'images': filenames})
-
+        args = request.get_json(silent=True) or {}
+        return jsonify(capture_and_upload(args.get('step'), args.get('presets')))
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+def handle_capture_command(args):
+    """'capture' over the command channel; exceptions become an error reply"""
+    return capture_and_upload(args.get('step'), args.get('presets'))
+
+def start_command_server():
+    """Serve the command channel; a port already taken (another worker has it) is left to its owner"""
+    global command_server
+    if command_server is not None:
+        return command_server
+    try:
+        command_server = CommandServer({'capture': handle_capture_command}, port=COMMAND_PORT).start()
+    except OSError as e:
+        print(f"Command channel not started on port {COMMAND_PORT}: {e}")
+    return command_server
+
 # def capture(cam):
 #     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 #     filename = f'capture_cam{cam}_{timestamp}.jpg'
@@ -96,71 +162,54 @@ def capture_images():
 
 def capture(cam: int) -> str:
     """
-    Take a quick JPEG using libcamera-still “immediate” mode.
-    Returns the filename (full path) that was written.
+    Take a JPEG through the long-lived capture engine.
+    Returns the filename that was written.
     """
-    ts   = datetime.now().strftime("%Y%m%d_%H%M%S")
-    name = f"cam{cam}_{ts}.jpg"
+    now  = datetime.now()
+    # to the millisecond: the main Pi can run a step in under a second
+    name = f"cam{cam}_{now:%Y%m%d_%H%M%S}_{now.microsecond // 1000:03d}.jpg"
     path = os.path.join(CAPTURE_DIR, name)
 
-    # ── base options ───────────────────────────────────────────
-    #  -t 1            run for 1 ms (needed because -t 0 disables stills)
-    #  --immediate     skip the 2 s preview + auto-tuning cycle
-    #  -n              no preview window
-    #  -q 85           jpeg quality
-    #  -r              *don’t* save a RAW alongside the JPEG
-    #  --mode 1920:1080:10  HD Bayer/binning mode → much lighter than 4656×3496
-    base = (
-        "libcamera-still -t 1 --immediate -n -q 85 "
-        "--mode 4656:3496:10 "
-    )
-
-    # ── per-camera lens / exposure presets ─────────────────────
-    per_cam = {
-        2: "--autofocus-mode manual --lens-position 5.0 --shutter 50000 --gain 3.0",
-        3: "--autofocus-mode manual --lens-position 5.5 --shutter 50000 --gain 3.5",
-        4: "--autofocus-mode manual --lens-position 5.5 --shutter 50000 --gain 3.5",
-        5: "--autofocus-mode manual --lens-position 6.5 --shutter 50000 --gain 3.5",
-    }[cam]
-
-    os.system(f"{base}{per_cam} -o {path}")
+    # sensor stays open in 4656x3496; only this camera's
+    # lens / shutter / gain from CAMERA_TUNING are pushed
+    camera_engine.capture(cam, path)
     return name            # caller keeps behaviour the same
 
 
-def transfer_images():
-    """Transfers images to the Main Pi and deletes them after successful upload."""
-    files = []
-    
-    # Gather all images
-    for filename in os.listdir(CAPTURE_DIR):
-        file_path = os.path.join(CAPTURE_DIR, filename)
-        if filename.endswith(".jpg"):
-            files.append(("images", open(file_path, "rb")))
-
-    if not files:
-        print("No images to transfer.")
-        return
-
-    try:
-        response = requests.post(MAIN_PI_URL, files=files)
-        if response.status_code == 200:
-            print("Images transferred successfully, deleting local copies...")
-            cleanup_local_images()
-        else:
-            print(f"Error transferring images: {response.status_code} - {response.text}")
-    except Exception as e:
-        print(f"Transfer failed: {e}")
-    finally:
-        for _, file in files:
-            file.close()  # Close file handles
-
-def cleanup_local_images():
-    """Deletes all images from the remote Pi after successful transfer."""
-    for filename in os.listdir(CAPTURE_DIR):
-        file_path = os.path.join(CAPTURE_DIR, filename)
-        if os.path.isfile(file_path):
-            os.remove(file_path)
-            print(f"Deleted: {file_path}")
+def upload_image(filename: str) -> bool:
+    """
+    Send one image to the Main Pi, retrying with backoff.
+    The local copy is deleted only after the Main Pi acknowledges that file.
+    """
+    path = os.path.join(CAPTURE_DIR, filename)
+    delay = UPLOAD_BACKOFF
+    for attempt in range(1, UPLOAD_RETRIES + 1):
+        try:
+            # raw body, streamed from disk; during a scan the main Pi writes
+            # it straight into the scan folder on its USB stick
+            with open(path, "rb") as f:
+                response = upload_session.put(f"{MAIN_PI_URL}/{filename}", data=f,
+                                              headers={"Content-Type": "image/jpeg"},
+                                              timeout=UPLOAD_TIMEOUT)
+            if response.status_code == 200 and filename in response.json().get("images", []):
+                os.remove(path)
+                print(f"Uploaded and deleted: {filename}")
+                return True
+            print(f"Upload of {filename} not acknowledged: {response.status_code} - {response.text}")
+        except Exception as e:
+            print(f"Upload of {filename} failed (attempt {attempt}/{UPLOAD_RETRIES}): {e}")
+        if attempt < UPLOAD_RETRIES:
+            time.sleep(delay)
+            delay *= 2
+    print(f"Giving up on {filename}; keeping local copy")
+    return False
 
 if __name__ == '__main__':
-    app.run(host='192.168.11.148', port=5002, debug=True)  # Allow external requests
+    # with the reloader this file runs twice (watching parent + serving
+    # child); only the child may own the command port
+    if not (DEBUG and USE_RELOADER) or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_command_server()
+    app.run(host='192.168.11.148', port=5002, debug=DEBUG, use_reloader=USE_RELOADER)  # Allow external requests
+else:
+    # imported by a WSGI server: nothing else will start it
+    start_command_server()
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+from hardware import HardwareArbiter, HardwareBusy
+from hardware_sim import FakeI2CMux
+from motion import FakeGPIO, StepperMotor
+
+
+@pytest.fixture
+def hardware():
+    gpio = FakeGPIO()
+    arbiter = HardwareArbiter(gpio, StepperMotor(gpio, 40, 38), FakeI2CMux(), 16)
+    yield arbiter
+    arbiter.close()
+
+
+def test_second_lease_is_refused(hardware):
+    with hardware.lease('step'):
+        with pytest.raises(HardwareBusy, match="step in progress"):
+            hardware.acquire('scan')
+    hardware.acquire('scan')
+    assert hardware.owner == 'scan'
+
+
+def test_acquire_waits_for_a_short_lease(hardware):
+    hardware.acquire('capture')
+    threading.Timer(0.3, hardware.release, ('capture',)).start()
+    started = time.monotonic()
+    hardware.acquire('scan', wait=5)
+    assert hardware.owner == 'scan'
+    assert 0.2 < time.monotonic() - started < 2
+
+
+def test_acquire_gives_up_after_waiting(hardware):
+    hardware.acquire('record')
+    started = time.monotonic()
+    with pytest.raises(HardwareBusy, match="record in progress"):
+        hardware.acquire('scan', wait=0.3)
+    assert time.monotonic() - started >= 0.3
+    assert hardware.owner == 'record'
+
+
+def test_acquire_stops_waiting_when_told(hardware):
+    hardware.acquire('reset')
+    stop = threading.Event()
+    threading.Timer(0.2, stop.set).start()
+    started = time.monotonic()
+    with pytest.raises(HardwareBusy):
+        hardware.acquire('scan', wait=30, should_stop=stop.is_set)
+    assert time.monotonic() - started < 2
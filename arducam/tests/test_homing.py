@@ -0,0 +1,61 @@
+import pytest
+
+import homing
+from hardware import HardwareArbiter
+from hardware_sim import FakeI2CMux, SimCarousel
+from motion import FakeGPIO, StepperMotor
+
+SENSOR_PIN = 15
+PULSE_PIN = 40
+DIRECTION_PIN = 38
+BUZZER_PIN = 16
+STEPS_PER_REV = 24000
+
+
+@pytest.fixture
+def rig():
+    def make(position, width=None):
+        gpio = FakeGPIO()
+        gpio.setup(SENSOR_PIN, gpio.IN)
+        carousel = SimCarousel(gpio, SENSOR_PIN, PULSE_PIN, DIRECTION_PIN, STEPS_PER_REV,
+                               position=position, width=width)
+        hardware = HardwareArbiter(gpio, StepperMotor(gpio, PULSE_PIN, DIRECTION_PIN), FakeI2CMux(), BUZZER_PIN)
+        made.append(hardware)
+        return hardware, carousel
+
+    made = []
+    yield make
+    for hardware in made:
+        hardware.close()
+
+
+@pytest.mark.parametrize('start', [300, 600, 20])
+def test_home_ends_at_the_same_place(rig, start):
+    hardware, carousel = rig(start)
+    report = homing.home(hardware, SENSOR_PIN)
+    # approaching in direction 1 (position decreasing), the edge is entering the flag
+    assert carousel.position == 39
+    assert report['position'] == 0
+    assert hardware.gpio.input(SENSOR_PIN)
+    assert SENSOR_PIN not in hardware.gpio._detect
+
+
+def test_home_from_on_the_sensor_skips_the_fast_approach(rig):
+    hardware, carousel = rig(20)
+    report = homing.home(hardware, SENSOR_PIN)
+    assert report['fast_steps'] == 0
+    assert report['backoff_steps'] > 0
+
+
+def test_home_without_a_sensor_fails(rig):
+    hardware, carousel = rig(300, width=0)
+    with pytest.raises(homing.HomingError, match="not seen"):
+        homing.home(hardware, SENSOR_PIN, max_search=200)
+    assert SENSOR_PIN not in hardware.gpio._detect
+
+
+def test_home_can_be_stopped(rig):
+    hardware, carousel = rig(300, width=0)
+    with pytest.raises(homing.HomingError, match="stopped"):
+        homing.home(hardware, SENSOR_PIN, should_stop=lambda: True)
+    assert SENSOR_PIN not in hardware.gpio._detect
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from motion import FakeGPIO, MotionProfile, StepperMotor, build_schedule
+
+PULSE_PIN = 40
+DIRECTION_PIN = 38
+
+
+def test_build_schedule_is_a_symmetric_trapezoid():
+    profile = MotionProfile(max_velocity=1500, acceleration=5000, start_velocity=400)
+    schedule = build_schedule(2000, profile)
+    assert len(schedule) == 2000
+    assert schedule[0] == pytest.approx(1 / 400)
+    assert schedule[-1] == pytest.approx(1 / 400)
+    assert min(schedule) == pytest.approx(1 / 1500)
+    assert schedule == schedule[::-1]
+    # accelerates monotonically up to cruise
+    assert all(a >= b for a, b in zip(schedule[:500], schedule[1:501]))
+
+
+def test_build_schedule_short_move_is_a_triangle():
+    profile = MotionProfile(max_velocity=1500, acceleration=5000, start_velocity=400)
+    schedule = build_schedule(20, profile)
+    assert min(schedule) > 1 / 1500
+    assert schedule == schedule[::-1]
+    assert schedule.index(min(schedule)) in (9, 10)
+
+
+def test_build_schedule_empty():
+    assert build_schedule(0, MotionProfile()) == []
+
+
+def test_profile_rejects_bad_limits():
+    with pytest.raises(ValueError):
+        MotionProfile(max_velocity=100, start_velocity=200)
+    with pytest.raises(ValueError):
+        MotionProfile(acceleration=0)
+
+
+def test_move_issues_every_pulse():
+    gpio = FakeGPIO()
+    motor = StepperMotor(gpio, PULSE_PIN, DIRECTION_PIN)
+    assert motor.move(50, 1) == 50
+    assert len(gpio.rising_edges(PULSE_PIN)) == 50
+    assert gpio.input(DIRECTION_PIN) == 1
+
+
+def test_move_ramps_down_when_stopped():
+    gpio = FakeGPIO()
+    profile = MotionProfile(max_velocity=1500, acceleration=5000, start_velocity=400)
+    motor = StepperMotor(gpio, PULSE_PIN, DIRECTION_PIN, profile)
+    steps = []
+    issued = motor.move(2000, 0, on_step=lambda: steps.append(1), should_stop=lambda: len(steps) >= 100)
+    assert 100 < issued < 2000
+    assert issued == len(steps) == len(gpio.rising_edges(PULSE_PIN))
+
+
+def test_jog_runs_until_stopped_then_ramps_down():
+    gpio = FakeGPIO()
+    profile = MotionProfile(max_velocity=1500, acceleration=5000, start_velocity=400)
+    motor = StepperMotor(gpio, PULSE_PIN, DIRECTION_PIN, profile)
+    steps = []
+    issued = motor.jog(0, lambda: len(steps) >= 60, on_step=lambda: steps.append(1))
+    ramp = profile.steps_to_stop(min(profile.velocity_after(60), profile.max_velocity))
+    assert ramp > 0
+    assert issued == 60 + ramp == len(steps)
+    assert len(gpio.rising_edges(PULSE_PIN)) == issued
+
+
+def test_jog_stopped_before_start_issues_nothing():
+    gpio = FakeGPIO()
+    motor = StepperMotor(gpio, PULSE_PIN, DIRECTION_PIN)
+    assert motor.jog(0, lambda: True) == 0
+    assert gpio.rising_edges(PULSE_PIN) == []
+
+
+def stall_at(step, seconds):
+    """on_step that blocks the motion thread once, as a busy CPU would"""
+    count = 0
+
+    def on_step():
+        nonlocal count
+        count += 1
+        if count == step:
+            time.sleep(seconds)
+    return on_step
+
+
+def test_late_wake_up_does_not_burst_pulses():
+    gpio = FakeGPIO()
+    profile = MotionProfile(max_velocity=1500, acceleration=5000, start_velocity=400)
+    motor = StepperMotor(gpio, PULSE_PIN, DIRECTION_PIN, profile)
+    assert motor.move(1000, 0, on_step=stall_at(300, 0.02)) == 1000
+    assert min(gpio.pulse_intervals(PULSE_PIN)) > 0.5 / profile.max_velocity
+
+
+def test_late_wake_up_in_jog_and_ramp_down_does_not_burst_pulses():
+    gpio = FakeGPIO()
+    profile = MotionProfile(max_velocity=1500, acceleration=5000, start_velocity=400)
+    motor = StepperMotor(gpio, PULSE_PIN, DIRECTION_PIN, profile)
+    stall = stall_at(150, 0.02)
+    steps = []
+
+    def on_step():
+        steps.append(1)
+        stall()
+    # the stall lands in the ramp-down that starts after 100 pulses
+    issued = motor.jog(0, lambda: len(steps) >= 100, on_step=on_step)
+    assert issued > 150
+    assert min(gpio.pulse_intervals(PULSE_PIN)) > 0.5 / profile.max_velocity
+
+
+def test_fake_gpio_event_history_is_bounded():
+    gpio = FakeGPIO(max_events=10)
+    for i in range(25):
+        gpio.output(PULSE_PIN, i % 2)
+    assert len(gpio.events) == 10
+    gpio.clear_events()
+    assert gpio.rising_edges(PULSE_PIN) == []
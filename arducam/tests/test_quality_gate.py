@@ -0,0 +1,102 @@
+import pytest
+
+from hardware_sim import synthetic_jpeg
+from quality_gate import MIN_HISTORY, MIN_SHARPNESS, QualityGate
+
+
+@pytest.fixture
+def frames(tmp_path):
+    sharp = tmp_path / 'sharp.jpg'
+    blurred = tmp_path / 'blurred.jpg'
+    sharp.write_bytes(synthetic_jpeg(0))
+    blurred.write_bytes(synthetic_jpeg(0, blurred=True))
+    return str(sharp), str(blurred)
+
+
+@pytest.fixture
+def gate():
+    gate = QualityGate(workers=1)
+    yield gate
+    gate.close()
+
+
+def test_sharp_frame_passes(gate, frames):
+    sharp, _ = frames
+    result = gate.check(1, sharp)
+    assert result['ok']
+    assert result['sharpness'] > MIN_SHARPNESS
+
+
+def test_blurred_first_frame_fails_on_the_floor(gate, frames):
+    _, blurred = frames
+    result = gate.check(1, blurred)
+    assert not result['ok']
+    assert result['reasons'] == ['blurred']
+
+
+def test_unreadable_frame_fails(gate, tmp_path):
+    path = tmp_path / 'broken.jpg'
+    path.write_bytes(b'not a jpeg')
+    assert gate.check(1, str(path))['reasons'] == ['unreadable']
+
+
+def test_history_takes_over_once_seeded(gate, frames):
+    sharp, _ = frames
+    for _ in range(MIN_HISTORY):
+        assert 'reference_sharpness' not in gate.check(1, sharp)
+    result = gate.check(1, sharp)
+    assert result['reference_sharpness'] == pytest.approx(result['sharpness'])
+    assert 'cam1' in gate.stats()['reference_sharpness']
+    # other cameras keep their own history
+    assert 'reference_sharpness' not in gate.check(2, sharp)
+
+
+def test_calibrated_reference_is_a_hint_the_history_replaces(frames):
+    sharp, _ = frames
+    # a calibration target far sharper than anything the scan subject reaches
+    gate = QualityGate(workers=1, references={1: 1000.0})
+    try:
+        first = gate.check(1, sharp)
+        assert first['reference_sharpness'] == 1000.0
+        assert first['reasons'] == ['blurred']
+        results = [gate.check(1, sharp) for _ in range(MIN_HISTORY + 5)]
+    finally:
+        gate.close()
+    assert results[-1]['ok']
+    assert results[-1]['reference_sharpness'] == pytest.approx(first['sharpness'])
+    assert 'cam1' in gate.stats()['reference_sharpness']
+
+
+def test_calibrated_reference_catches_a_soft_first_frame(frames):
+    sharp, _ = frames
+    gate = QualityGate(workers=1)
+    try:
+        score = gate.check(1, sharp)['sharpness']
+    finally:
+        gate.close()
+    gate = QualityGate(workers=1, references={1: score * 1.5})
+    try:
+        assert gate.check(1, sharp)['ok']
+    finally:
+        gate.close()
+    gate = QualityGate(workers=1, references={1: score * 2.5})
+    try:
+        assert gate.check(1, sharp)['reasons'] == ['blurred']
+    finally:
+        gate.close()
+
+
+def test_blurred_frames_do_not_seed_the_history(gate, frames):
+    sharp, blurred = frames
+    for _ in range(MIN_HISTORY + 2):
+        assert not gate.check(1, blurred)['ok']
+    assert gate.stats()['reference_sharpness'] == {}
+    assert 'reference_sharpness' not in gate.check(1, sharp)
+
+
+def test_floor_only_frames_are_seeded_relative_to_the_best(gate):
+    gate._seed_locked(1, 20.0)
+    gate._seed_locked(1, 20.0)
+    assert not gate._history[1]
+    gate._seed_locked(1, 100.0)
+    assert list(gate._history[1]) == [100.0]
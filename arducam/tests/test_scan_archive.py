@@ -0,0 +1,60 @@
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from scan_archive import INDEX_NAME, ScanArchive, read_index
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"cam{i + 1}_20261018_120000_000.jpg"
+        path.write_bytes(bytes([i]) * (700 + i))
+        paths.append(str(path))
+    return paths
+
+
+def test_steps_and_index_round_trip(tmp_path, images):
+    archive = ScanArchive(str(tmp_path / 'scan.tar'), 'scan')
+    archive.add_step(0, images[:2])
+    archive.add_step(1, images[2:])
+    archive.close()
+    archive.close()
+    index = read_index(archive.path)
+    assert index['scan'] == 'scan'
+    assert [(e['name'], e['step']) for e in index['images']] == \
+        [(os.path.basename(p), s) for p, s in zip(images, [0, 0, 1])]
+    # each offset points straight at the image data
+    with open(archive.path, 'rb') as f:
+        for entry, path in zip(index['images'], images):
+            f.seek(entry['offset'])
+            assert f.read(entry['size']) == Path(path).read_bytes()
+    with tarfile.open(archive.path) as tar:
+        assert tar.getnames()[-1] == INDEX_NAME
+    with pytest.raises(ValueError):
+        archive.add_step(2, images)
+
+
+def test_existing_archive_is_never_overwritten(tmp_path, images):
+    path = str(tmp_path / 'scan.tar')
+    first = ScanArchive(path, 'scan')
+    first.add_step(0, images)
+    first.close()
+    with pytest.raises(FileExistsError):
+        ScanArchive(path, 'scan')
+    assert len(read_index(path)['images']) == 3
+
+
+def test_reused_folder_name_gets_a_suffix(tmp_path, images):
+    first = ScanArchive.for_scan(str(tmp_path), 'scan')
+    first.add_step(0, images)
+    first.close()
+    second = ScanArchive.for_scan(str(tmp_path), 'scan')
+    second.close()
+    assert os.path.basename(first.path) == 'scan.tar'
+    assert os.path.basename(second.path) == 'scan_2.tar'
+    assert len(read_index(first.path)['images']) == 3
+    assert read_index(second.path)['images'] == []
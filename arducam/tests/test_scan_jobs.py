@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+from scan_jobs import CANCELLED, DONE, FAILED, FINISHING, RUNNING, ScanJobQueue
+
+
+class Runner:
+    """run() that blocks until let through, with a finish() that does the same"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.capture = threading.Event()
+        self.finishing = threading.Event()
+        self.finish = threading.Event()
+
+    def __call__(self, job):
+        self.started.set()
+        while not self.capture.wait(0.01):
+            if job.cancel_requested:
+                break
+
+        def finish():
+            self.finishing.set()
+            self.finish.wait(5)
+            return {'steps': job.params.get('steps')}
+        return finish
+
+
+@pytest.fixture
+def runner():
+    return Runner()
+
+
+@pytest.fixture
+def jobs(runner):
+    queue = ScanJobQueue(runner)
+    yield queue
+    runner.capture.set()
+    runner.finish.set()
+    queue.close(5)
+
+
+def test_cancel_unknown_job(jobs):
+    assert jobs.cancel('nope') is None
+
+
+def test_cancel_queued_job(jobs, runner):
+    first = jobs.submit({'steps': 1})
+    assert runner.started.wait(5)
+    second = jobs.submit({'steps': 2})
+    assert jobs.position(second) == 0
+    assert jobs.cancel(second.id) is second
+    assert second.state == CANCELLED
+    assert second.result is None
+    assert second.wait(0)
+    assert jobs.position(second) is None
+    runner.capture.set()
+    runner.finish.set()
+    assert first.wait(5)
+    assert first.state == DONE
+
+
+def test_cancel_running_job_stops_it(jobs, runner):
+    job = jobs.submit({'steps': 3})
+    assert runner.started.wait(5)
+    assert job.state == RUNNING
+    jobs.cancel(job.id)
+    assert job.cancel_requested
+    runner.finish.set()
+    assert job.wait(5)
+    assert job.state == CANCELLED
+    assert job.result == {'steps': 3}
+
+
+def test_cancel_while_finishing_is_ignored(jobs, runner):
+    job = jobs.submit({'steps': 4})
+    runner.capture.set()
+    assert runner.finishing.wait(5)
+    assert job.state == FINISHING
+    jobs.cancel(job.id)
+    assert not job.cancel_requested
+    runner.finish.set()
+    assert job.wait(5)
+    assert job.state == DONE
+
+
+def test_cancel_finished_job_is_a_no_op(jobs, runner):
+    runner.capture.set()
+    runner.finish.set()
+    job = jobs.submit({'steps': 5})
+    assert job.wait(5)
+    assert jobs.cancel(job.id).state == DONE
+    assert not jobs.busy()
+
+
+def test_failure_after_a_cancel_ends_cancelled():
+    started = threading.Event()
+
+    def run(job):
+        # e.g. still waiting for the hardware lease when cancelled
+        started.set()
+        while not job.cancel_requested:
+            time.sleep(0.01)
+        raise RuntimeError("scan in progress")
+
+    queue = ScanJobQueue(run)
+    try:
+        job = queue.submit({})
+        assert started.wait(5)
+        queue.cancel(job.id)
+        assert job.wait(5)
+        assert job.state == CANCELLED
+        assert job.result is None
+    finally:
+        queue.close(5)
+
+
+def test_failure_without_a_cancel_ends_failed():
+    def run(job):
+        raise RuntimeError("USB setup failed")
+
+    queue = ScanJobQueue(run)
+    try:
+        job = queue.submit({})
+        assert job.wait(5)
+        assert job.state == FAILED
+        assert job.error == "USB setup failed"
+    finally:
+        queue.close(5)
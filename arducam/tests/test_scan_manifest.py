@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from scan_manifest import ScanManifest, copy_entry, file_hash, reconcile
+
+
+@pytest.fixture
+def scan(tmp_path):
+    """A manifest of three images on the Pi, all copied to the stick"""
+    source_dir = tmp_path / 'pi'
+    stick = tmp_path / 'stick'
+    source_dir.mkdir()
+    stick.mkdir()
+    manifest = ScanManifest.for_scan(str(tmp_path / 'manifests'), 'scan1')
+    for i, name in enumerate(['a.jpg', 'b.jpg', 'c.jpg']):
+        src = source_dir / name
+        src.write_bytes(bytes([i + 1]) * (1000 * (i + 1)))
+        st = os.stat(src)
+        manifest.record(name, st.st_size, st.st_mtime, file_hash(str(src)), str(src), step=i)
+        copy_entry(manifest, name, str(stick))
+    manifest.save()
+    return manifest, str(stick), str(source_dir)
+
+
+def test_unchanged_copies_are_trusted(scan):
+    manifest, stick, _ = scan
+    report = reconcile(manifest, stick)
+    assert report['checked'] == 3
+    assert report['trusted'] == 3
+    assert report['hashed'] == 0
+    assert report['copied'] == report['recopied'] == []
+    assert report['bytes'] == 0
+
+
+def test_missing_and_corrupt_copies_are_repaired(scan):
+    manifest, stick, _ = scan
+    os.remove(os.path.join(stick, 'a.jpg'))
+    with open(os.path.join(stick, 'b.jpg'), 'r+b') as f:
+        f.write(b'\xff' * 10)
+    with open(os.path.join(stick, 'c.jpg.part'), 'wb') as f:
+        f.write(b'half')
+
+    report = reconcile(manifest, stick)
+    assert report['copied'] == ['a.jpg']
+    assert report['recopied'] == ['b.jpg']
+    assert report['bytes'] == 1000 + 2000
+    assert report['trusted'] == 1
+    assert not os.path.exists(os.path.join(stick, 'c.jpg.part'))
+    for name in ('a.jpg', 'b.jpg'):
+        assert file_hash(os.path.join(stick, name)) == manifest.entries[name]['hash']
+    # and a second pass trusts everything again
+    assert reconcile(manifest, stick)['trusted'] == 3
+
+
+def test_verify_hashes_every_copy(scan):
+    manifest, stick, _ = scan
+    report = reconcile(manifest, stick, verify=True)
+    assert report['trusted'] == 0
+    assert report['hashed'] == 3
+    assert report['recopied'] == []
+
+
+def test_lost_file_without_a_source_is_unrecoverable(scan):
+    manifest, stick, source_dir = scan
+    os.remove(os.path.join(stick, 'c.jpg'))
+    os.remove(os.path.join(source_dir, 'c.jpg'))
+    report = reconcile(manifest, stick)
+    assert report['unrecoverable'] == ['c.jpg']
+    assert report['copied'] == []
+
+
+def test_manifest_round_trips(scan):
+    manifest, _, _ = scan
+    loaded = ScanManifest(manifest.path, 'scan1')
+    assert loaded.entries == manifest.to_dict()['files']
+    assert loaded.pending() == []
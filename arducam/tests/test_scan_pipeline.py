@@ -0,0 +1,64 @@
+import random
+import threading
+import time
+
+from scan_pipeline import ScanPipeline
+
+
+def test_steps_leave_every_stage_in_order():
+    seen = {'usb': [], 'post': []}
+
+    def stage(name):
+        def run(step, item):
+            time.sleep(random.uniform(0, 0.005))
+            seen[name].append(step)
+            return item
+        return run
+
+    pipeline = ScanPipeline([('usb', stage('usb')), ('post', stage('post'))])
+    for step in range(20):
+        pipeline.submit(step, [f"cam1_{step}.jpg"])
+    pipeline.close(5)
+    assert seen['usb'] == seen['post'] == list(range(20))
+    assert pipeline.completed == list(range(20))
+    assert pipeline.timer.summary()['usb']['count'] == 20
+
+
+def test_full_queue_blocks_the_producer():
+    gate = threading.Event()
+    pipeline = ScanPipeline([('usb', lambda step, item: gate.wait(5))], maxsize=1)
+    submitted = []
+
+    def produce():
+        for step in range(4):
+            pipeline.submit(step, None)
+            submitted.append(step)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    time.sleep(0.2)
+    # one step in the stage, one in the queue, the third submit waits
+    assert producer.is_alive()
+    assert submitted == [0, 1]
+    gate.set()
+    producer.join(5)
+    assert submitted == [0, 1, 2, 3]
+    pipeline.close(5)
+    assert pipeline.completed == [0, 1, 2, 3]
+
+
+def test_stage_errors_come_back_to_the_scan_loop():
+    def usb(step, item):
+        if step == 1:
+            raise OSError("USB path no longer exists")
+        return item
+
+    pipeline = ScanPipeline([('usb', usb)])
+    for step in range(3):
+        pipeline.submit(step, None)
+    pipeline.close(5)
+    errors = pipeline.take_errors()
+    assert errors == [{'stage': 'usb', 'step': 1, 'message': "USB path no longer exists"}]
+    # reported once, and later steps still went through
+    assert pipeline.take_errors() == []
+    assert pipeline.completed == [0, 1, 2]
@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+
+import pytest
+
+from staging import StagingRing
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    return str(tmp_path / 'staging'), str(tmp_path / 'spill')
+
+
+def stage(ring, name, nbytes):
+    assert ring.claim(nbytes)
+    with open(ring.path(name), 'wb') as f:
+        f.write(b'\0' * nbytes)
+    return ring.add(name, claimed=nbytes)
+
+
+def test_claim_respects_the_budget(dirs):
+    ring = StagingRing(dirs[0], 1000, dirs[1])
+    assert ring.claim(600)
+    assert not ring.claim(600)
+    ring.unclaim(600)
+    assert ring.claim(600)
+
+
+def test_add_and_release_account_for_the_file(dirs):
+    ring = StagingRing(dirs[0], 1000, dirs[1])
+    assert stage(ring, 'a.jpg', 300) == 300
+    assert 'a.jpg' in ring
+    assert ring.locate('a.jpg') == ring.path('a.jpg')
+    assert ring.stats()['used'] == 300
+    ring.release('a.jpg')
+    assert 'a.jpg' not in ring
+    assert ring.locate('a.jpg') is None
+    assert ring.stats()['used'] == 0
+    assert not os.path.exists(ring.path('a.jpg'))
+    assert ring.image_estimate() == 300
+
+
+def test_reserve_waits_for_a_release(dirs):
+    ring = StagingRing(dirs[0], 1000, dirs[1])
+    stage(ring, 'a.jpg', 800)
+    threading.Timer(0.2, ring.release, ('a.jpg',)).start()
+    started = time.perf_counter()
+    assert ring.reserve(500)
+    assert time.perf_counter() - started >= 0.15
+    assert ring.stats()['stalls'] == 1
+    assert ring.stats()['reserved'] == 500
+
+
+def test_reserve_gives_up_when_stopped(dirs):
+    ring = StagingRing(dirs[0], 1000, dirs[1])
+    stage(ring, 'a.jpg', 800)
+    assert not ring.reserve(500, should_stop=lambda: True)
+
+
+def test_empty_ring_admits_more_than_the_budget(dirs):
+    ring = StagingRing(dirs[0], 100, dirs[1])
+    assert ring.reserve(500)
+
+
+def test_spill_moves_files_out(dirs):
+    root, spill_dir = dirs
+    ring = StagingRing(root, 1000, spill_dir)
+    stage(ring, 'a.jpg', 100)
+    stage(ring, 'b.jpg', 100)
+    assert ring.spill(['b.jpg', 'missing.jpg']) == ['b.jpg']
+    assert os.path.exists(os.path.join(spill_dir, 'b.jpg'))
+    ring.close()
+    assert sorted(os.listdir(spill_dir)) == ['a.jpg', 'b.jpg']
+    assert ring.stats()['used'] == 0
+    assert ring.stats()['spilled'] == 2
+
+
+def test_leftovers_are_spilled_on_start(dirs):
+    root, spill_dir = dirs
+    os.makedirs(root)
+    with open(os.path.join(root, 'old.jpg'), 'wb') as f:
+        f.write(b'\0' * 10)
+    ring = StagingRing(root, 1000, spill_dir)
+    assert os.listdir(spill_dir) == ['old.jpg']
+    assert ring.stats()['files'] == 0